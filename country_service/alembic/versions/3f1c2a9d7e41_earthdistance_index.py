@@ -0,0 +1,45 @@
+"""earthdistance GiST index for countriesNear
+
+Revision ID: 3f1c2a9d7e41
+Revises: b06f92d22c23
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '3f1c2a9d7e41'
+down_revision: Union[str, Sequence[str], None] = 'b06f92d22c23'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or not sa.inspect(bind).has_table('countries'):
+        return
+    # the extensions need elevated privileges; without them countriesNear keeps
+    # using the bounding-box prefilter on the latitude/longitude b-tree indexes
+    savepoint = bind.begin_nested()
+    try:
+        op.execute("CREATE EXTENSION IF NOT EXISTS cube")
+        op.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+    except sa.exc.DBAPIError:
+        savepoint.rollback()
+        return
+    savepoint.commit()
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_countries_ll_to_earth "
+        "ON countries USING gist (ll_to_earth(latitude, longitude))"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_countries_ll_to_earth")
@@ -0,0 +1,75 @@
+"""normalized country names for indexed lookup and search
+
+Revision ID: 5a9e3c7b1d08
+Revises: 8d4b6e0a5c12
+Create Date: 2026-10-18 11:27:05.660419
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# env.py puts the service directory on sys.path
+from models import normalize_name
+
+
+revision: str = '5a9e3c7b1d08'
+down_revision: Union[str, Sequence[str], None] = '8d4b6e0a5c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 1000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('countries'):
+        return
+    columns = {c['name'] for c in inspector.get_columns('countries')}
+    indexes = {i['name'] for i in inspector.get_indexes('countries')}
+    if 'name_normalized' not in columns:
+        op.add_column('countries', sa.Column('name_normalized', sa.String(), nullable=True))
+
+    # accent stripping has to match models.normalize_name exactly, so backfill from Python
+    countries = sa.table('countries', sa.column('id'), sa.column('name'), sa.column('name_normalized'))
+    rows = bind.execute(sa.select(countries.c.id, countries.c.name).where(countries.c.name_normalized.is_(None))).fetchall()
+    for start in range(0, len(rows), BACKFILL_BATCH):
+        bind.execute(
+            countries.update().where(countries.c.id == sa.bindparam('row_id')).values(name_normalized=sa.bindparam('normalized')),
+            [{'row_id': r.id, 'normalized': normalize_name(r.name)} for r in rows[start:start + BACKFILL_BATCH]],
+        )
+
+    if 'ix_countries_name_normalized' not in indexes:
+        op.create_index('ix_countries_name_normalized', 'countries', ['name_normalized'])
+
+    if bind.dialect.name != 'postgresql':
+        return
+    # LIKE 'abc%' can only use a b-tree built with pattern ops under non-C collations
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_countries_name_normalized_pattern "
+        "ON countries (name_normalized varchar_pattern_ops)"
+    )
+    savepoint = bind.begin_nested()
+    try:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except sa.exc.DBAPIError:
+        # fuzzy search then falls back to substring matching
+        savepoint.rollback()
+        return
+    savepoint.commit()
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_countries_name_normalized_trgm "
+        "ON countries USING gin (name_normalized gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_countries_name_normalized_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_countries_name_normalized_pattern")
+    op.drop_index('ix_countries_name_normalized', table_name='countries')
+    op.drop_column('countries', 'name_normalized')
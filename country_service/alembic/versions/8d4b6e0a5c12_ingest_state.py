@@ -0,0 +1,38 @@
+"""ingest_state table for conditional fetches
+
+Revision ID: 8d4b6e0a5c12
+Revises: 3f1c2a9d7e41
+Create Date: 2026-10-18 10:03:51.402771
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '8d4b6e0a5c12'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the API's init_db() may already have created it
+    if sa.inspect(op.get_bind()).has_table('ingest_state'):
+        return
+    op.create_table(
+        'ingest_state',
+        sa.Column('source_url', sa.String(), primary_key=True),
+        sa.Column('etag', sa.String()),
+        sa.Column('last_modified', sa.String()),
+        sa.Column('content_hash', sa.String(64)),
+        sa.Column('checked_at', sa.DateTime(timezone=True)),
+        sa.Column('changed_at', sa.DateTime(timezone=True)),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ingest_state')
@@ -0,0 +1,74 @@
+"""change_seq/content_hash on countries, change counter and tombstones for delta sync
+
+Revision ID: a5d1e8c4b7f3
+Revises: f7c3a9e1d4b2
+Create Date: 2026-10-18 16:40:33.815260
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# env.py puts the service directory on sys.path
+import changes
+from models import GUID, TOMBSTONE_DDL
+
+
+revision: str = 'a5d1e8c4b7f3'
+down_revision: Union[str, Sequence[str], None] = 'f7c3a9e1d4b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('countries'):
+        return
+    columns = {c['name'] for c in inspector.get_columns('countries')}
+    if 'change_seq' not in columns:
+        op.add_column('countries', sa.Column('change_seq', sa.BigInteger(), nullable=True))
+    if 'content_hash' not in columns:
+        op.add_column('countries', sa.Column('content_hash', sa.String(64), nullable=True))
+    if 'ix_countries_change_seq' not in {i['name'] for i in inspector.get_indexes('countries')}:
+        op.create_index('ix_countries_change_seq', 'countries', ['change_seq'])
+
+    # the API's init_db() may already have created them
+    if not inspector.has_table('change_counter'):
+        op.create_table(
+            'change_counter',
+            sa.Column('name', sa.String(), primary_key=True),
+            sa.Column('value', sa.BigInteger(), nullable=False),
+        )
+    if not inspector.has_table('country_tombstones'):
+        op.create_table(
+            'country_tombstones',
+            sa.Column('id', GUID(), primary_key=True),
+            sa.Column('alpha2_code', sa.String(2)),
+            sa.Column('name', sa.String()),
+            sa.Column('change_seq', sa.BigInteger(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_country_tombstones_change_seq', 'country_tombstones', ['change_seq'])
+    for statement in TOMBSTONE_DDL.get(bind.dialect.name, []):
+        op.execute(statement)
+
+    # every existing row gets a hash and a sequence number, so the first full sync sees it
+    changes.stamp(Session(bind=bind))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS countries_tombstone ON countries")
+        op.execute("DROP FUNCTION IF EXISTS countries_tombstone()")
+    else:
+        op.execute("DROP TRIGGER IF EXISTS countries_tombstone")
+    op.drop_table('country_tombstones')
+    op.drop_table('change_counter')
+    op.drop_index('ix_countries_change_seq', table_name='countries')
+    op.drop_column('countries', 'content_hash')
+    op.drop_column('countries', 'change_seq')
@@ -0,0 +1,44 @@
+"""outbox_events table for transactional event publishing
+
+Revision ID: c4e7a1f9b2d6
+Revises: 5a9e3c7b1d08
+Create Date: 2026-10-18 12:14:37.208815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c4e7a1f9b2d6'
+down_revision: Union[str, Sequence[str], None] = '5a9e3c7b1d08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the API's init_db() may already have created it
+    if sa.inspect(op.get_bind()).has_table('outbox_events'):
+        return
+    op.create_table(
+        'outbox_events',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), primary_key=True, autoincrement=True),
+        sa.Column('event', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('sent_at', sa.DateTime(timezone=True)),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.String()),
+    )
+    op.create_index(
+        'ix_outbox_events_unsent', 'outbox_events', ['id'],
+        postgresql_where=sa.text('sent_at IS NULL'), sqlite_where=sa.text('sent_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_outbox_events_unsent', table_name='outbox_events')
+    op.drop_table('outbox_events')
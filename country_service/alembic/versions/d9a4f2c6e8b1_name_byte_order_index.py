@@ -0,0 +1,34 @@
+"""Index countries by (name COLLATE "C", id) for snapshot-consistent ordering
+
+Revision ID: d9a4f2c6e8b1
+Revises: a5d1e8c4b7f3
+Create Date: 2026-10-18 19:02:41.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from models import NAME_ORDER_INDEX_DDL
+
+
+revision: str = 'd9a4f2c6e8b1'
+down_revision: Union[str, Sequence[str], None] = 'a5d1e8c4b7f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # SQLite compares names with BINARY already, which the existing name index serves
+    if bind.dialect.name != 'postgresql' or not sa.inspect(bind).has_table('countries'):
+        return
+    op.execute(NAME_ORDER_INDEX_DDL)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_countries_name_c_id")
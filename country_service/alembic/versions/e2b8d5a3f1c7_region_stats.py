@@ -0,0 +1,51 @@
+"""region_stats summary table and the (region, subregion) index behind it
+
+Revision ID: e2b8d5a3f1c7
+Revises: c4e7a1f9b2d6
+Create Date: 2026-10-18 14:02:51.390417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# env.py puts the service directory on sys.path
+import region_stats
+
+
+revision: str = 'e2b8d5a3f1c7'
+down_revision: Union[str, Sequence[str], None] = 'c4e7a1f9b2d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('countries'):
+        return
+    if 'ix_countries_region_subregion' not in {i['name'] for i in inspector.get_indexes('countries')}:
+        op.create_index('ix_countries_region_subregion', 'countries', ['region', 'subregion'])
+    # the API's init_db() may already have created it
+    if not inspector.has_table('region_stats'):
+        op.create_table(
+            'region_stats',
+            sa.Column('region', sa.String(), primary_key=True),
+            sa.Column('subregion', sa.String(), primary_key=True),
+            sa.Column('country_count', sa.Integer(), nullable=False),
+            sa.Column('population', sa.BigInteger(), nullable=False),
+            sa.Column('area_km2', sa.Float(), nullable=False),
+            sa.Column('top_countries', sa.JSON(), nullable=False),
+            sa.Column('refreshed_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+    # one full build; from here on writers refresh the groups they touch
+    region_stats.refresh(Session(bind=bind))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('region_stats')
+    op.drop_index('ix_countries_region_subregion', table_name='countries')
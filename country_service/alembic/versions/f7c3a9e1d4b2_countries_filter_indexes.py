@@ -0,0 +1,48 @@
+"""JSONB filter columns with GIN indexes, subregion and population indexes
+
+Revision ID: f7c3a9e1d4b2
+Revises: e2b8d5a3f1c7
+Create Date: 2026-10-18 15:21:09.604822
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f7c3a9e1d4b2'
+down_revision: Union[str, Sequence[str], None] = 'e2b8d5a3f1c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+JSON_COLUMNS = ('timezones', 'currencies', 'languages')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('countries'):
+        return
+    indexes = {i['name'] for i in inspector.get_indexes('countries')}
+    for column in ('subregion', 'population'):
+        if f'ix_countries_{column}' not in indexes:
+            op.create_index(f'ix_countries_{column}', 'countries', [column])
+
+    if bind.dialect.name != 'postgresql':
+        return
+    for column in JSON_COLUMNS:
+        # json cannot be indexed at all; jsonb_ops GIN serves both @> and ?
+        op.execute(f"ALTER TABLE countries ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_countries_{column}_gin ON countries USING gin ({column})")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in JSON_COLUMNS:
+            op.execute(f"DROP INDEX IF EXISTS ix_countries_{column}_gin")
+            op.execute(f"ALTER TABLE countries ALTER COLUMN {column} TYPE json USING {column}::json")
+    op.drop_index('ix_countries_population', table_name='countries')
+    op.drop_index('ix_countries_subregion', table_name='countries')
@@ -1,9 +1,13 @@
 import os
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from flask_graphql import GraphQLView
+from graphql_view import CountryGraphQLView, CachedDocumentBackend, PersistedQueryStore
 from schema import schema
-from database import init_db, SessionLocal
+from database import init_db, SessionLocal, engine
+import cache
+import export
+import metrics
+import profiling
 
 app = Flask(__name__)
 CORS(app)
@@ -11,16 +15,37 @@ CORS(app)
 # initialize DB (no-op if already created by alembic)
 init_db()
 
+# keep this worker's country snapshot in sync with writes from other processes
+cache.start_invalidation_listener()
+
+# SQL statement/pool metrics for everything this process runs
+metrics.instrument_engine(engine)
+# per-request SQL capture, only recorded while a request is being profiled
+profiling.instrument_engine(engine)
+
+@app.before_request
+def count_statements():
+    g.metrics_token = metrics.start_request()
+
+@app.teardown_request
+def observe_statements(exception=None):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        metrics.finish_request(token)
+
 @app.teardown_appcontext
 def shutdown_session(exception=None):
     SessionLocal.remove()
 
 app.add_url_rule(
     '/graphql',
-    view_func=GraphQLView.as_view(
+    view_func=CountryGraphQLView.as_view(
         'graphql',
         schema=schema,
-        graphiql=True
+        graphiql=True,
+        backend=CachedDocumentBackend(),
+        persisted_queries=PersistedQueryStore(),
+        middleware=metrics.resolver_middleware(),
     )
 )
 
@@ -28,5 +53,19 @@ app.add_url_rule(
 def health():
     return jsonify({'status': 'ok'})
 
+@app.route('/export')
+def export_countries():
+    """Stream the whole countries table; ?format=ndjson|csv|arrow|parquet."""
+    try:
+        chunks, headers = export.prepare(engine, request.args.get('format'), request.headers.get('Accept-Encoding'))
+    except export.ExportError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    return Response(chunks, headers=headers)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000)
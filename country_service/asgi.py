@@ -0,0 +1,307 @@
+"""
+ASGI entry point for the country GraphQL API.
+
+Serves the same `schema` as app.py with the same `/graphql` and `/health`
+contracts (including persisted queries and the validated-document cache), but
+on an asyncio event loop:
+
+- queries are executed with graphql-core's AsyncioExecutor against a country
+  snapshot that is loaded through an async engine (asyncpg / aiosqlite) and kept
+  fresh by an asyncio Redis listener, so they never wait on a socket;
+- anything that still needs the synchronous SQLAlchemy session (mutations, or
+  reads while no trustworthy snapshot is available) runs in a bounded thread
+  pool, so one slow query no longer holds up every other request.
+
+The `/graphql` WebSocket route serves `countryAdded` / `countryUpdated`
+subscriptions over the graphql-ws protocol (see subscriptions.py).
+
+Run with `uvicorn asgi:app --host 0.0.0.0 --port 8000`.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import redis.asyncio as aioredis
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from graphql.execution import ExecutionResult
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from graphql.language import ast
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql_server import HttpQueryError, encode_execution_results, json_encode, load_json_body
+from promise import is_thenable
+
+import cache
+import export
+from database import SessionLocal, create_async_db_engine, engine as sync_engine, init_db
+from graphql_view import GRAPHQL_GET_MAX_AGE, CachedDocumentBackend, PersistedQueryStore, resolve_persisted_query
+from schema import DB_ONLY_FIELDS, schema
+import metrics
+import profiling
+import subscriptions
+
+logger = logging.getLogger("country_asgi")
+
+# worker threads for requests that need the synchronous DB session
+DB_THREADS = int(os.getenv('ASGI_DB_THREADS', '8'))
+
+
+class SnapshotKeeper:
+    """Loads the country snapshot over the async engine and listens for invalidations.
+
+    Registered as the cache's listener, so the sync code paths in the same
+    process see the same `.connected` state the thread-based listener reports.
+    """
+
+    def __init__(self, engine, url=cache.REDIS_URL, channel=cache.INVALIDATION_CHANNEL, retry_delay=2.0):
+        self.engine = engine
+        self.url = url
+        self.channel = channel
+        self.retry_delay = retry_delay
+        self.connected = False
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def snapshot(self):
+        """A fresh, trustworthy snapshot, or None if reads must go to the DB."""
+        if not cache.CACHE_ENABLED or not cache.is_listening():
+            return None
+        snap = cache.peek()
+        if snap is not None:
+            return snap
+        async with self._lock:
+            snap = cache.peek()
+            if snap is None:
+                generation = cache.begin_load()
+                try:
+                    snap = cache.install(await cache.load_snapshot_async(self.engine), generation)
+                except Exception:
+                    logger.exception("Failed to load country snapshot; falling back to DB")
+                    return None
+        return snap
+
+    def start(self):
+        if cache.CACHE_ENABLED and self._task is None:
+            cache.register_listener(self)
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            client = aioredis.from_url(self.url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # anything committed while we were disconnected is unknown to us
+                cache.invalidate()
+                self.connected = True
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        cache.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Country cache listener disconnected; retrying in %ss", self.retry_delay, exc_info=True)
+            finally:
+                self.connected = False
+                try:
+                    await pubsub.close()
+                    await client.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.retry_delay)
+
+
+def root_fields(document_ast, operation_name=None):
+    """Names of the root fields an operation selects, looking through fragments."""
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None:
+        return set()
+    fragments = {d.name.value: d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)}
+    names = set()
+    pending = list(operation.selection_set.selections)
+    seen = set()
+    while pending:
+        selection = pending.pop()
+        if isinstance(selection, ast.Field):
+            names.add(selection.name.value)
+        elif isinstance(selection, ast.InlineFragment):
+            pending.extend(selection.selection_set.selections)
+        elif isinstance(selection, ast.FragmentSpread) and selection.name.value not in seen:
+            seen.add(selection.name.value)
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                pending.extend(fragment.selection_set.selections)
+    return names
+
+
+def _execute_blocking(document, **kwargs):
+    try:
+        return document.execute(**kwargs)
+    finally:
+        # each worker thread has its own scoped session; give the connection back
+        SessionLocal.remove()
+
+
+class GraphQLApp:
+    """Parses GraphQL-over-HTTP requests and decides where each one executes."""
+
+    def __init__(self, schema, backend, persisted_queries=None, db_threads=DB_THREADS, get_max_age=GRAPHQL_GET_MAX_AGE):
+        self.schema = schema
+        self.backend = backend
+        self.persisted_queries = persisted_queries
+        self.get_max_age = get_max_age
+        self.middleware = metrics.resolver_middleware()
+        self.pool = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='graphql-db')
+        self.keeper = None
+
+    async def params(self, request):
+        query_data = dict(request.query_params)
+        data = {}
+        if request.method == 'POST':
+            content_type = request.headers.get('content-type', '').split(';')[0].strip()
+            body = (await request.body()).decode('utf-8')
+            if content_type == 'application/graphql':
+                data = {'query': body}
+            elif content_type == 'application/json':
+                data = load_json_body(body)
+            elif content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+                data = dict(await request.form())
+        if not isinstance(data, dict):
+            raise HttpQueryError(400, "Batch GraphQL requests are not enabled.")
+        if self.persisted_queries is not None:
+            data = resolve_persisted_query(self.persisted_queries, data, query_data)
+        variables = data.get('variables') or query_data.get('variables')
+        if isinstance(variables, str):
+            try:
+                variables = json.loads(variables)
+            except ValueError:
+                raise HttpQueryError(400, "Variables are invalid JSON.")
+        return {
+            'query': data.get('query') or query_data.get('query'),
+            'variables': variables,
+            'operation_name': data.get('operationName') or query_data.get('operationName'),
+        }
+
+    async def execute(self, request, params):
+        if not params['query']:
+            raise HttpQueryError(400, "Must provide query string.")
+        try:
+            document = self.backend.document_from_string(self.schema, params['query'])
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+        operation_type = document.get_operation_type(params['operation_name'])
+        if request.method == 'GET' and operation_type and operation_type != 'query':
+            raise HttpQueryError(
+                405,
+                f"Can only perform a {operation_type} operation from a POST request.",
+                headers={'Allow': 'POST'},
+            )
+        kwargs = {
+            'operation_name': params['operation_name'],
+            'variable_values': params['variables'],
+            'context_value': {'request': request},
+            'middleware': self.middleware,
+        }
+
+        snap = None
+        if self.keeper and operation_type == 'query':
+            # fields the snapshot cannot answer would block the loop on the sync session
+            if not root_fields(document.document_ast, params['operation_name']) & DB_ONLY_FIELDS:
+                snap = await self.keeper.snapshot()
+        if snap is None:
+            loop = asyncio.get_running_loop()
+            # copy the context so the request's SQL statement counter follows it into the thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.pool, lambda: context.run(_execute_blocking, document, **kwargs))
+
+        # every resolver answers from this snapshot, so nothing below blocks the loop
+        token = cache.pin(snap)
+        try:
+            result = document.execute(executor=AsyncioExecutor(), return_promise=True, **kwargs)
+            if is_thenable(result):
+                result = await result
+            return result
+        finally:
+            cache.unpin(token)
+
+    async def handle(self, request: Request):
+        token = metrics.start_request()
+        profile_token = profiling.request(request.headers)
+        try:
+            params = await self.params(request)
+            result = await self.execute(request, params)
+        except HttpQueryError as e:
+            return JSONResponse({'errors': [{'message': e.message}]}, status_code=e.status_code, headers=e.headers)
+        finally:
+            profiling.end_request(profile_token)
+            metrics.finish_request(token)
+        body, status_code = encode_execution_results([result], encode=json_encode)
+        headers = {}
+        if request.method == 'GET' and self.get_max_age and status_code == 200:
+            headers['Cache-Control'] = f'public, max-age={self.get_max_age}'
+        return Response(body, status_code=status_code, media_type='application/json', headers=headers)
+
+
+graphql = GraphQLApp(schema, CachedDocumentBackend(), persisted_queries=PersistedQueryStore())
+graphql_ws = subscriptions.SubscriptionServer(schema, graphql.backend)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # same as app.py: no-op if alembic already created the tables
+    init_db()
+    metrics.instrument_engine(sync_engine)
+    profiling.instrument_engine(sync_engine)
+    engine = create_async_db_engine()
+    graphql.keeper = SnapshotKeeper(engine)
+    graphql.keeper.start()
+    subscriptions.hub.configure(engine)
+    yield
+    await subscriptions.hub.stop()
+    await graphql.keeper.stop()
+    await engine.dispose()
+    graphql.pool.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+app.add_api_route('/graphql', graphql.handle, methods=['GET', 'POST'])
+app.add_api_websocket_route('/graphql', graphql_ws.handle)
+
+
+@app.get('/health')
+async def health():
+    return {'status': 'ok'}
+
+
+@app.get('/export')
+async def export_countries(request: Request, format: str = 'ndjson'):
+    """Stream the whole countries table; the DB reads run on Starlette's thread pool."""
+    try:
+        chunks, headers = await run_in_threadpool(export.prepare, sync_engine, format, request.headers.get('accept-encoding'))
+    except export.ExportError as e:
+        return JSONResponse({'error': str(e)}, status_code=e.status_code)
+    return StreamingResponse(chunks, headers=headers)
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
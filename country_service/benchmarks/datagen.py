@@ -0,0 +1,156 @@
+"""
+Deterministic synthetic countries and territories for benchmarks.
+
+`api_records(n, seed)` yields records shaped like the external countries API
+(what `tasks.ingest_countries` consumes), with realistic `timezones`,
+`currencies` and `languages` JSON. `load(engine, n, seed)` recreates the schema
+on `engine` and bulk-inserts the same records as `countries` rows.
+
+ISO codes are two and three letters, so only the first rows get them:
+alpha-2 codes are drawn from A*-X* (624 of them) and alpha-3 codes from
+AAA-XZZ (16224), which leaves Y*/Z* free for benchmarked inserts. Rows beyond
+that are code-less territories, reachable by name, paging and location.
+"""
+
+import math
+import random
+import string
+import itertools
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import Country, normalize_name
+import region_stats
+import changes
+
+# first letters handed out to generated rows; the rest stay free for addCountry
+CODE_LETTERS = string.ascii_uppercase[:24]
+FREE_CODE_LETTERS = string.ascii_uppercase[24:]
+
+# (region, subregions, latitude range, longitude range, UTC offsets)
+REGIONS = [
+    ('Europe', ['Northern Europe', 'Western Europe', 'Southern Europe', 'Eastern Europe'], (36, 70), (-10, 40), (0, 3)),
+    ('Africa', ['Northern Africa', 'Western Africa', 'Middle Africa', 'Eastern Africa', 'Southern Africa'],
+     (-34, 37), (-17, 51), (-1, 4)),
+    ('Asia', ['Western Asia', 'Central Asia', 'Southern Asia', 'Eastern Asia', 'South-Eastern Asia'],
+     (-10, 55), (26, 145), (3, 10)),
+    ('Americas', ['North America', 'Central America', 'Caribbean', 'South America'], (-55, 70), (-168, -35), (-10, -3)),
+    ('Oceania', ['Australia and New Zealand', 'Melanesia', 'Micronesia', 'Polynesia'], (-47, 20), (110, 180), (8, 13)),
+]
+CURRENCIES = [
+    ('EUR', 'Euro', '€'), ('USD', 'United States dollar', '$'), ('GBP', 'British pound', '£'),
+    ('XOF', 'West African CFA franc', 'Fr'), ('INR', 'Indian rupee', '₹'), ('JPY', 'Japanese yen', '¥'),
+    ('BRL', 'Brazilian real', 'R$'), ('AUD', 'Australian dollar', '$'), ('CHF', 'Swiss franc', 'Fr'),
+    ('ZAR', 'South African rand', 'R'), ('KES', 'Kenyan shilling', 'Sh'), ('MXN', 'Mexican peso', '$'),
+]
+LANGUAGES = [
+    ('en', 'eng', 'English', 'English'), ('fr', 'fra', 'French', 'français'), ('es', 'spa', 'Spanish', 'Español'),
+    ('ar', 'ara', 'Arabic', 'العربية'), ('pt', 'por', 'Portuguese', 'Português'), ('de', 'deu', 'German', 'Deutsch'),
+    ('sw', 'swa', 'Swahili', 'Kiswahili'), ('hi', 'hin', 'Hindi', 'हिन्दी'), ('zh', 'zho', 'Chinese', '中文'),
+    ('ru', 'rus', 'Russian', 'Русский'), ('ja', 'jpn', 'Japanese', '日本語'), ('ms', 'msa', 'Malay', 'Bahasa Melayu'),
+]
+SYLLABLES = ['ba', 'ca', 'da', 'el', 'fa', 'go', 'ha', 'ir', 'jo', 'ka', 'lu', 'ma', 'ne', 'or', 'pa', 'qui',
+             'ra', 'sa', 'ti', 'ur', 'va', 'wa', 'xe', 'ya', 'zo', 'ñi', 'ló', 'stan', 'land', 'ria', 'nia', 'ca']
+SUFFIXES = ['', '', '', ' Islands', ' Republic', ' Territory', ' Coast']
+
+
+def codes(width, letters=CODE_LETTERS):
+    """Every `width`-letter code starting with one of `letters`, in order."""
+    tails = [''.join(t) for t in itertools.product(string.ascii_uppercase, repeat=width - 1)]
+    return [first + tail for first in letters for tail in tails]
+
+
+def _name(rng, taken):
+    while True:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        name = word[0].upper() + word[1:] + rng.choice(SUFFIXES)
+        if name not in taken:
+            taken.add(name)
+            return name
+
+
+def _record(rng, index, name, alpha2_code, alpha3_code):
+    region, subregions, lat_range, lon_range, offsets = REGIONS[index % len(REGIONS)]
+    offset = rng.randint(*offsets)
+    timezones = sorted({f"UTC{offset + step:+03d}:00" for step in range(rng.randint(1, 3))})
+    currencies = [
+        {'code': code, 'name': cname, 'symbol': symbol}
+        for code, cname, symbol in rng.sample(CURRENCIES, rng.randint(1, 2))
+    ]
+    languages = [
+        {'iso639_1': iso1, 'iso639_2': iso2, 'name': lname, 'nativeName': native}
+        for iso1, iso2, lname, native in rng.sample(LANGUAGES, rng.randint(1, 3))
+    ]
+    return {
+        'name': name,
+        'alpha2Code': alpha2_code,
+        'alpha3Code': alpha3_code,
+        'capital': f"{name.split()[0]} City",
+        'region': region,
+        'subregion': rng.choice(subregions),
+        # country populations and areas are roughly log-normal
+        'population': int(math.exp(rng.gauss(15, 2))),
+        'area': round(math.exp(rng.gauss(11, 2.5)), 1),
+        'latlng': [round(rng.uniform(*lat_range), 4), round(rng.uniform(*lon_range), 4)],
+        'timezones': timezones,
+        'currencies': currencies,
+        'languages': languages,
+        'flag': f"https://flags.example.com/{(alpha3_code or f't{index}').lower()}.svg",
+    }
+
+
+def api_records(n, seed=0):
+    """`n` API-shaped records; the same (n, seed) always gives the same records."""
+    rng = random.Random(seed)
+    alpha2_codes, alpha3_codes = codes(2), codes(3)
+    rng.shuffle(alpha2_codes)
+    rng.shuffle(alpha3_codes)
+    taken = set()
+    for index in range(n):
+        alpha2_code = alpha2_codes[index] if index < len(alpha2_codes) else None
+        alpha3_code = alpha3_codes[index] if index < len(alpha3_codes) else None
+        yield _record(rng, index, _name(rng, taken), alpha2_code, alpha3_code)
+
+
+def row_from_record(record):
+    """`countries` column values for an API record, code-less territories included."""
+    latlng = record['latlng']
+    return {
+        'name': record['name'],
+        'name_normalized': normalize_name(record['name']),
+        'alpha2_code': record['alpha2Code'],
+        'alpha3_code': record['alpha3Code'],
+        'capital': record['capital'],
+        'region': record['region'],
+        'subregion': record['subregion'],
+        'population': record['population'],
+        'area_km2': record['area'],
+        'latitude': latlng[0],
+        'longitude': latlng[1],
+        'timezones': record['timezones'],
+        'currencies': record['currencies'],
+        'languages': record['languages'],
+        'flag_url': record['flag'],
+        'source': 'external',
+    }
+
+
+def load(engine, n, seed=0, batch_size=5000):
+    """Recreate every table on `engine` and insert `n` generated countries."""
+    from database import Base
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    records = api_records(n, seed)
+    with engine.begin() as conn:
+        while True:
+            batch = [row_from_record(record) for record in itertools.islice(records, batch_size)]
+            if not batch:
+                break
+            conn.execute(insert(Country), batch)
+    # generated rows bypass the writers, so build the summaries and change sequence in one go
+    with Session(engine) as db:
+        region_stats.refresh(db)
+        changes.stamp(db)
+        db.commit()
+    return n
@@ -0,0 +1,108 @@
+"""
+Closed-loop HTTP load test for the country GraphQL API.
+
+Runs `--concurrency` clients that each send the next request as soon as the
+previous one returns, for `--duration` seconds, and prints throughput and
+latency percentiles as JSON. Point it at the Flask (gunicorn) and the ASGI
+(uvicorn) services in turn, with both containers limited to the same CPUs:
+
+    python benchmarks/loadtest.py --url http://localhost:8000/graphql
+    python benchmarks/loadtest.py --url http://localhost:8001/graphql
+
+`--slow-query` mixes in a share of requests that bypass the snapshot and hit the
+database, which is where a blocking server stalls every other request.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+QUERIES = {
+    'country': '{ country(alpha2Code: "DE") { name capital population } }',
+    'page': '{ countries(limit: 20, offset: 40) { name alpha2Code region } }',
+    'search': '{ searchCountries(prefix: "uni", fuzzy: true) { name } }',
+    'near': '{ countriesNear(latitude: 48.8, longitude: 2.3, radiusKm: 1500) { name } }',
+}
+
+# keyset pages walk the DB whenever the snapshot is cold or disabled
+SLOW_QUERY = '{ countriesConnection(last: 50) { edges { node { name currencies languages } } } }'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def worker(client, url, queries, deadline, latencies, errors, slow_every):
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        query = SLOW_QUERY if slow_every and n % slow_every == 0 else queries[n % len(queries)]
+        start = time.perf_counter()
+        try:
+            resp = await client.post(url, json={'query': query})
+            if resp.status_code != 200 or 'errors' in resp.json():
+                errors.append(resp.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url, concurrency, duration, queries, slow_every, warmup):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        if warmup:
+            await asyncio.gather(*[client.post(url, json={'query': q}) for q in queries])
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[
+            worker(client, url, queries, deadline, latencies, errors, slow_every) for _ in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': ms(statistics.fmean(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://localhost:8000/graphql')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--query', choices=sorted(QUERIES), action='append',
+                        help='query mix to send (repeatable); defaults to all of them')
+    parser.add_argument('--slow-query', type=int, default=0, metavar='N',
+                        help='make every Nth request a DB-bound query')
+    parser.add_argument('--no-warmup', action='store_true')
+    args = parser.parse_args()
+
+    queries = [QUERIES[name] for name in (args.query or sorted(QUERIES))]
+    result = asyncio.run(run(args.url, args.concurrency, args.duration, queries, args.slow_query, not args.no_warmup))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
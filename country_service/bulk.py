@@ -0,0 +1,169 @@
+"""
+Set-based writes to the countries table.
+
+`upsert_external` replaces the per-item SELECT/ORM loop the ingestion task used
+to run: existing rows are prefetched with one query and the payload is written
+with batched `INSERT ... ON CONFLICT (alpha2_code) DO UPDATE ... WHERE source =
+'external'`, so rows owned by a person (source='manual') are never overwritten.
+
+`insert_new` is the write half of the `addCountries` mutation: one multi-row
+`INSERT ... ON CONFLICT DO NOTHING` per batch, reporting which rows made it.
+"""
+
+import os
+import uuid
+import logging
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Country as CountryModel, normalize_name
+
+logger = logging.getLogger("country_bulk")
+
+BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '200'))
+
+# columns the external API is allowed to write; everything else is ours
+EXTERNAL_COLUMNS = (
+    'name', 'name_normalized', 'alpha3_code', 'capital', 'region', 'subregion', 'population', 'area_km2',
+    'latitude', 'longitude', 'timezones', 'currencies', 'languages', 'flag_url',
+)
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def row_from_api(item):
+    """Map one external API record to column values, or None if it has no alpha2 code."""
+    alpha2_code = (item.get('alpha2Code') or '').upper()
+    if not alpha2_code:
+        return None
+    latlng = item.get('latlng') or []
+    return {
+        'alpha2_code': alpha2_code,
+        'name': item.get('name'),
+        'name_normalized': normalize_name(item.get('name')),
+        'alpha3_code': item.get('alpha3Code'),
+        'capital': item.get('capital'),
+        'region': item.get('region'),
+        'subregion': item.get('subregion'),
+        'population': item.get('population'),
+        'area_km2': item.get('area'),
+        'latitude': latlng[0] if len(latlng) > 0 else None,
+        'longitude': latlng[1] if len(latlng) > 1 else None,
+        'timezones': item.get('timezones'),
+        'currencies': item.get('currencies'),
+        'languages': item.get('languages'),
+        'flag_url': item.get('flag'),
+    }
+
+
+def insert_for(db):
+    """The dialect's INSERT construct (with ON CONFLICT support) for `db`'s database."""
+    dialect = db.get_bind().dialect.name
+    try:
+        return _INSERTS[dialect]
+    except KeyError:
+        raise NotImplementedError(f"bulk upsert is not supported on {dialect}")
+
+
+def on_conflict_external(stmt):
+    """Turn an INSERT into countries into an upsert that only refreshes external rows.
+
+    Rows whose values would not change are not written at all, so their
+    synced_at/updated_at stay put and no dead row versions pile up.
+    """
+    table = CountryModel.__table__
+    # an empty value from the API never blanks out what we already have
+    values = {col: func.coalesce(stmt.excluded[col], table.c[col]) for col in EXTERNAL_COLUMNS}
+    changed = or_(*[value.is_distinct_from(table.c[col]) for col, value in values.items()])
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.alpha2_code],
+        set_=dict(values, synced_at=func.now(), updated_at=func.now()),
+        # source is re-checked at write time in case a manual row appeared after the prefetch
+        where=and_(table.c.source == 'external', changed),
+    )
+
+
+def _upsert_batch(db, insert, rows):
+    db.execute(on_conflict_external(insert(CountryModel.__table__).values(rows)))
+
+
+def upsert_external(db, rows, batch_size=None, touched=None, written=None):
+    """Insert or refresh externally sourced countries in batches.
+
+    `rows` is any iterable of dicts from `row_from_api` (None entries are counted
+    as skipped), so a streamed payload never has to be materialized. The caller
+    owns the transaction. Returns a dict of inserted/updated/skipped/protected counts.
+    When `touched` is a set, the (region, subregion) groups of every written row,
+    before and after the write, are added to it (see region_stats.refresh);
+    `written` collects their alpha2 codes (see changes.stamp).
+    """
+    batch_size = batch_size or BATCH_SIZE
+    insert = insert_for(db)
+    # one query for the ownership (and current group) of every existing row
+    existing = {
+        alpha2_code: (source, region, subregion)
+        for alpha2_code, source, region, subregion in db.query(
+            CountryModel.alpha2_code, CountryModel.source, CountryModel.region, CountryModel.subregion
+        ).filter(CountryModel.alpha2_code.isnot(None))
+    }
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'protected': 0}
+    seen = set()
+    batch = []
+
+    for row in rows:
+        if row is None or row['alpha2_code'] in seen:
+            stats['skipped'] += 1
+            continue
+        alpha2_code = row['alpha2_code']
+        seen.add(alpha2_code)
+        source, region, subregion = existing.get(alpha2_code, (None, None, None))
+        if source is None:
+            batch.append(dict(row, id=uuid.uuid4(), source='external'))
+            stats['inserted'] += 1
+            if touched is not None:
+                touched.add((row.get('region'), row.get('subregion')))
+        elif source == 'external':
+            # falsy values mean "keep the current one", same as the old `or existing.x`
+            values = {k: (v if v or k == 'alpha2_code' else None) for k, v in row.items()}
+            batch.append(dict(values, id=uuid.uuid4(), source='external'))
+            stats['updated'] += 1
+            if touched is not None:
+                touched.add((region, subregion))
+                touched.add((values.get('region') or region, values.get('subregion') or subregion))
+        else:
+            stats['protected'] += 1
+            continue
+        if written is not None:
+            written.add(alpha2_code)
+        if len(batch) >= batch_size:
+            _upsert_batch(db, insert, batch)
+            batch = []
+
+    if batch:
+        _upsert_batch(db, insert, batch)
+    logger.info("Upserted countries: %s", stats)
+    return stats
+
+
+def insert_new(db, rows, batch_size=None):
+    """Insert `rows` with multi-row statements, silently skipping any that hit a unique constraint.
+
+    Every row must carry its own `id`; the ids that were actually written are
+    returned, so the caller can tell which rows lost a race with another writer.
+    The caller owns the transaction.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    insert = insert_for(db)
+    table = CountryModel.__table__
+    ids = [row['id'] for row in rows]
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(table).values(rows[start:start + batch_size]).on_conflict_do_nothing())
+    written = set()
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        written.update(db.execute(select(table.c.id).where(table.c.id.in_(chunk))).scalars())
+    return written
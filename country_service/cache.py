@@ -0,0 +1,289 @@
+"""
+In-process snapshot of the countries table.
+
+The table only holds a few hundred rows and is read far more often than it is
+written, so the read resolvers answer from an immutable snapshot that is loaded
+once per process and swapped atomically on reload.
+
+Writers call `publish_invalidation()` after they commit. The message goes out on
+a Redis channel so every gunicorn worker drops its snapshot and reloads it on the
+next read. If the invalidation listener is not connected, `current()` returns
+None and callers read straight from the database instead.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from functools import cached_property
+
+import redis
+from sqlalchemy import select
+
+from models import Country as CountryModel, normalize_name
+from geo import SpatialIndex
+from search import NameIndex
+from filters import FilterIndex
+import events
+import pagination
+import region_stats
+
+logger = logging.getLogger("country_cache")
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+CACHE_ENABLED = os.getenv('COUNTRY_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no')
+# upper bound on staleness if an invalidation message is ever missed
+CACHE_MAX_AGE = float(os.getenv('COUNTRY_CACHE_MAX_AGE', '300'))
+INVALIDATION_CHANNEL = os.getenv('COUNTRY_CACHE_CHANNEL', 'country_cache')
+
+
+class CountrySnapshot:
+    """Immutable view of every country row plus the lookup indexes the resolvers need."""
+
+    def __init__(self, countries, loaded_at=None, regions=()):
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+        # region_stats.RegionSummary objects, read from the precomputed summary table
+        self.regions = list(regions)
+        # same ordering as the DB path (see pagination.name_order), ties broken by id so paging is stable
+        self.countries = tuple(sorted(countries, key=pagination.sort_key))
+        self.keys = [pagination.sort_key(c) for c in self.countries]
+        by_alpha2 = {}
+        by_alpha3 = {}
+        by_name = {}
+        for c in self.countries:
+            if c.alpha2_code:
+                by_alpha2[c.alpha2_code] = c
+            if c.alpha3_code:
+                by_alpha3.setdefault(c.alpha3_code.upper(), c)
+            if c.name:
+                by_name.setdefault(c.name_normalized or normalize_name(c.name), c)
+        self.by_alpha2 = by_alpha2
+        self.by_alpha3 = by_alpha3
+        self.by_name = by_name
+        self.spatial = SpatialIndex(
+            (c.latitude, c.longitude, c) for c in self.countries if c.latitude is not None and c.longitude is not None
+        )
+
+    def __len__(self):
+        return len(self.countries)
+
+    def find(self, name=None, alpha2_code=None, alpha3_code=None):
+        if name:
+            return self.by_name.get(normalize_name(name))
+        if alpha2_code:
+            return self.by_alpha2.get(alpha2_code.upper())
+        if alpha3_code:
+            return self.by_alpha3.get(alpha3_code.upper())
+        return None
+
+    def page(self, limit, offset, criteria=None):
+        if not criteria:
+            return list(self.countries[offset:offset + limit])
+        positions = self.filters.positions(criteria)[offset:offset + limit]
+        return [self.countries[i] for i in positions]
+
+    @cached_property
+    def filters(self):
+        # like `names`, only built once something is filtered
+        return FilterIndex(self.countries)
+
+    @cached_property
+    def names(self):
+        # built on first search so plain reloads stay cheap
+        return NameIndex(self.countries)
+
+    def search(self, text, fuzzy=False, limit=10):
+        return self.names.search(text, fuzzy=fuzzy, limit=limit)
+
+    def connection_page(self, first=None, after=None, last=None, before=None):
+        return pagination.page_sorted(self.countries, self.keys, first, after, last, before)
+
+    def near(self, latitude, longitude, radius_km, limit):
+        return [c for _, c in self.spatial.within(latitude, longitude, radius_km)[:limit]]
+
+    def nearest(self, latitude, longitude, k):
+        return [c for _, c in self.spatial.nearest(latitude, longitude, k)]
+
+
+def load_snapshot(db):
+    """Read the whole table into detached model instances, plus the region summaries.
+
+    Columns are selected directly so the caller's session identity map is left alone
+    and the cached objects are never refreshed or expired behind our back.
+    """
+    columns = list(CountryModel.__table__.columns)
+    rows = db.query(*columns).all()
+    return snapshot_from_rows(columns, rows, db.execute(region_stats.summary_query()).all())
+
+
+def snapshot_from_rows(columns, rows, summary_rows=()):
+    return CountrySnapshot(
+        [CountryModel(**{col.key: row[i] for i, col in enumerate(columns)}) for row in rows],
+        regions=region_stats.summarize(summary_rows),
+    )
+
+
+async def load_snapshot_async(async_engine):
+    """`load_snapshot` over an AsyncEngine, for the ASGI app."""
+    columns = list(CountryModel.__table__.columns)
+    async with async_engine.connect() as conn:
+        result = await conn.execute(select(*columns))
+        rows = result.all()
+        summary_rows = (await conn.execute(region_stats.summary_query())).all()
+    return snapshot_from_rows(columns, rows, summary_rows)
+
+
+_snapshot = None
+_generation = 0
+_load_lock = threading.Lock()
+_listener = None
+
+
+def invalidate():
+    """Drop this process's snapshot; the next read reloads it."""
+    global _snapshot, _generation
+    with _load_lock:
+        _generation += 1
+        _snapshot = None
+
+
+def _is_fresh(snap):
+    return snap is not None and time.monotonic() - snap.loaded_at < CACHE_MAX_AGE
+
+
+def begin_load():
+    """Generation to hand to `install()` once a load started now has finished."""
+    with _load_lock:
+        return _generation
+
+
+def install(snap, generation):
+    """Make `snap` the current snapshot unless something was committed since `generation`."""
+    global _snapshot
+    with _load_lock:
+        if generation == _generation:
+            _snapshot = snap
+    return snap
+
+
+def peek():
+    """The current snapshot if it is still fresh; never loads."""
+    snap = _snapshot
+    return snap if _is_fresh(snap) else None
+
+
+def get_snapshot(session_factory):
+    """Return the current snapshot, loading it with `session_factory()` if needed."""
+    snap = peek()
+    if snap is not None:
+        return snap
+    with _load_lock:
+        snap = _snapshot
+        if _is_fresh(snap):
+            return snap
+        generation = _generation
+    # load outside the lock so an invalidation arriving mid-load is not blocked
+    return install(load_snapshot(session_factory()), generation)
+
+
+# a snapshot pinned for the code running in this context (see asgi.py)
+_pinned = contextvars.ContextVar('country_snapshot', default=None)
+
+
+def pin(snap):
+    """Answer every `current()` call in this context from `snap`; returns a reset token."""
+    return _pinned.set(snap)
+
+
+def unpin(token):
+    _pinned.reset(token)
+
+
+def is_listening():
+    """False when a listener exists but is not connected, i.e. invalidations may be missed."""
+    return _listener is None or _listener.connected
+
+
+def register_listener(listener):
+    """Use `listener` (anything with a `.connected` flag) as this process's invalidation listener."""
+    global _listener
+    _listener = listener
+
+
+def current(session_factory):
+    """Snapshot to answer a read from, or None when the caller must query the DB."""
+    pinned = _pinned.get()
+    if pinned is not None:
+        return pinned
+    if not CACHE_ENABLED:
+        return None
+    if not is_listening():
+        # we may be missing invalidations; stay consistent by going to the DB
+        return None
+    try:
+        return get_snapshot(session_factory)
+    except Exception:
+        logger.exception("Failed to load country snapshot; falling back to DB")
+        return None
+
+
+def publish_invalidation():
+    """Invalidate locally and tell every other process to do the same."""
+    invalidate()
+    try:
+        # the process-wide pool events are published through, not a connection per write
+        events.get_client().publish(INVALIDATION_CHANNEL, 'invalidate')
+    except Exception:
+        # other workers will still pick up the change once CACHE_MAX_AGE expires
+        logger.warning("Could not publish country cache invalidation", exc_info=True)
+
+
+class InvalidationListener(threading.Thread):
+    """Background thread that drops the snapshot whenever an invalidation arrives."""
+
+    def __init__(self, url=REDIS_URL, channel=INVALIDATION_CHANNEL, retry_delay=2.0):
+        super().__init__(name='country-cache-invalidation', daemon=True)
+        self.url = url
+        self.channel = channel
+        self.retry_delay = retry_delay
+        self.connected = False
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            pubsub = None
+            try:
+                pubsub = redis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # anything committed while we were disconnected is unknown to us
+                invalidate()
+                self.connected = True
+                while not self._stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        invalidate()
+            except Exception:
+                logger.warning("Country cache listener disconnected; retrying in %ss", self.retry_delay, exc_info=True)
+            finally:
+                self.connected = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            self._stop_event.wait(self.retry_delay)
+
+
+def start_invalidation_listener():
+    """Start the per-process listener once; safe to call more than once."""
+    global _listener
+    if not CACHE_ENABLED:
+        return None
+    if _listener is None:
+        _listener = InvalidationListener()
+        _listener.start()
+    return _listener
@@ -1,6 +1,10 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_ready
+
+import metrics
+from database import engine
 
 REDIS = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 
@@ -24,8 +28,23 @@ celery.conf.beat_schedule = {
     'ingest-countries-daily': {
         'task': 'tasks.ingest_countries',
         'schedule': crontab(minute=minute, hour=hour),
-    }
+    },
+    # picks up outbox events the API could not publish right after its commit
+    'relay-outbox': {
+        'task': 'tasks.relay_outbox',
+        'schedule': float(os.getenv('OUTBOX_RELAY_INTERVAL', '10')),
+    },
 }
 
+# task latency/outcome metrics; CELERY_METRICS_PORT serves them from the worker
+metrics.connect_celery_signals()
+metrics.instrument_engine(engine)
+
+@worker_ready.connect
+def serve_metrics(sender, **kwargs):
+    port = os.getenv('CELERY_METRICS_PORT')
+    if port:
+        metrics.start_worker_server(int(port))
+
 # make sure tasks are discovered when this module is imported
 celery.autodiscover_tasks(['tasks'])
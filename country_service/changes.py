@@ -0,0 +1,156 @@
+"""
+Change tracking for delta sync (`countriesChangedSince`).
+
+Every country carries a `content_hash` of the fields clients see and a
+`change_seq` taken from the `change_counter` row. Writers call `stamp(db,
+condition)` on the rows they wrote, inside their own transaction and after the
+writes: rows whose hash really changed get new sequence numbers, everything
+else keeps its old one, so a no-op ingestion produces no changes at all.
+
+Sequence numbers come from an UPDATE of the counter row, whose lock is held
+until commit. A writer therefore cannot commit a number lower than one that is
+already visible, and a client that has seen number N has seen everything
+before it. Deleted countries become tombstones with their own sequence number
+(see models.TOMBSTONE_DDL).
+
+Bulk writers (ingestion, file imports) also queue `countries_updated` outbox
+events for what they stamped (`add_events`), which the `countryUpdated` and
+`countryAdded` subscriptions are fed from.
+
+Cursors are opaque strings wrapping the last sequence number a client has seen.
+"""
+
+import os
+import json
+import base64
+import hashlib
+import binascii
+import logging
+
+from sqlalchemy import bindparam, select
+
+import outbox
+from models import ChangeCounter, Country as CountryModel, CountryTombstone
+
+logger = logging.getLogger("country_changes")
+
+COUNTER_NAME = 'countries'
+# most countries listed in one 'countries_updated' event
+EVENT_BATCH = int(os.getenv('CHANGE_EVENT_BATCH', '500'))
+
+# everything a client can read about a country; ids and bookkeeping timestamps are not content
+CONTENT_COLUMNS = (
+    'name', 'alpha2_code', 'alpha3_code', 'capital', 'region', 'subregion', 'population', 'area_km2',
+    'latitude', 'longitude', 'timezones', 'currencies', 'languages', 'flag_url', 'source',
+)
+
+_dumps = json.JSONEncoder(sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode
+
+
+def content_hash(values):
+    """sha256 over the CONTENT_COLUMNS of a row mapping."""
+    return hashlib.sha256(_dumps([values[col] for col in CONTENT_COLUMNS]).encode('utf-8')).hexdigest()
+
+
+def next_seqs(db, n):
+    """Reserve `n` sequence numbers; the counter row stays locked until the caller commits."""
+    counter = ChangeCounter.__table__
+    updated = db.execute(
+        counter.update().where(counter.c.name == COUNTER_NAME).values(value=counter.c.value + n)
+    ).rowcount
+    if not updated:
+        # only before the first migration / create_all put the row there
+        db.execute(counter.insert().values(name=COUNTER_NAME, value=n))
+    last = db.execute(select(counter.c.value).where(counter.c.name == COUNTER_NAME)).scalar()
+    return range(last - n + 1, last + 1)
+
+
+def stamp(db, *conditions, created=None, updated=None):
+    """Give the rows matching `conditions` whose content changed a new change_seq; returns how many.
+
+    The ids of the stamped rows are added to the `created` (never stamped
+    before) and `updated` sets when given.
+    """
+    table = CountryModel.__table__
+    rows = db.execute(
+        select(table.c.id, table.c.content_hash, *[table.c[col] for col in CONTENT_COLUMNS])
+        .where(*conditions)
+        .order_by(table.c.name, table.c.id)
+    ).all()
+    changed = []
+    for row in rows:
+        digest = content_hash(row._mapping)
+        if digest != row.content_hash:
+            changed.append((row.id, digest))
+            collect = created if row.content_hash is None else updated
+            if collect is not None:
+                collect.add(row.id)
+    if not changed:
+        return 0
+    seqs = next_seqs(db, len(changed))
+    db.execute(
+        table.update().where(table.c.id == bindparam('row_id')).values(
+            change_seq=bindparam('seq'), content_hash=bindparam('digest'),
+        ),
+        [{'row_id': row_id, 'seq': seq, 'digest': digest} for (row_id, digest), seq in zip(changed, seqs)],
+    )
+    logger.debug("Stamped %d changed countries (seq %d-%d)", len(changed), seqs[0], seqs[-1])
+    return len(changed)
+
+
+def add_events(db, created, updated):
+    """Queue 'countries_updated' events for stamped rows (see `stamp`); returns their outbox ids.
+
+    Each event lists at most EVENT_BATCH countries as {'id', 'name', 'created'}.
+    """
+    ids = sorted(created | updated, key=str)
+    event_ids = []
+    for start in range(0, len(ids), EVENT_BATCH):
+        chunk = ids[start:start + EVENT_BATCH]
+        names = dict(db.query(CountryModel.id, CountryModel.name).filter(CountryModel.id.in_(chunk)))
+        event = outbox.add_event(db, 'countries_updated', count=len(chunk), countries=[
+            {'id': str(country_id), 'name': names.get(country_id), 'created': country_id in created}
+            for country_id in chunk
+        ])
+        db.flush()
+        event_ids.append(event.id)
+    return event_ids
+
+
+def encode_cursor(seq):
+    return base64.urlsafe_b64encode(f'changes:{seq}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        kind, _, seq = base64.urlsafe_b64decode(cursor.encode()).decode().partition(':')
+        if kind != 'changes':
+            raise ValueError(kind)
+        return int(seq)
+    except (ValueError, TypeError, AttributeError, binascii.Error, UnicodeDecodeError):
+        raise Exception(f"Invalid cursor '{cursor}'.")
+
+
+def changed_since(db, cursor=None, limit=100, options=()):
+    """(countries, tombstones, next cursor, has_more) for what changed after `cursor`.
+
+    With no cursor every country is returned (a full sync) and there are no
+    tombstones. Countries and tombstones share one sequence, so at most `limit`
+    of them together are returned, in sequence order.
+    """
+    since = decode_cursor(cursor) if cursor else 0
+    countries = db.query(CountryModel).options(*options).filter(CountryModel.change_seq > since) \
+        .order_by(CountryModel.change_seq).limit(limit + 1).all()
+    tombstones = []
+    if cursor:
+        tombstones = db.query(CountryTombstone).filter(CountryTombstone.change_seq > since) \
+            .order_by(CountryTombstone.change_seq).limit(limit + 1).all()
+    merged = sorted(countries + tombstones, key=lambda item: item.change_seq)
+    page = merged[:limit]
+    last = page[-1].change_seq if page else since
+    return (
+        [item for item in page if isinstance(item, CountryModel)],
+        [item for item in page if isinstance(item, CountryTombstone)],
+        encode_cursor(last),
+        len(merged) > limit,
+    )
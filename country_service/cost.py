@@ -0,0 +1,250 @@
+"""
+Query cost analysis and limits for the GraphQL endpoint.
+
+Two layers, both applied before anything is resolved:
+
+- `DepthLimitRule` and `AliasLimitRule` are validation rules. They only depend
+  on the document, so they run once per document with the rest of validation
+  (and are cached with it by `graphql_view.CachedDocumentBackend`).
+- `analyze()` prices an operation with its variables: every object a query can
+  return costs 1, list fields multiply the cost of their selection by the page
+  size they ask for (`limit`, `first`, `last`, `nearest`, or the argument's
+  default), and a few root fields carry an extra weight for the SQL they run.
+  Batch mutations are priced per input item, and their result lists are
+  assumed to be as long as the input.
+  Page-size arguments above GRAPHQL_MAX_PAGE_SIZE are rejected, as are negative
+  page sizes and offsets, and any operation costing more than GRAPHQL_MAX_COST.
+
+Introspection fields (`__schema`, `__type`, `__typename`) are neither priced
+nor counted towards depth, so GraphiQL keeps working.
+"""
+
+import os
+
+from graphql.error import GraphQLError
+from graphql.execution.utils import get_field_def
+from graphql.execution.values import get_argument_values, get_variable_values
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, GraphQLInterfaceType, GraphQLObjectType, GraphQLUnionType
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql.utils.type_from_ast import type_from_ast
+from graphql.validation.rules.base import ValidationRule
+
+MAX_COST = int(os.getenv('GRAPHQL_MAX_COST', '1000'))
+MAX_DEPTH = int(os.getenv('GRAPHQL_MAX_DEPTH', '10'))
+MAX_ALIASES = int(os.getenv('GRAPHQL_MAX_ALIASES', '15'))
+MAX_PAGE_SIZE = int(os.getenv('GRAPHQL_MAX_PAGE_SIZE', '100'))
+# assumed length of a list field that takes no page-size argument
+DEFAULT_LIST_SIZE = int(os.getenv('GRAPHQL_DEFAULT_LIST_SIZE', '10'))
+
+# arguments that bound how many items a field returns, in order of precedence
+# (countriesNear ignores `limit` when `nearest` is given)
+PAGE_SIZE_ARGUMENTS = ('nearest', 'first', 'last', 'limit')
+# arguments that must not be negative (a negative slice would return nearly everything)
+NON_NEGATIVE_ARGUMENTS = PAGE_SIZE_ARGUMENTS + ('offset',)
+
+# extra cost on top of the objects returned, for fields whose SQL is heavier
+FIELD_WEIGHTS = {
+    'Query.searchCountries': 2,
+    'Query.countriesNear': 3,
+    # a change-sequence range over countries plus one over tombstones
+    'Query.countriesChangedSince': 3,
+    'Mutation.addCountries': 10,
+}
+
+# list arguments whose every item is a row written, costing 1 each; the
+# field's result lists are as long as the input
+INPUT_LIST_ARGUMENTS = {
+    'Mutation.addCountries': 'countries',
+}
+
+
+def _is_introspection(field_node):
+    return field_node.name.value.startswith('__')
+
+
+def _unwrap(type_):
+    """(named type, is_list) for a possibly wrapped output type."""
+    is_list = False
+    while isinstance(type_, (GraphQLList, GraphQLNonNull)):
+        is_list = is_list or isinstance(type_, GraphQLList)
+        type_ = type_.of_type
+    return type_, is_list
+
+
+def _selection_stats(get_fragment, selection_set, seen=()):
+    """(depth, aliases) of a selection set, following fragment spreads."""
+    depth, aliases = 0, 0
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, ast.Field):
+            if _is_introspection(selection):
+                continue
+            child_depth, child_aliases = _selection_stats(get_fragment, selection.selection_set, seen)
+            depth = max(depth, 1 + child_depth)
+            aliases += child_aliases + (1 if selection.alias else 0)
+        elif isinstance(selection, ast.InlineFragment):
+            child_depth, child_aliases = _selection_stats(get_fragment, selection.selection_set, seen)
+            depth, aliases = max(depth, child_depth), aliases + child_aliases
+        elif isinstance(selection, ast.FragmentSpread):
+            name = selection.name.value
+            fragment = get_fragment(name)
+            # cycles are reported by NoFragmentCycles
+            if fragment is None or name in seen:
+                continue
+            child_depth, child_aliases = _selection_stats(get_fragment, fragment.selection_set, seen + (name,))
+            depth, aliases = max(depth, child_depth), aliases + child_aliases
+    return depth, aliases
+
+
+class _OperationLimitRule(ValidationRule):
+    limit = 0
+    stat = 0
+    message = ''
+
+    def enter_OperationDefinition(self, node, *args):
+        value = _selection_stats(self.context.get_fragment, node.selection_set)[self.stat]
+        if self.limit and value > self.limit:
+            self.context.report_error(GraphQLError(self.message.format(value=value, limit=self.limit), [node]))
+        return False
+
+
+class DepthLimitRule(_OperationLimitRule):
+    """Rejects operations nesting fields deeper than GRAPHQL_MAX_DEPTH."""
+
+    limit = MAX_DEPTH
+    stat = 0
+    message = "Query depth {value} exceeds the maximum of {limit}."
+
+
+class AliasLimitRule(_OperationLimitRule):
+    """Rejects operations using more than GRAPHQL_MAX_ALIASES field aliases."""
+
+    limit = MAX_ALIASES
+    stat = 1
+    message = "Query uses {value} aliases; the maximum is {limit}."
+
+
+VALIDATION_RULES = [DepthLimitRule, AliasLimitRule]
+
+
+class CostReport:
+    """Outcome of `analyze`: the operation's cost and any limit it broke."""
+
+    def __init__(self, cost, errors, limit=MAX_COST):
+        self.cost = cost
+        self.errors = errors
+        self.limit = limit
+
+    def extensions(self):
+        return {'cost': {'requested': self.cost, 'maximum': self.limit}}
+
+
+class _Analysis:
+    def __init__(self, schema, fragments, variables, max_page_size):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables
+        self.max_page_size = max_page_size
+        self.errors = []
+
+    def page_size(self, parent_type, field_def, field_node):
+        """The field's requested page size (None if it takes none), checking the cap."""
+        args = get_argument_values(field_def.args, field_node.arguments, self.variables)
+        for name in NON_NEGATIVE_ARGUMENTS:
+            value = args.get(name)
+            if isinstance(value, int) and value < 0:
+                self.errors.append(GraphQLError(
+                    f"'{name}' on {parent_type.name}.{field_node.name.value} must not be negative (got {value}).",
+                    [field_node],
+                ))
+        size = None
+        for name in PAGE_SIZE_ARGUMENTS:
+            value = args.get(name)
+            if value is None:
+                continue
+            if self.max_page_size and value > self.max_page_size:
+                self.errors.append(GraphQLError(
+                    f"'{name}' on {parent_type.name}.{field_node.name.value} must not exceed {self.max_page_size} "
+                    f"(got {value}).",
+                    [field_node],
+                ))
+            if size is None:
+                size = max(0, value)
+        return size
+
+    def selection_cost(self, parent_type, selection_set, inherited_size=None, seen=()):
+        cost = 0
+        for selection in selection_set.selections if selection_set else ():
+            if isinstance(selection, ast.Field):
+                if not _is_introspection(selection):
+                    cost += self.field_cost(parent_type, selection, inherited_size, seen)
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in seen:
+                    continue
+                condition, fragment_selections, fragment_seen = fragment.type_condition, fragment.selection_set, seen + (name,)
+            else:
+                condition, fragment_selections, fragment_seen = selection.type_condition, selection.selection_set, seen
+            fragment_type = type_from_ast(self.schema, condition) if condition else parent_type
+            cost += self.selection_cost(fragment_type or parent_type, fragment_selections, inherited_size, fragment_seen)
+        return cost
+
+    def field_cost(self, parent_type, field_node, inherited_size, seen):
+        if not isinstance(parent_type, (GraphQLObjectType, GraphQLInterfaceType)):
+            return 0
+        field_def = get_field_def(self.schema, parent_type, field_node.name.value)
+        if field_def is None:
+            return 0
+        named_type, is_list = _unwrap(field_def.type)
+        size = self.page_size(parent_type, field_def, field_node)
+        if not isinstance(named_type, (GraphQLObjectType, GraphQLInterfaceType, GraphQLUnionType)):
+            return 0
+
+        if is_list:
+            count = size if size is not None else (inherited_size if inherited_size is not None else DEFAULT_LIST_SIZE)
+            # the page size has been spent on this list
+            child_size = None
+        else:
+            # a connection passes its page size down to `edges`
+            count, child_size = 1, size
+        key = f'{parent_type.name}.{field_node.name.value}'
+        weight = FIELD_WEIGHTS.get(key, 0)
+        if key in INPUT_LIST_ARGUMENTS:
+            items = get_argument_values(field_def.args, field_node.arguments, self.variables).get(INPUT_LIST_ARGUMENTS[key])
+            if items:
+                weight += len(items)
+                child_size = len(items)
+        return weight + count * (1 + self.selection_cost(named_type, field_node.selection_set, child_size, seen))
+
+
+def analyze(schema, document_ast, operation_name=None, variable_values=None,
+            max_cost=MAX_COST, max_page_size=MAX_PAGE_SIZE):
+    """Price the operation; None if it cannot be analysed (execution reports why)."""
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None:
+        return None
+    try:
+        variables = get_variable_values(schema, operation.variable_definitions or [], variable_values or {})
+    except GraphQLError:
+        return None
+
+    fragments = {
+        definition.name.value: definition
+        for definition in document_ast.definitions if isinstance(definition, ast.FragmentDefinition)
+    }
+    root_type = {
+        'query': schema.get_query_type(),
+        'mutation': schema.get_mutation_type(),
+        'subscription': schema.get_subscription_type(),
+    }.get(operation.operation)
+    if root_type is None:
+        return None
+
+    analysis = _Analysis(schema, fragments, variables, max_page_size)
+    cost = analysis.selection_cost(root_type, operation.selection_set)
+    errors = analysis.errors
+    if max_cost and cost > max_cost:
+        errors.append(GraphQLError(f"Query cost {cost} exceeds the maximum of {max_cost}.", [operation]))
+    return CostReport(cost, errors, max_cost)
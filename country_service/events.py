@@ -0,0 +1,60 @@
+"""
+Country events for the notifier.
+
+`EVENT_TRANSPORT` picks how events leave this service:
+- "pubsub" (default): PUBLISH on the `country_events` channel; fire-and-forget,
+  lost if no notifier is listening at that moment;
+- "stream": XADD to the `country_events:stream` stream, capped at roughly
+  EVENT_STREAM_MAXLEN entries, which notifiers read through a consumer group so
+  each event is handled once per group and survives notifier restarts;
+- "both": do both, for switching notifiers over without a gap.
+
+GraphQL subscriptions (subscriptions.py) follow the same setting: with "stream"
+each API process XREADs new stream entries without a consumer group, otherwise
+it subscribes to the channel.
+
+All publishing goes through one process-wide connection pool (`get_client()`).
+"""
+
+import os
+import json
+
+import redis
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+EVENT_TRANSPORT = os.getenv('EVENT_TRANSPORT', 'pubsub')
+EVENT_CHANNEL = 'country_events'
+EVENT_STREAM = os.getenv('EVENT_STREAM', 'country_events:stream')
+EVENT_STREAM_MAXLEN = int(os.getenv('EVENT_STREAM_MAXLEN', '10000'))
+REDIS_MAX_CONNECTIONS = int(os.getenv('EVENT_REDIS_MAX_CONNECTIONS', '10'))
+
+TRANSPORTS = ('pubsub', 'stream', 'both')
+
+
+_client = None
+
+
+def get_client():
+    """Redis client over this process's shared connection pool."""
+    global _client
+    if _client is None:
+        pool = redis.ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, socket_connect_timeout=2)
+        _client = redis.Redis(connection_pool=pool)
+    return _client
+
+
+def publish_event(payload, client=None, transport=None):
+    """Send one event dict over the configured transport(s).
+
+    `client` may also be a pipeline, to send many events in one round trip.
+    """
+    transport = transport or EVENT_TRANSPORT
+    if transport not in TRANSPORTS:
+        raise ValueError(f"EVENT_TRANSPORT must be one of {TRANSPORTS}, not {transport!r}")
+    r = client if client is not None else get_client()
+    data = json.dumps(payload)
+    if transport in ('stream', 'both'):
+        # approximate trimming lets Redis drop whole macro-nodes, which is much cheaper
+        r.xadd(EVENT_STREAM, {'payload': data}, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+    if transport in ('pubsub', 'both'):
+        r.publish(EVENT_CHANNEL, data)
@@ -0,0 +1,227 @@
+"""
+Streaming export of the countries table (`GET /export?format=...`).
+
+Rows are read with a Core select on a streaming cursor (`yield_per`, a
+server-side cursor on Postgres) and serialized a batch at a time straight from
+the row tuples, so memory stays flat however large the table is. The body is
+sent with chunked transfer encoding and gzip-compressed on the fly when the
+client accepts it.
+
+Formats: `ndjson` (default), `csv`, and with pyarrow installed `arrow` (IPC
+stream) and `parquet` (one row group per batch). JSON columns are written as
+JSON text in CSV and the columnar formats.
+"""
+
+import io
+import os
+import csv
+import json
+import uuid
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import Country
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+
+COLUMNS = [
+    Country.id, Country.name, Country.alpha2_code, Country.alpha3_code, Country.capital, Country.region,
+    Country.subregion, Country.population, Country.area_km2, Country.latitude, Country.longitude,
+    Country.timezones, Country.currencies, Country.languages, Country.flag_url, Country.source,
+    Country.synced_at, Country.created_at, Country.updated_at,
+]
+JSON_COLUMNS = {'timezones', 'currencies', 'languages'}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+FILE_EXTENSIONS = {'ndjson': 'ndjson', 'csv': 'csv', 'arrow': 'arrows', 'parquet': 'parquet'}
+
+
+class ExportError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _plain(value):
+    """UUIDs and datetimes as strings; everything else is already JSON-ready."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_batches(engine, batch_size=None):
+    """Lists of row tuples (in COLUMNS order), read through a streaming cursor."""
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    query = select(*COLUMNS).order_by(Country.name, Country.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for partition in result.partitions():
+            yield partition
+
+
+def _names():
+    return [column.key for column in COLUMNS]
+
+
+def ndjson_chunks(batches):
+    names = _names()
+    dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_plain).encode
+    for batch in batches:
+        yield ''.join(dumps(dict(zip(names, row))) + '\n' for row in batch).encode('utf-8')
+
+
+def csv_chunks(batches):
+    names = _names()
+    json_at = [i for i, name in enumerate(names) if name in JSON_COLUMNS]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    yield buf.getvalue().encode('utf-8')
+    buf.seek(0)
+    buf.truncate()
+    for batch in batches:
+        for row in batch:
+            row = [_plain(value) for value in row]
+            for i in json_at:
+                if row[i] is not None:
+                    row[i] = json.dumps(row[i], separators=(',', ':'), ensure_ascii=False)
+            writer.writerow(row)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+
+
+class _Spool(io.RawIOBase):
+    """Write-only sink the Arrow writers fill; `take()` hands back what was written so far."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema(pa):
+    types = {
+        'population': pa.int64(), 'area_km2': pa.float64(), 'latitude': pa.float64(), 'longitude': pa.float64(),
+        'synced_at': pa.timestamp('us', tz='UTC'), 'created_at': pa.timestamp('us', tz='UTC'),
+        'updated_at': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in _names()])
+
+
+def _record_batch(pa, schema, batch):
+    columns = list(zip(*batch)) if batch else [[] for _ in schema.names]
+    arrays = []
+    for name, field, values in zip(schema.names, schema, columns):
+        if name == 'id':
+            values = [str(v) if v is not None else None for v in values]
+        elif name in JSON_COLUMNS:
+            values = [json.dumps(v, separators=(',', ':'), ensure_ascii=False) if v is not None else None for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ExportError("Arrow and Parquet export need pyarrow installed on the server.", status_code=501)
+    return pyarrow
+
+
+def arrow_chunks(batches):
+    pa = _require_pyarrow()
+    schema = _arrow_schema(pa)
+    sink = _Spool()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(_record_batch(pa, schema, batch))
+            yield sink.take()
+    yield sink.take()
+
+
+def parquet_chunks(batches):
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(pa)
+    sink = _Spool()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for batch in batches:
+            writer.write_batch(_record_batch(pa, schema, batch))
+            yield sink.take()
+    yield sink.take()
+
+
+SERIALIZERS = {'ndjson': ndjson_chunks, 'csv': csv_chunks, 'arrow': arrow_chunks, 'parquet': parquet_chunks}
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding):
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', 'x-gzip'):
+            return params.replace(' ', '').lower() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def prepare(engine, fmt, accept_encoding=None, batch_size=None):
+    """(body chunks, headers) for an export; raises ExportError for a bad request.
+
+    The serializer is primed with its first chunk here, so a missing pyarrow
+    surfaces as an error response rather than a truncated body.
+    """
+    fmt = (fmt or 'ndjson').lower()
+    if fmt not in SERIALIZERS:
+        raise ExportError(f"Unknown export format '{fmt}'; use one of {', '.join(SERIALIZERS)}.")
+    chunks = SERIALIZERS[fmt](iter_batches(engine, batch_size))
+    first = next(chunks, b'')
+
+    def body():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            # a client that hangs up mid-export must not keep the cursor open
+            chunks.close()
+
+    headers = {
+        'Content-Type': CONTENT_TYPES[fmt],
+        'Content-Disposition': f'attachment; filename="countries.{FILE_EXTENSIONS[fmt]}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if accepts_gzip(accept_encoding):
+        headers['Content-Encoding'] = 'gzip'
+        return gzip_chunks(body()), headers
+    return body(), headers
@@ -0,0 +1,195 @@
+"""
+Filtering `countries` by region, subregion, language, currency, timezone and population.
+
+On PostgreSQL the JSON criteria are JSONB containment / key-exists tests
+(`@>`, `?`) served by the GIN indexes from the jsonb migration; region,
+subregion and population use their b-tree indexes. SQLite falls back to
+json_each(). The snapshot answers from `FilterIndex`: an inverted index from
+every value to the positions of the countries that have it, plus a
+population-sorted list for ranges.
+
+Both paths compare stored values as they are; only the input is normalized
+(language codes lower case, currency codes upper case).
+"""
+
+import json
+from bisect import bisect_left, bisect_right
+
+from sqlalchemy import and_, case, cast, exists, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import JSONB
+
+from models import Country as CountryModel
+
+# fields with an exact-match posting list in FilterIndex
+TERM_FIELDS = ('region', 'subregion', 'language_code', 'currency_code', 'timezone')
+
+
+class Criteria:
+    """Normalized filter values; None means "any"."""
+
+    def __init__(self, region=None, subregion=None, language_code=None, currency_code=None, timezone=None,
+                 population_min=None, population_max=None):
+        self.region = region
+        self.subregion = subregion
+        self.language_code = language_code.strip().lower() if language_code else None
+        self.currency_code = currency_code.strip().upper() if currency_code else None
+        self.timezone = timezone.strip() if timezone else None
+        self.population_min = population_min
+        self.population_max = population_max
+
+    @classmethod
+    def from_input(cls, data):
+        """Criteria from a CountryFilter input, or None when nothing is filtered."""
+        if not data:
+            return None
+        criteria = cls(**{key: data.get(key) for key in TERM_FIELDS + ('population_min', 'population_max')})
+        return criteria if criteria else None
+
+    def terms(self):
+        return [(field, getattr(self, field)) for field in TERM_FIELDS if getattr(self, field) is not None]
+
+    def __bool__(self):
+        return bool(self.terms()) or self.population_min is not None or self.population_max is not None
+
+
+def language_codes(languages):
+    """Codes a country's `languages` value can be found by: iso639_1/iso639_2, or the keys of a mapping."""
+    if isinstance(languages, dict):
+        return set(languages)
+    codes = set()
+    for item in languages or ():
+        if isinstance(item, dict):
+            codes.update(item[key] for key in ('iso639_1', 'iso639_2') if item.get(key))
+        elif isinstance(item, str):
+            codes.add(item)
+    return codes
+
+
+def currency_codes(currencies):
+    if isinstance(currencies, dict):
+        return set(currencies)
+    codes = set()
+    for item in currencies or ():
+        if isinstance(item, dict):
+            if item.get('code'):
+                codes.add(item['code'])
+        elif isinstance(item, str):
+            codes.add(item)
+    return codes
+
+
+def timezone_values(timezones):
+    return {tz for tz in timezones or () if isinstance(tz, str)}
+
+
+def _values(country, field):
+    if field == 'language_code':
+        return language_codes(country.languages)
+    if field == 'currency_code':
+        return currency_codes(country.currencies)
+    if field == 'timezone':
+        return timezone_values(country.timezones)
+    value = getattr(country, field)
+    return {value} if value is not None else set()
+
+
+class FilterIndex:
+    """Inverted index over a sequence of Country objects; positions refer to that sequence."""
+
+    def __init__(self, countries):
+        self.size = len(countries)
+        postings = {}
+        by_population = []
+        for i, c in enumerate(countries):
+            for field in TERM_FIELDS:
+                for value in _values(c, field):
+                    postings.setdefault((field, value), []).append(i)
+            if c.population is not None:
+                by_population.append((c.population, i))
+        by_population.sort()
+        self._postings = postings
+        self._populations = [p for p, _ in by_population]
+        self._by_population = [i for _, i in by_population]
+
+    def positions(self, criteria):
+        """Ascending positions of the countries matching every criterion."""
+        candidates = [self._postings.get(term, ()) for term in criteria.terms()]
+        if criteria.population_min is not None or criteria.population_max is not None:
+            lo = 0 if criteria.population_min is None else bisect_left(self._populations, criteria.population_min)
+            hi = len(self._populations) if criteria.population_max is None else bisect_right(self._populations, criteria.population_max)
+            candidates.append(self._by_population[lo:hi])
+        if not candidates:
+            return list(range(self.size))
+        # intersect starting from the most selective list
+        candidates.sort(key=len)
+        matched = set(candidates[0])
+        for other in candidates[1:]:
+            if not matched:
+                break
+            matched.intersection_update(other)
+        return sorted(matched)
+
+
+def _jsonb(value):
+    return cast(json.dumps(value), JSONB)
+
+
+def _postgres_json_conditions(criteria):
+    conditions = []
+    if criteria.language_code is not None:
+        code = criteria.language_code
+        conditions.append(or_(
+            CountryModel.languages.op('@>')(_jsonb([{'iso639_1': code}])),
+            CountryModel.languages.op('@>')(_jsonb([{'iso639_2': code}])),
+            CountryModel.languages.op('?')(code),
+        ))
+    if criteria.currency_code is not None:
+        code = criteria.currency_code
+        conditions.append(or_(
+            CountryModel.currencies.op('@>')(_jsonb([{'code': code}])),
+            CountryModel.currencies.op('?')(code),
+        ))
+    if criteria.timezone is not None:
+        conditions.append(CountryModel.timezones.op('@>')(_jsonb([criteria.timezone])))
+    return conditions
+
+
+def _json_each_has(column, value, keys=()):
+    """EXISTS over json_each(column): a string element, a mapping key, or one of `keys` of an object element."""
+    each = func.json_each(column).table_valued('key', 'value', 'type')
+    matches = [and_(each.c.type == 'text', each.c.value == value), each.c.key == value]
+    for key in keys:
+        # json_extract() only on objects: a plain string element is not valid JSON
+        matches.append(case((each.c.type == 'object', func.json_extract(each.c.value, f'$.{key}'))) == value)
+    return exists(select(literal(1)).select_from(each).where(or_(*matches)))
+
+
+def _sqlite_json_conditions(criteria):
+    conditions = []
+    if criteria.language_code is not None:
+        conditions.append(_json_each_has(CountryModel.languages, criteria.language_code, ('iso639_1', 'iso639_2')))
+    if criteria.currency_code is not None:
+        conditions.append(_json_each_has(CountryModel.currencies, criteria.currency_code, ('code',)))
+    if criteria.timezone is not None:
+        conditions.append(_json_each_has(CountryModel.timezones, criteria.timezone))
+    return conditions
+
+
+def conditions(db, criteria):
+    """WHERE clauses for `criteria` on the countries table of `db`'s database."""
+    if not criteria:
+        return []
+    clauses = []
+    if criteria.region is not None:
+        clauses.append(CountryModel.region == criteria.region)
+    if criteria.subregion is not None:
+        clauses.append(CountryModel.subregion == criteria.subregion)
+    if criteria.population_min is not None:
+        clauses.append(CountryModel.population >= criteria.population_min)
+    if criteria.population_max is not None:
+        clauses.append(CountryModel.population <= criteria.population_max)
+    if db.get_bind().dialect.name == 'postgresql':
+        clauses.extend(_postgres_json_conditions(criteria))
+    else:
+        clauses.extend(_sqlite_json_conditions(criteria))
+    return clauses
@@ -0,0 +1,159 @@
+"""
+Geometry helpers for the `countriesNear` query.
+
+`SpatialIndex` is a 3-d k-d tree over points on the unit sphere. Straight-line
+(chord) distance between two unit vectors grows monotonically with great-circle
+distance, so radius and k-nearest searches can prune on the tree and only the
+surviving candidates need the exact Haversine distance.
+"""
+
+import math
+import heapq
+
+EARTH_KM = 6371.0
+# great-circle km per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_KM / 180.0
+# half the earth's circumference: every point is within this distance
+MAX_DISTANCE_KM = math.pi * EARTH_KM
+# sphere radius of Postgres' earth() (earthdistance), which ll_to_earth and earth_box use
+PG_EARTH_KM = 6378.168
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; same formula the SQL path uses."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat1 - lat2
+    dlon = lon1 - lon2
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat2) * math.cos(lat1) * math.sin(dlon / 2) ** 2
+    return EARTH_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def earth_box_meters(radius_km):
+    """earth_box() radius covering `radius_km` of our Haversine distance.
+
+    earth_box measures on the larger earth() sphere, so the same distance spans a
+    smaller angle there; scaling keeps the angle, and the box, the same.
+    """
+    return radius_km * 1000.0 * PG_EARTH_KM / EARTH_KM
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Lat/lon box that contains every point within `radius_km`.
+
+    Returns (min_lat, max_lat, lon_ranges). `lon_ranges` is a list of
+    (min_lon, max_lon) pairs: two when the box wraps the antimeridian, and
+    None when the circle reaches a pole and every longitude qualifies.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat = latitude - dlat
+    max_lat = latitude + dlat
+    if min_lat <= -90.0 or max_lat >= 90.0 or radius_km >= MAX_DISTANCE_KM:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None
+    # widest longitude span of the circle, reached where it is tangent to a meridian
+    ratio = math.sin(radius_km / EARTH_KM) / math.cos(math.radians(latitude))
+    if ratio >= 1.0:
+        return min_lat, max_lat, None
+    dlon = math.degrees(math.asin(ratio))
+    min_lon = longitude - dlon
+    max_lon = longitude + dlon
+    if min_lon < -180.0:
+        return min_lat, max_lat, [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+    if max_lon > 180.0:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def _to_xyz(latitude, longitude):
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _chord(radius_km):
+    """Chord length on the unit sphere for a great-circle distance in km."""
+    return 2.0 * math.sin(min(radius_km / EARTH_KM, math.pi) / 2.0)
+
+
+class SpatialIndex:
+    """Immutable k-d tree over (latitude, longitude, item) triples."""
+
+    def __init__(self, points):
+        nodes = [(_to_xyz(lat, lon), lat, lon, item) for lat, lon, item in points]
+        self._size = len(nodes)
+        self._root = self._build(nodes, 0)
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def _build(cls, nodes, depth):
+        if not nodes:
+            return None
+        axis = depth % 3
+        nodes.sort(key=lambda n: n[0][axis])
+        mid = len(nodes) // 2
+        return (nodes[mid], axis, cls._build(nodes[:mid], depth + 1), cls._build(nodes[mid + 1:], depth + 1))
+
+    def within(self, latitude, longitude, radius_km):
+        """All items within `radius_km`, as (distance_km, item) sorted by distance."""
+        if radius_km < 0:
+            return []
+        target = _to_xyz(latitude, longitude)
+        # pad the chord radius so rounding never prunes a point sitting on the boundary
+        reach = _chord(radius_km) + 1e-9
+        reach_sq = reach * reach
+        hits = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            (xyz, lat, lon, item), axis, left, right = node
+            dx = xyz[0] - target[0]
+            dy = xyz[1] - target[1]
+            dz = xyz[2] - target[2]
+            if dx * dx + dy * dy + dz * dz <= reach_sq:
+                distance = haversine_km(lat, lon, latitude, longitude)
+                if distance <= radius_km:
+                    hits.append((distance, item))
+            diff = target[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append(near)
+            if abs(diff) <= reach:
+                stack.append(far)
+        hits.sort(key=lambda h: h[0])
+        return hits
+
+    def nearest(self, latitude, longitude, k):
+        """The `k` closest items, as (distance_km, item) sorted by distance."""
+        if k <= 0 or self._root is None:
+            return []
+        target = _to_xyz(latitude, longitude)
+        # max-heap of the best k so far, keyed on negative squared chord distance
+        best = []
+        counter = 0
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, axis, left, right = node
+            xyz = point[0]
+            dx = xyz[0] - target[0]
+            dy = xyz[1] - target[1]
+            dz = xyz[2] - target[2]
+            dist_sq = dx * dx + dy * dy + dz * dz
+            counter += 1
+            if len(best) < k:
+                heapq.heappush(best, (-dist_sq, counter, point))
+            elif dist_sq < -best[0][0]:
+                heapq.heapreplace(best, (-dist_sq, counter, point))
+            diff = target[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # visit the near side last so it is popped first and tightens the bound early
+            if len(best) < k or diff * diff < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        hits = [(haversine_km(lat, lon, latitude, longitude), item) for _, _, (_, lat, lon, item) in best]
+        hits.sort(key=lambda h: h[0])
+        return hits
@@ -0,0 +1,251 @@
+"""
+GraphQL HTTP view for the country API.
+
+On top of Flask-GraphQL's `GraphQLView` this adds:
+- an LRU cache of parsed *and validated* documents keyed by the query's sha256,
+  so the handful of documents the frontend sends are parsed and validated once
+  per process instead of on every request;
+- Apollo-style automatic persisted queries: a client may send only
+  `extensions.persistedQuery.sha256Hash`; the first time it sends the full query
+  alongside the hash the server stores it. Hash-only requests also work over GET,
+  so read queries can be cached by HTTP caches;
+- query limits from `cost`: depth and alias limits run with validation, and each
+  operation is priced with its variables before it executes. Operations over
+  budget are rejected with a 400; every response carries the computed cost in
+  `extensions.cost`;
+- opt-in profiling of single requests (see `profiling`).
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
+
+import redis
+from flask import Response, request
+from flask_graphql import GraphQLView
+from graphql import parse, validate
+from graphql.validation.rules import specified_rules
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql_server import HttpQueryError
+from promise import Promise, is_thenable
+from rx import Observable
+
+import cost
+import metrics
+import profiling
+
+logger = logging.getLogger("graphql_view")
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+DOCUMENT_CACHE_SIZE = int(os.getenv('GRAPHQL_DOCUMENT_CACHE_SIZE', '512'))
+PERSISTED_QUERY_CACHE_SIZE = int(os.getenv('PERSISTED_QUERY_CACHE_SIZE', '2048'))
+PERSISTED_QUERY_TTL = int(os.getenv('PERSISTED_QUERY_TTL', str(7 * 24 * 3600)))
+# Cache-Control max-age for successful GET responses; 0 leaves the header off
+GRAPHQL_GET_MAX_AGE = int(os.getenv('GRAPHQL_GET_MAX_AGE', '0'))
+
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+class ExtendedExecutionResult(ExecutionResult):
+    """ExecutionResult whose `extensions` are part of the response body."""
+
+    __slots__ = ()
+
+    def to_dict(self, format_error=None, dict_class=OrderedDict):
+        response = super().to_dict(format_error, dict_class)
+        if self.extensions:
+            response['extensions'] = self.extensions
+        return response
+
+
+def _with_extensions(result, extensions):
+    if isinstance(result, Observable):
+        # a subscription's stream of results has nowhere to carry extensions
+        return result
+    if is_thenable(result):
+        return Promise.resolve(result).then(lambda value: _with_extensions(value, extensions))
+    return ExtendedExecutionResult(
+        result.data, result.errors, result.invalid, dict(result.extensions or {}, **extensions)
+    )
+
+
+def _invalid_document(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+def _execute_document(schema, document_ast, *args, **kwargs):
+    report = cost.analyze(schema, document_ast, kwargs.get('operation_name'), kwargs.get('variable_values'))
+    if report is not None and report.errors:
+        return ExtendedExecutionResult(errors=report.errors, invalid=True, extensions=report.extensions())
+
+    operation = get_operation_ast(document_ast, kwargs.get('operation_name'))
+    operation_type = operation.operation if operation else 'unknown'
+    operation_name = operation.name.value if operation and operation.name else 'anonymous'
+    execute_fn = partial(
+        metrics.timed_operation, partial(execute, schema, document_ast, *args, **kwargs), operation_type,
+        metrics.operation_label(operation_name),
+    )
+    extensions = report.extensions() if report is not None else {}
+    mode = profiling.requested()
+    if mode is None:
+        result = execute_fn()
+    else:
+        result, summary = profiling.run(execute_fn, operation_name)
+        if mode == 'header':
+            extensions['profile'] = summary
+    return _with_extensions(result, extensions) if extensions else result
+
+
+class CachedDocumentBackend(GraphQLBackend):
+    """graphql-core backend that parses and validates each distinct document once.
+
+    Validation only depends on the schema and the document, so the outcome is
+    cached with it; invalid documents keep returning their validation errors.
+    Syntax errors are raised as usual and never cached. Cost limits depend on
+    the variables too, so they are checked on every execution.
+    """
+
+    def __init__(self, max_size=DOCUMENT_CACHE_SIZE):
+        self._cache = LRUCache(max_size)
+
+    def document_from_string(self, schema, document_string):
+        key = (id(schema), query_hash(document_string))
+        document = self._cache.get(key)
+        if document is None:
+            document_ast = parse(document_string)
+            errors = validate(schema, document_ast, specified_rules + cost.VALIDATION_RULES)
+            run = partial(_invalid_document, errors) if errors else partial(_execute_document, schema, document_ast)
+            document = GraphQLDocument(schema, document_string, document_ast, run)
+            self._cache.put(key, document)
+        return document
+
+
+class PersistedQueryStore:
+    """sha256 -> query text, kept in a local LRU and shared between workers through Redis."""
+
+    def __init__(self, url=REDIS_URL, max_size=PERSISTED_QUERY_CACHE_SIZE, ttl=PERSISTED_QUERY_TTL):
+        self._local = LRUCache(max_size)
+        self._url = url
+        self._ttl = ttl
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None and self._url:
+            self._redis = redis.from_url(self._url, socket_connect_timeout=1, socket_timeout=1, decode_responses=True)
+        return self._redis
+
+    def get(self, sha256_hash):
+        query = self._local.get(sha256_hash)
+        if query is None:
+            try:
+                client = self._client()
+                query = client.get(f'apq:{sha256_hash}') if client else None
+            except Exception:
+                logger.warning("Persisted query lookup in Redis failed", exc_info=True)
+                query = None
+            if query is not None:
+                self._local.put(sha256_hash, query)
+        return query
+
+    def put(self, sha256_hash, query):
+        self._local.put(sha256_hash, query)
+        try:
+            client = self._client()
+            if client:
+                client.set(f'apq:{sha256_hash}', query, ex=self._ttl)
+        except Exception:
+            # this worker still has it; others will ask the client to resend
+            logger.warning("Could not store persisted query in Redis", exc_info=True)
+
+
+def resolve_persisted_query(store, data, query_data):
+    """Fill in `query` for an APQ request, registering new hashes as they arrive."""
+    extensions = data.get('extensions') or query_data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpQueryError(400, "Extensions are invalid JSON.")
+    persisted = (extensions or {}).get('persistedQuery')
+    if not persisted:
+        return data
+    if persisted.get('version') != 1:
+        raise HttpQueryError(400, "Unsupported persisted query version.")
+    sha256_hash = persisted.get('sha256Hash')
+    if not isinstance(sha256_hash, str):
+        raise HttpQueryError(400, "Persisted query is missing sha256Hash.")
+
+    query = data.get('query') or query_data.get('query')
+    if query:
+        if query_hash(query) != sha256_hash:
+            raise HttpQueryError(400, "Provided sha256Hash does not match query.")
+        store.put(sha256_hash, query)
+        return data
+
+    query = store.get(sha256_hash)
+    if query is None:
+        # Apollo clients retry with the full query when they see this
+        raise HttpQueryError(200, PERSISTED_QUERY_NOT_FOUND, headers={'Cache-Control': 'no-store'})
+    data = dict(data)
+    data['query'] = query
+    return data
+
+
+class CountryGraphQLView(GraphQLView):
+    persisted_queries = None
+    get_max_age = GRAPHQL_GET_MAX_AGE
+
+    def parse_body(self):
+        data = super().parse_body()
+        if self.persisted_queries is None or isinstance(data, list):
+            return data
+        return resolve_persisted_query(self.persisted_queries, data, request.args)
+
+    def dispatch_request(self):
+        token = profiling.request(request.headers)
+        try:
+            response = super().dispatch_request()
+        finally:
+            profiling.end_request(token)
+        # GraphiQL renders to a plain string; only JSON responses get the header
+        if (request.method == 'GET' and self.get_max_age and isinstance(response, Response)
+                and response.status_code == 200 and response.mimetype == 'application/json' and 'Cache-Control' not in response.headers):
+            response.headers['Cache-Control'] = f'public, max-age={self.get_max_age}'
+        return response
@@ -0,0 +1,364 @@
+"""
+Bulk import of country/territory files (CSV or NDJSON) into `countries`.
+
+1. The file is streamed record by record; each record is mapped to columns
+   (external-API field names such as `alpha2Code`/`latlng`, or our own column
+   names as written by GET /export) and validated in Python. Bad lines are
+   reported and left out.
+2. Valid rows go into a staging table created for this import inside the
+   import's transaction: an UNLOGGED table loaded with `COPY ... FROM STDIN` on
+   PostgreSQL, a TEMP table loaded with executemany elsewhere (SQLite).
+3. Rows that would break the alpha3 unique constraint are reported and dropped,
+   then a single `INSERT ... SELECT ... ON CONFLICT (alpha2_code) DO UPDATE`
+   merges the first row per alpha2 code into `countries` with the same rules as
+   `tasks.ingest_countries` (`bulk.on_conflict_external`): new codes are
+   inserted as source='external', external rows are refreshed without blanking
+   columns, manual rows are never touched.
+
+The staging table is dropped before the commit, or disappears with the rollback.
+
+    python importer.py countries.csv
+    python importer.py territories.ndjson.gz --queue   # run on a Celery worker
+"""
+
+import io
+import os
+import csv
+import gzip
+import json
+import uuid
+import logging
+import itertools
+
+from sqlalchemy import Column, Index, Integer, MetaData, Table, and_, func, literal, or_, select
+
+from bulk import insert_for, on_conflict_external, row_from_api
+from models import Country as CountryModel, normalize_name
+import region_stats
+import changes
+
+logger = logging.getLogger("country_import")
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '5000'))
+# problems listed in the result; the counts cover all of them
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ('csv', 'ndjson')
+JSON_COLUMNS = ('timezones', 'currencies', 'languages')
+STAGED_COLUMNS = (
+    'id', 'name', 'name_normalized', 'alpha2_code', 'alpha3_code', 'capital', 'region', 'subregion',
+    'population', 'area_km2', 'latitude', 'longitude', 'timezones', 'currencies', 'languages', 'flag_url',
+)
+MERGED_COLUMNS = STAGED_COLUMNS + ('source',)
+
+_dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+
+def detect_format(path):
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    raise ValueError(f"Can't tell the format of {path}; pass csv or ndjson explicitly")
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def iter_records(fp, fmt):
+    """(line number, raw record dict or error message) for each record in `fp`."""
+    if fmt == 'csv':
+        reader = csv.DictReader(fp)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, "invalid JSON"
+                continue
+            yield line_no, record if isinstance(record, dict) else "expected a JSON object"
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'; use one of {', '.join(FORMATS)}")
+
+
+def clean_record(record):
+    """(column values, problems) for one raw record; values is None if it can't be imported."""
+    if 'alpha2Code' in record:
+        row = row_from_api(record) or {'alpha2_code': None}
+    else:
+        row = {col: record.get(col) for col in STAGED_COLUMNS if col not in ('id', 'name_normalized')}
+    for key, value in row.items():
+        if isinstance(value, str):
+            row[key] = value.strip() or None
+
+    problems = []
+    if not row.get('name'):
+        problems.append("name must not be empty")
+    alpha2_code = (row.get('alpha2_code') or '').upper()
+    if len(alpha2_code) != 2 or not alpha2_code.isalpha():
+        problems.append("alpha2_code must be two letters")
+    row['alpha2_code'] = alpha2_code
+    if row.get('alpha3_code') is not None:
+        row['alpha3_code'] = str(row['alpha3_code']).upper()
+        if len(row['alpha3_code']) != 3 or not row['alpha3_code'].isalpha():
+            problems.append("alpha3_code must be three letters")
+
+    for col, kind in (('population', int), ('area_km2', float), ('latitude', float), ('longitude', float)):
+        if row.get(col) is not None:
+            try:
+                row[col] = kind(float(row[col])) if kind is int else kind(row[col])
+            except (TypeError, ValueError):
+                problems.append(f"{col} must be a number")
+                row[col] = None
+    if row.get('population') is not None and row['population'] < 0:
+        problems.append("population must not be negative")
+    if row.get('latitude') is not None and not -90 <= row['latitude'] <= 90:
+        problems.append("latitude must be between -90 and 90")
+    if row.get('longitude') is not None and not -180 <= row['longitude'] <= 180:
+        problems.append("longitude must be between -180 and 180")
+    for col in JSON_COLUMNS:
+        # CSV cells (and our own CSV export) carry JSON as text
+        if isinstance(row.get(col), str):
+            try:
+                row[col] = json.loads(row[col])
+            except ValueError:
+                problems.append(f"{col} must be JSON")
+
+    if problems:
+        return None, problems
+    if not row.get('name_normalized'):
+        row['name_normalized'] = normalize_name(row['name'])
+    row['id'] = uuid.uuid4()
+    return row, []
+
+
+def staging_table(name, dialect_name):
+    """Staging table shaped like the imported columns of `countries`, plus the source line."""
+    countries = CountryModel.__table__
+    prefixes = ['UNLOGGED'] if dialect_name == 'postgresql' else ['TEMPORARY']
+    return Table(
+        name, MetaData(),
+        Column('line_no', Integer, primary_key=True),
+        *[Column(col, countries.c[col].type) for col in STAGED_COLUMNS],
+        # for picking the first line per code and the alpha3 checks
+        Index(f'ix_{name}_alpha2', 'alpha2_code', 'line_no'),
+        Index(f'ix_{name}_alpha3', 'alpha3_code', 'line_no'),
+        prefixes=prefixes,
+    )
+
+
+class _CopyReader(io.TextIOBase):
+    """File-like view of an iterator of CSV lines, read by psycopg2's copy_expert."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buf = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            chunk = ''.join(itertools.islice(self._lines, 1000))
+            if not chunk:
+                break
+            self._buf += chunk
+        if size < 0:
+            data, self._buf = self._buf, ''
+        else:
+            data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def staged_values(line_no, row):
+    """The staging tuple for a cleaned row: JSON columns as text and the id as a string.
+
+    Both loaders hand these straight to the driver, so no per-row SQLAlchemy
+    type processing is paid for the bulk of the file.
+    """
+    values = [line_no]
+    for col in STAGED_COLUMNS:
+        value = row.get(col)
+        if value is not None and col in JSON_COLUMNS:
+            value = _dumps(value)
+        values.append(value)
+    values[1] = str(values[1])
+    return tuple(values)
+
+
+def _copy_lines(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for values in rows:
+        writer.writerow(values)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _load_copy(conn, staging, rows):
+    columns = ', '.join(('line_no',) + STAGED_COLUMNS)
+    cursor = conn.connection.cursor()
+    try:
+        # unquoted empty fields are NULL in CSV mode; empty strings were already turned into None
+        cursor.copy_expert(f"COPY {staging.name} ({columns}) FROM STDIN WITH (FORMAT csv)", _CopyReader(_copy_lines(rows)))
+    finally:
+        cursor.close()
+
+
+def _load_executemany(conn, staging, rows, batch_size):
+    sql = str(staging.insert().compile(dialect=conn.dialect))
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        conn.exec_driver_sql(sql, batch)
+
+
+def _alpha3_conflict(staging):
+    """Staged rows whose alpha3 code belongs to another country, or to an earlier line for another alpha2."""
+    countries = CountryModel.__table__
+    other = staging.alias('other')
+    taken = select(countries.c.id).where(
+        countries.c.alpha3_code == staging.c.alpha3_code, countries.c.alpha2_code != staging.c.alpha2_code,
+    ).exists()
+    # the first line using an alpha3 code keeps it; one index probe per row
+    first_holder = select(other.c.alpha2_code).where(
+        other.c.alpha3_code == staging.c.alpha3_code,
+    ).order_by(other.c.line_no).limit(1).scalar_subquery()
+    return and_(staging.c.alpha3_code.isnot(None), or_(taken, staging.c.alpha2_code != first_holder))
+
+
+def import_rows(db, records, batch_size=None):
+    """Validate, stage and merge (line number, record) pairs; the caller owns the transaction.
+
+    Returns counts of inserted/updated/protected/duplicate/invalid rows and the
+    first MAX_REPORTED_ERRORS problems as "line N: ..." strings.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    conn = db.connection()
+    dialect = conn.dialect.name
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'protected': 0, 'duplicate': 0, 'invalid': 0}
+    errors = []
+
+    def report(line_no, problem):
+        stats['invalid'] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f"line {line_no}: {problem}")
+
+    def valid_rows():
+        for line_no, record in records:
+            stats['rows'] += 1
+            if isinstance(record, str):
+                report(line_no, record)
+                continue
+            row, problems = clean_record(record)
+            if problems:
+                report(line_no, '; '.join(problems))
+                continue
+            yield staged_values(line_no, row)
+
+    staging = staging_table(f"country_import_{uuid.uuid4().hex[:12]}", dialect)
+    staging.create(conn)
+    if dialect == 'postgresql':
+        _load_copy(conn, staging, valid_rows())
+    else:
+        _load_executemany(conn, staging, valid_rows(), batch_size)
+
+    conflict = _alpha3_conflict(staging)
+    conflicts = conn.execute(
+        select(staging.c.line_no, staging.c.alpha3_code).where(conflict).order_by(staging.c.line_no)
+    ).fetchall()
+    for line_no, alpha3_code in conflicts:
+        report(line_no, f"alpha3_code {alpha3_code} already belongs to another country")
+    if conflicts:
+        conn.execute(staging.delete().where(conflict))
+
+    # the first line wins for a code that appears more than once, as in ingestion
+    first_lines = select(func.min(staging.c.line_no)).group_by(staging.c.alpha2_code)
+    staged = conn.execute(select(func.count()).select_from(staging)).scalar()
+    countries = CountryModel.__table__
+    owners = conn.execute(
+        select(countries.c.source, func.count())
+        .select_from(staging.join(countries, countries.c.alpha2_code == staging.c.alpha2_code, isouter=True))
+        .where(staging.c.line_no.in_(first_lines))
+        .group_by(countries.c.source)
+    ).fetchall()
+    for source, count in owners:
+        key = 'inserted' if source is None else 'updated' if source == 'external' else 'protected'
+        stats[key] += count
+    stats['duplicate'] = staged - sum(count for _, count in owners)
+
+    # summary groups the merge can touch: where the rows are now, and where they are going
+    countries_in_file = countries.c.alpha2_code.in_(select(staging.c.alpha2_code))
+    touched = region_stats.groups_of(db, countries_in_file)
+    rows = select(*[staging.c[col] for col in STAGED_COLUMNS], literal('external')).where(
+        staging.c.line_no.in_(first_lines)
+    )
+    merge = insert_for(db)(countries).from_select(list(MERGED_COLUMNS), rows)
+    conn.execute(on_conflict_external(merge))
+    region_stats.refresh(db, touched | region_stats.groups_of(db, countries_in_file))
+    created, updated = set(), set()
+    changes.stamp(db, countries_in_file, created=created, updated=updated)
+    # sent by the tasks.relay_outbox beat task once the caller commits
+    changes.add_events(db, created, updated)
+    # on failure the rollback takes the staging table with it
+    staging.drop(conn)
+    logger.info("Imported countries: %s", stats)
+    return dict(stats, errors=errors)
+
+
+def import_file(db, path, fmt=None, batch_size=None):
+    """Import a .csv / .ndjson file (optionally .gz); the caller owns the transaction."""
+    fmt = fmt or detect_format(path)
+    with open_text(path) as fp:
+        return import_rows(db, iter_records(fp, fmt), batch_size)
+
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Import countries from a CSV or NDJSON file.")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS, help='defaults to the file extension')
+    parser.add_argument('--queue', action='store_true',
+                        help='run on a Celery worker (the path must be readable there)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.queue:
+        from tasks import import_countries_file
+        result = import_countries_file.delay(os.path.abspath(args.path), args.format)
+        print(f"Queued import task {result.id}")
+        return
+
+    import cache
+    from database import get_db_session
+    db = get_db_session()
+    started = time.perf_counter()
+    try:
+        stats = import_file(db, args.path, args.format)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if stats['inserted'] or stats['updated']:
+        cache.publish_invalidation()
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
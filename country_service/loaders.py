@@ -0,0 +1,93 @@
+"""
+Request-scoped DataLoaders.
+
+Every `load(key)` made while one GraphQL document executes is collected and
+resolved with a single `WHERE column IN (...)` query, and the result is memoized
+for the rest of that request. Loaders live on the request context (the Flask
+request for HTTP calls), so nothing is shared between requests.
+
+`ColumnLoader` is generic over model and column; `many=True` groups rows per key,
+which is what a one-to-many relationship field needs.
+"""
+
+from promise import Promise
+from promise.dataloader import DataLoader
+from sqlalchemy.orm import load_only
+
+from models import Country as CountryModel, normalize_name
+
+_CONTEXT_ATTR = '_dataloaders'
+
+
+class ColumnLoader(DataLoader):
+    """Batch-load `model` rows by the value of `column`.
+
+    `normalize` maps both the requested key and the stored value to the form
+    they are compared in; `expression` is the SQL equivalent applied to the column.
+    `columns` limits which attributes are loaded (the key column always is).
+    """
+
+    def __init__(self, session_factory, column, normalize=None, expression=None, many=False, columns=None):
+        super().__init__()
+        self.session_factory = session_factory
+        self.column = column
+        self.model = column.class_
+        self.normalize = normalize or (lambda value: value)
+        self.expression = expression if expression is not None else column
+        self.many = many
+        self.columns = None if columns is None else sorted(set(columns) | {column.key})
+
+    def load(self, key=None):
+        return super().load(self.normalize(key))
+
+    def batch_load_fn(self, keys):
+        db = self.session_factory()
+        q = db.query(self.model)
+        if self.columns is not None:
+            q = q.options(load_only(*[getattr(self.model, key) for key in self.columns]))
+        rows = q.filter(self.expression.in_(set(keys))).all()
+        found = {}
+        for row in rows:
+            key = self.normalize(getattr(row, self.column.key))
+            if self.many:
+                found.setdefault(key, []).append(row)
+            else:
+                found.setdefault(key, row)
+        default = [] if self.many else None
+        return Promise.resolve([found.get(key, default) for key in keys])
+
+
+def _upper(value):
+    return value.upper() if value else value
+
+
+COUNTRY_LOADERS = {
+    'country_by_alpha2': lambda sf, cols: ColumnLoader(sf, CountryModel.alpha2_code, normalize=_upper, columns=cols),
+    'country_by_alpha3': lambda sf, cols: ColumnLoader(sf, CountryModel.alpha3_code, normalize=_upper, columns=cols),
+    'country_by_name': lambda sf, cols: ColumnLoader(
+        sf, CountryModel.name_normalized, normalize=normalize_name, columns=cols
+    ),
+}
+
+
+def get_loader(context, name, session_factory, columns=None, factories=COUNTRY_LOADERS):
+    """Return the loader called `name` for this request, creating it on first use.
+
+    Loaders are per (name, columns): lookups that select the same fields share a
+    batch. Without a context (e.g. `schema.execute()` in a script) a fresh
+    loader is returned, which batches nothing across fields and memoizes nothing.
+    """
+    if context is None:
+        return factories[name](session_factory, columns)
+    if isinstance(context, dict):
+        registry = context.setdefault(_CONTEXT_ATTR, {})
+    else:
+        registry = getattr(context, _CONTEXT_ATTR, None)
+        if registry is None:
+            registry = {}
+            setattr(context, _CONTEXT_ATTR, registry)
+    key = (name, columns)
+    loader = registry.get(key)
+    if loader is None:
+        loader = registry[key] = factories[name](session_factory, columns)
+    return loader
@@ -0,0 +1,253 @@
+"""
+Prometheus metrics for the API, the Celery worker and ingestion.
+
+- GraphQL: operation latency (graphql_view wraps execution) and root resolver
+  latency (`ResolverTimingMiddleware`); nested fields are plain attribute reads.
+- SQL: statement latency and statements per HTTP request through engine events
+  (`instrument_engine`), plus connection-pool gauges read at scrape time.
+- Celery: task run time, queue latency (publish to start) and outcomes via signals.
+- Ingestion: run duration by outcome and rows by kind.
+
+Prefork Celery workers and multi-worker gunicorn need PROMETHEUS_MULTIPROC_DIR
+set (to an empty directory) so `render()` can aggregate every process.
+
+Operation names come from clients, so only names in GRAPHQL_METRIC_OPERATIONS
+(or, without that list, the first GRAPHQL_METRIC_MAX_OPERATIONS names a process
+sees) become label values; every other named operation is counted as "other".
+"""
+
+import os
+import time
+import threading
+import contextvars
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from graphql.execution.middleware import MiddlewareManager
+from promise import Promise, is_thenable
+from sqlalchemy import event
+
+# operation names allowed as label values (comma separated); empty means first come, first served
+METRIC_OPERATIONS = frozenset(filter(None, (
+    name.strip() for name in os.getenv('GRAPHQL_METRIC_OPERATIONS', '').split(',')
+)))
+METRIC_MAX_OPERATIONS = int(os.getenv('GRAPHQL_METRIC_MAX_OPERATIONS', '50'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+GRAPHQL_OPERATION_SECONDS = Histogram(
+    'graphql_operation_duration_seconds', 'GraphQL document execution time',
+    ['operation_type', 'operation_name'], buckets=LATENCY_BUCKETS,
+)
+GRAPHQL_RESOLVER_SECONDS = Histogram(
+    'graphql_resolver_duration_seconds', 'Root field resolver time',
+    ['parent_type', 'field'], buckets=LATENCY_BUCKETS,
+)
+SQL_STATEMENT_SECONDS = Histogram(
+    'db_statement_duration_seconds', 'SQL statement execution time', buckets=LATENCY_BUCKETS,
+)
+SQL_STATEMENTS_PER_REQUEST = Histogram(
+    'db_statements_per_request', 'SQL statements issued while serving one HTTP request',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_POOL_CHECKOUTS = Counter('db_pool_checkouts_total', 'Connections checked out of the pool')
+CELERY_TASK_SECONDS = Histogram(
+    'celery_task_duration_seconds', 'Celery task run time', ['task'], buckets=LATENCY_BUCKETS + (30.0, 60.0, 300.0),
+)
+CELERY_QUEUE_SECONDS = Histogram(
+    'celery_task_queue_latency_seconds', 'Time from publishing a task to a worker starting it', ['task'],
+    buckets=LATENCY_BUCKETS + (30.0, 60.0, 300.0),
+)
+CELERY_TASKS = Counter('celery_tasks_total', 'Finished Celery tasks', ['task', 'state'])
+INGEST_SECONDS = Histogram(
+    'ingest_duration_seconds', 'ingest_countries run time', ['outcome'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+INGEST_ROWS = Counter('ingest_rows_total', 'Rows seen by ingest_countries', ['kind'])
+
+# statements counted for the HTTP request running in this context
+_request_statements = contextvars.ContextVar('request_statements', default=None)
+
+
+def start_request():
+    """Begin counting SQL statements for the current request; returns a token for `finish_request`."""
+    return _request_statements.set([0])
+
+
+def finish_request(token):
+    counter = _request_statements.get()
+    _request_statements.reset(token)
+    if counter is not None:
+        SQL_STATEMENTS_PER_REQUEST.observe(counter[0])
+
+
+_operation_names = set()
+_operation_names_lock = threading.Lock()
+
+
+def operation_label(name):
+    """Bounded label value for a client-chosen operation name."""
+    if name in ('anonymous', None):
+        return 'anonymous'
+    if METRIC_OPERATIONS:
+        return name if name in METRIC_OPERATIONS else 'other'
+    with _operation_names_lock:
+        if name in _operation_names:
+            return name
+        if len(_operation_names) < METRIC_MAX_OPERATIONS:
+            _operation_names.add(name)
+            return name
+    return 'other'
+
+
+class PoolCollector:
+    """Connection-pool gauges for every instrumented engine, read from the live pools at scrape time."""
+
+    def __init__(self):
+        self.engines = []
+
+    def collect(self):
+        gauges = []
+        for name, doc, method in (
+            ('db_pool_size', 'Configured pool size', 'size'),
+            ('db_pool_checked_out', 'Connections currently checked out', 'checkedout'),
+            ('db_pool_checked_in', 'Idle connections in the pool', 'checkedin'),
+            ('db_pool_overflow', 'Connections open beyond the pool size', 'overflow'),
+        ):
+            gauge = GaugeMetricFamily(name, doc, labels=['database'])
+            for engine in self.engines:
+                # not every pool class (e.g. SQLite's) implements all of these
+                read = getattr(engine.pool, method, None)
+                if callable(read):
+                    gauge.add_metric([engine.url.database or ''], read())
+            if gauge.samples:
+                gauges.append(gauge)
+        return gauges
+
+
+_instrumented = set()
+# one collector for all engines; registered on REGISTRY on first use, and on the
+# per-scrape registry in multiprocess mode (the gauges are this process's pools)
+_pool_collector = PoolCollector()
+
+
+def instrument_engine(engine, registry=REGISTRY):
+    """Attach statement timing/counting and pool metrics to `engine` (once)."""
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+        counter = _request_statements.get()
+        if counter is not None:
+            counter[0] += 1
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if starts:
+            SQL_STATEMENT_SECONDS.observe(time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine.pool, 'checkout')
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+
+    if not _pool_collector.engines:
+        registry.register(_pool_collector)
+    _pool_collector.engines.append(engine)
+
+
+def _observe_later(result, histogram, labels, started):
+    """Observe when `result` is done; async execution hands back a promise."""
+    def done(value):
+        histogram.labels(*labels).observe(time.perf_counter() - started)
+        return value
+
+    def failed(error):
+        histogram.labels(*labels).observe(time.perf_counter() - started)
+        raise error
+
+    if is_thenable(result):
+        return Promise.resolve(result).then(done, failed)
+    return done(result)
+
+
+def timed_operation(execute_fn, operation_type, operation_name):
+    """Run `execute_fn()` and record it under the operation's type and name."""
+    started = time.perf_counter()
+    try:
+        result = execute_fn()
+    except Exception:
+        GRAPHQL_OPERATION_SECONDS.labels(operation_type, operation_name).observe(time.perf_counter() - started)
+        raise
+    return _observe_later(result, GRAPHQL_OPERATION_SECONDS, (operation_type, operation_name), started)
+
+
+class ResolverTimingMiddleware:
+    """graphql-core middleware timing root-level resolvers; deeper fields pass straight through."""
+
+    def resolve(self, next_, root, info, **args):
+        if len(info.path) != 1:
+            return next_(root, info, **args)
+        started = time.perf_counter()
+        labels = (info.parent_type.name, info.field_name)
+        try:
+            result = next_(root, info, **args)
+        except Exception:
+            GRAPHQL_RESOLVER_SECONDS.labels(*labels).observe(time.perf_counter() - started)
+            raise
+        return _observe_later(result, GRAPHQL_RESOLVER_SECONDS, labels, started)
+
+
+def resolver_middleware():
+    """Middleware for `execute()`; results are not wrapped in promises, which would tax every field."""
+    return MiddlewareManager(ResolverTimingMiddleware(), wrap_in_promise=False)
+
+
+def connect_celery_signals():
+    """Task latency and outcome metrics for the worker; call once from celery_app."""
+    from celery.signals import before_task_publish, task_prerun, task_postrun
+
+    @before_task_publish.connect(weak=False)
+    def _stamp(headers=None, **kwargs):
+        if headers is not None:
+            headers['published_at'] = time.time()
+
+    @task_prerun.connect(weak=False)
+    def _start(task=None, **kwargs):
+        task.request._metrics_started = time.perf_counter()
+        published_at = getattr(task.request, 'published_at', None)
+        if published_at:
+            CELERY_QUEUE_SECONDS.labels(task.name).observe(max(0.0, time.time() - published_at))
+
+    @task_postrun.connect(weak=False)
+    def _finish(task=None, state=None, **kwargs):
+        started = getattr(task.request, '_metrics_started', None)
+        if started is not None:
+            CELERY_TASK_SECONDS.labels(task.name).observe(time.perf_counter() - started)
+        CELERY_TASKS.labels(task.name, state or 'UNKNOWN').inc()
+
+
+def registry_for_scrape():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # live pool gauges cannot go through the multiprocess files
+        registry.register(_pool_collector)
+        return registry
+    return REGISTRY
+
+
+def render():
+    """(body, content type) for a /metrics response."""
+    return generate_latest(registry_for_scrape()), CONTENT_TYPE_LATEST
+
+
+def start_worker_server(port):
+    """Serve /metrics from a Celery worker on `port`."""
+    from prometheus_client import start_http_server
+    start_http_server(port, registry=registry_for_scrape())
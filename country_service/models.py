@@ -1,7 +1,9 @@
 import uuid
-from sqlalchemy import Column, String, Integer, Float, JSON, DateTime, func
+import unicodedata
+from sqlalchemy import Column, String, Integer, BigInteger, Float, JSON, DateTime, Index, DDL, event, func
+from sqlalchemy.orm import validates
 from sqlalchemy.types import TypeDecorator, CHAR
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from database import Base
 
 class GUID(TypeDecorator):
@@ -36,27 +38,53 @@ class GUID(TypeDecorator):
                 return uuid.UUID(value)
             return value
 
+# JSONB on PostgreSQL so the filter columns can carry GIN indexes (see filters.py)
+IndexableJSON = JSON().with_variant(JSONB(), 'postgresql')
+
+def normalize_name(value):
+    """Form names are compared in: accents stripped, casefolded, whitespace collapsed."""
+    if value is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', value)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
 class Country(Base):
     __tablename__ = 'countries'
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False, index=True)
+    # kept in sync with `name` by `_sync_name_normalized`; see normalize_name()
+    name_normalized = Column(String, index=True)
     alpha2_code = Column(String(2), unique=True, index=True)
     alpha3_code = Column(String(3), unique=True, index=True)
     capital = Column(String)
     region = Column(String)
-    subregion = Column(String)
-    population = Column(Integer)
+    subregion = Column(String, index=True)
+    population = Column(Integer, index=True)
     area_km2 = Column(Float)
     latitude = Column(Float, index=True)
     longitude = Column(Float, index=True)
-    timezones = Column(JSON)
-    currencies = Column(JSON)
-    languages = Column(JSON)
+    timezones = Column(IndexableJSON)
+    currencies = Column(IndexableJSON)
+    languages = Column(IndexableJSON)
     flag_url = Column(String)
     source = Column(String, nullable=False, default='external')
     synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # bumped by changes.stamp() only when content_hash changes; countriesChangedSince pages on it
+    change_seq = Column(BigInteger, index=True)
+    content_hash = Column(String(64))
+
+    __table_args__ = (
+        # region_stats.refresh() re-aggregates one (region, subregion) group at a time
+        Index('ix_countries_region_subregion', 'region', 'subregion'),
+    )
+
+    @validates('name')
+    def _sync_name_normalized(self, key, value):
+        self.name_normalized = normalize_name(value)
+        return value
 
     def to_dict(self):
         return {
@@ -77,3 +105,98 @@ class Country(Base):
             'flag_url': self.flag_url,
             'source': self.source,
         }
+
+class IngestState(Base):
+    """What we last saw from an upstream feed, so unchanged payloads can be skipped."""
+    __tablename__ = 'ingest_state'
+    source_url = Column(String, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)
+    content_hash = Column(String(64))
+    checked_at = Column(DateTime(timezone=True))
+    changed_at = Column(DateTime(timezone=True))
+
+class RegionStat(Base):
+    """Precomputed totals for one (region, subregion); maintained by region_stats.refresh()."""
+    __tablename__ = 'region_stats'
+    # '' for countries without a region / subregion
+    region = Column(String, primary_key=True)
+    subregion = Column(String, primary_key=True)
+    country_count = Column(Integer, nullable=False)
+    population = Column(BigInteger, nullable=False)
+    area_km2 = Column(Float, nullable=False)
+    # the most populous countries: [{name, alpha2_code, population, area_km2}]
+    top_countries = Column(JSON, nullable=False)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ChangeCounter(Base):
+    """Last change sequence handed out; its row lock orders concurrent writers by commit."""
+    __tablename__ = 'change_counter'
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class CountryTombstone(Base):
+    """A deleted country, written by the countries_tombstone trigger for delta sync clients."""
+    __tablename__ = 'country_tombstones'
+    id = Column(GUID(), primary_key=True)
+    alpha2_code = Column(String(2))
+    name = Column(String)
+    change_seq = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# deletes can come from anywhere (including plain SQL), so tombstones are written by the database
+TOMBSTONE_DDL = {
+    'postgresql': [
+        "INSERT INTO change_counter (name, value) VALUES ('countries', 0) ON CONFLICT DO NOTHING",
+        """
+        CREATE OR REPLACE FUNCTION countries_tombstone() RETURNS trigger AS $$
+        BEGIN
+            UPDATE change_counter SET value = value + 1 WHERE name = 'countries';
+            INSERT INTO country_tombstones (id, alpha2_code, name, change_seq, deleted_at)
+            SELECT OLD.id, OLD.alpha2_code, OLD.name, value, now() FROM change_counter WHERE name = 'countries'
+            ON CONFLICT (id) DO UPDATE SET change_seq = EXCLUDED.change_seq, deleted_at = EXCLUDED.deleted_at;
+            RETURN OLD;
+        END $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS countries_tombstone ON countries",
+        "CREATE TRIGGER countries_tombstone AFTER DELETE ON countries "
+        "FOR EACH ROW EXECUTE FUNCTION countries_tombstone()",
+    ],
+    'sqlite': [
+        "INSERT OR IGNORE INTO change_counter (name, value) VALUES ('countries', 0)",
+        """
+        CREATE TRIGGER IF NOT EXISTS countries_tombstone AFTER DELETE ON countries
+        BEGIN
+            UPDATE change_counter SET value = value + 1 WHERE name = 'countries';
+            INSERT OR REPLACE INTO country_tombstones (id, alpha2_code, name, change_seq, deleted_at)
+            SELECT OLD.id, OLD.alpha2_code, OLD.name, value, CURRENT_TIMESTAMP FROM change_counter WHERE name = 'countries';
+        END
+        """,
+    ],
+}
+
+# keyset pages and `countries` order by (name COLLATE "C", id) on PostgreSQL; see pagination.name_order
+NAME_ORDER_INDEX_DDL = 'CREATE INDEX IF NOT EXISTS ix_countries_name_c_id ON countries (name COLLATE "C", id)'
+event.listen(Country.__table__, 'after_create', DDL(NAME_ORDER_INDEX_DDL).execute_if(dialect='postgresql'))
+
+for _dialect, _statements in TOMBSTONE_DDL.items():
+    for _statement in _statements:
+        # after every table exists, so init_db() and the tests get the trigger too
+        event.listen(Base.metadata, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+
+class OutboxEvent(Base):
+    """An event written in the same transaction as the change it describes; relayed to Redis by outbox.py."""
+    __tablename__ = 'outbox_events'
+    # SQLite only autoincrements INTEGER PRIMARY KEY
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    event = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String)
+
+    __table_args__ = (
+        # the relay only ever scans unsent rows in id order
+        Index('ix_outbox_events_unsent', 'id', postgresql_where=sent_at.is_(None), sqlite_where=sent_at.is_(None)),
+    )
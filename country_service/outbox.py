@@ -0,0 +1,102 @@
+"""
+Transactional outbox for country events.
+
+Mutations call `add_event()` inside the transaction that changes `countries`,
+so an event exists if and only if the change was committed. `relay()` then moves
+unsent rows to Redis: it locks a batch with `FOR UPDATE SKIP LOCKED` (so
+concurrent relays never send the same row), publishes the whole batch through
+one pipeline on the shared client from events.py, and stamps `sent_at`.
+
+The API relays the rows it just wrote right after its commit; the
+`tasks.relay_outbox` beat task sweeps up anything that could not be sent then.
+Delivery is at-least-once: a crash between publishing and committing `sent_at`
+re-sends that batch.
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+import events
+from models import OutboxEvent
+
+logger = logging.getLogger("country_outbox")
+
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+# sent rows are deleted after this many hours
+RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '24'))
+
+
+def add_event(db, event, **fields):
+    """Queue `{'event': event, **fields}` in the caller's transaction."""
+    row = OutboxEvent(event=event, payload=dict(fields, event=event), attempts=0)
+    db.add(row)
+    return row
+
+
+def relay(db, batch_size=None, ids=None, client=None):
+    """Publish one batch of unsent events (optionally only `ids`) and commit; returns how many were sent."""
+    q = db.query(OutboxEvent).filter(OutboxEvent.sent_at.is_(None))
+    if ids is not None:
+        q = q.filter(OutboxEvent.id.in_(ids))
+    rows = q.order_by(OutboxEvent.id).limit(batch_size or BATCH_SIZE).with_for_update(skip_locked=True).all()
+    if not rows:
+        db.rollback()
+        return 0
+    try:
+        pipe = (client if client is not None else events.get_client()).pipeline(transaction=False)
+        for row in rows:
+            events.publish_event(row.payload, client=pipe)
+        pipe.execute()
+    except Exception as e:
+        for row in rows:
+            row.attempts += 1
+            row.last_error = str(e)[:500]
+        db.commit()
+        raise
+    now = datetime.now(timezone.utc)
+    for row in rows:
+        row.sent_at = now
+        row.attempts += 1
+        row.last_error = None
+    db.commit()
+    return len(rows)
+
+
+def relay_all(db, batch_size=None, max_batches=50, client=None):
+    """Relay batches until the outbox is empty (or `max_batches` were sent)."""
+    sent = 0
+    for _ in range(max_batches):
+        n = relay(db, batch_size=batch_size, client=client)
+        sent += n
+        if n == 0:
+            break
+    return sent
+
+
+def relay_after_commit(db, ids):
+    """Best-effort immediate send of events this request just committed; the beat task retries failures."""
+    if not ids:
+        return 0
+    try:
+        return relay(db, ids=ids)
+    except Exception:
+        logger.warning("Outbox relay failed; %d event(s) left for the relay task", len(ids), exc_info=True)
+        db.rollback()
+        return 0
+
+
+def purge_sent(db, older_than_hours=None):
+    """Delete rows sent more than `older_than_hours` ago; returns how many."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours or RETENTION_HOURS)
+    deleted = db.query(OutboxEvent).filter(OutboxEvent.sent_at.isnot(None), OutboxEvent.sent_at < cutoff).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    return deleted
+
+
+def pending_count(db):
+    return db.query(func.count(OutboxEvent.id)).filter(OutboxEvent.sent_at.is_(None)).scalar()
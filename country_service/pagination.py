@@ -0,0 +1,124 @@
+"""
+Keyset (cursor) pagination over countries ordered by (name, id).
+
+Cursors are opaque base64 strings wrapping the (name, id) of a row. A page is
+found with a range predicate on `name` (served by its index) instead of an
+OFFSET, so deep pages cost the same as the first one and rows inserted by
+ingestion cannot shift a page that a client is already walking.
+
+Names are compared by code point everywhere: `sort_key` in Python, and
+`COLLATE "C"` on PostgreSQL (SQLite's default BINARY collation already does),
+so the snapshot and the database agree on the order and cursors work on both.
+The legacy `countries(limit, offset)` field uses the same order so an offset
+means the same rows on both paths; on PostgreSQL that moved it off the locale
+collation (lowercase and accented names now sort after "Z").
+"""
+
+import json
+import uuid
+import base64
+import binascii
+from bisect import bisect_left, bisect_right
+
+from sqlalchemy import and_, or_, exists
+
+from models import Country as CountryModel
+
+DEFAULT_PAGE_SIZE = 10
+
+
+def sort_key(country):
+    """The (name, id) pair rows are ordered and paged by."""
+    return (country.name or '', str(country.id))
+
+
+def name_order(db):
+    """`name` as the database must compare it to match `sort_key`."""
+    if db.get_bind().dialect.name == 'postgresql':
+        # UTF-8 byte order is code point order; served by ix_countries_name_c_id
+        return CountryModel.name.collate('C')
+    return CountryModel.name
+
+
+def encode_cursor(country):
+    raw = json.dumps(sort_key(country), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        name, ident = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(name, str):
+            raise ValueError(name)
+        ident = str(uuid.UUID(ident))
+    except (ValueError, TypeError, AttributeError, binascii.Error):
+        raise Exception(f"Invalid cursor '{cursor}'.")
+    return name, ident
+
+
+def check_args(first, last):
+    if first is not None and last is not None:
+        raise Exception("Pass either 'first' or 'last', not both.")
+    if (first is not None and first < 0) or (last is not None and last < 0):
+        raise Exception("'first' and 'last' must not be negative.")
+    if first is None and last is None:
+        first = DEFAULT_PAGE_SIZE
+    return first, last
+
+
+def page_sorted(countries, keys, first=None, after=None, last=None, before=None):
+    """Page an in-memory list already sorted by `sort_key`; `keys` are those sort keys.
+
+    Returns (rows, has_previous_page, has_next_page).
+    """
+    first, last = check_args(first, last)
+    lo = bisect_right(keys, decode_cursor(after)) if after else 0
+    hi = bisect_left(keys, decode_cursor(before)) if before else len(keys)
+    hi = max(lo, hi)
+    if last is None:
+        end = min(hi, lo + first)
+        return list(countries[lo:end]), lo > 0, end < len(keys)
+    start = max(lo, hi - last)
+    return list(countries[start:hi]), start > 0, hi < len(keys)
+
+
+def _after(column, key):
+    name, ident = key
+    # the plain `name >= :name` conjunct is what lets the planner use the name index
+    return and_(column >= name, or_(column > name, CountryModel.id > ident))
+
+
+def _before(column, key):
+    name, ident = key
+    return and_(column <= name, or_(column < name, CountryModel.id < ident))
+
+
+def page_query(db, first=None, after=None, last=None, before=None, options=()):
+    """Keyset-page the countries table. Returns (rows, has_previous_page, has_next_page).
+
+    `options` are extra query options, e.g. a column projection.
+    """
+    first, last = check_args(first, last)
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before else None
+
+    name = name_order(db)
+    q = db.query(CountryModel).options(*options)
+    if after_key:
+        q = q.filter(_after(name, after_key))
+    if before_key:
+        q = q.filter(_before(name, before_key))
+
+    if last is None:
+        rows = q.order_by(name, CountryModel.id).limit(first + 1).all()
+        has_next = len(rows) > first
+        rows = rows[:first]
+        # anything at or before the `after` cursor is a previous page
+        has_previous = bool(after_key) and db.query(exists().where(~_after(name, after_key))).scalar()
+        return rows, has_previous, has_next
+
+    rows = q.order_by(name.desc(), CountryModel.id.desc()).limit(last + 1).all()
+    has_previous = len(rows) > last
+    rows = rows[:last][::-1]
+    has_next = bool(before_key) and db.query(exists().where(~_before(name, before_key))).scalar()
+    return rows, has_previous, has_next
@@ -0,0 +1,223 @@
+"""
+Opt-in profiling of single GraphQL requests.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` (only if
+PROFILE_TOKEN is set) or when it is picked by PROFILE_SAMPLE_RATE. While its
+document executes, the request runs under cProfile and every SQL statement is
+recorded with its duration; afterwards the slowest SELECTs are explained
+(`EXPLAIN (ANALYZE, BUFFERS)` on Postgres, which runs them once more;
+`EXPLAIN QUERY PLAN` elsewhere).
+
+Requests that asked for a profile get the summary in `extensions.profile`.
+Every profile is also written to PROFILE_DIR when it is set (a JSON summary
+plus a `.prof` file for pstats/snakeviz), keeping the newest PROFILE_KEEP;
+sampled requests are only ever written there, never returned to the client.
+"""
+
+import os
+import io
+import hmac
+import json
+import time
+import random
+import logging
+import cProfile
+import pstats
+import contextvars
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+logger = logging.getLogger("profiling")
+
+# this service's modules, for the per-function breakdown
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+# slowest SELECT statements to EXPLAIN per profile; 0 turns EXPLAIN off
+PROFILE_EXPLAIN = int(os.getenv('PROFILE_EXPLAIN', '3'))
+PROFILE_TOP_FUNCTIONS = int(os.getenv('PROFILE_TOP_FUNCTIONS', '15'))
+
+# how the current request asked to be profiled: None, 'header' or 'sampled'
+_requested = contextvars.ContextVar('profile_requested', default=None)
+# the RequestProfile recording SQL for the document executing in this context
+_active = contextvars.ContextVar('profile_active', default=None)
+
+
+def request(headers, token=None, sample_rate=None):
+    """Decide whether this request is profiled; returns a token for `end_request`."""
+    token = PROFILE_TOKEN if token is None else token
+    sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+    mode = None
+    value = headers.get(PROFILE_HEADER)
+    if token and value and hmac.compare_digest(value, token):
+        mode = 'header'
+    elif sample_rate and PROFILE_DIR and random.random() < sample_rate:
+        mode = 'sampled'
+    return _requested.set(mode)
+
+
+def end_request(token):
+    _requested.reset(token)
+
+
+def requested():
+    return _requested.get()
+
+
+class RequestProfile:
+    """cProfile plus the SQL statements of one document execution."""
+
+    def __init__(self, operation_name):
+        self.operation_name = operation_name
+        self.statements = []
+        self.profiler = cProfile.Profile()
+        self.started = None
+        self.duration = None
+
+    def record(self, engine, statement, parameters, executemany, seconds):
+        self.statements.append({
+            'engine': engine, 'sql': statement, 'parameters': parameters,
+            'executemany': executemany, 'seconds': seconds,
+        })
+
+    def slowest(self, n):
+        return sorted(self.statements, key=lambda s: s['seconds'], reverse=True)[:n]
+
+    def functions(self, n=None):
+        """(hottest functions by own time, this service's functions by cumulative time)."""
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+            if filename == '~' or filename == __file__:
+                continue
+            rows.append({
+                'function': f"{os.path.basename(filename)}:{line}({name})",
+                'calls': calls,
+                'cumulative_ms': round(cumulative * 1000, 3),
+                'own_ms': round(own * 1000, 3),
+                'local': os.path.dirname(os.path.abspath(filename)) == _HERE,
+            })
+        n = n or PROFILE_TOP_FUNCTIONS
+        hottest = sorted(rows, key=lambda r: r['own_ms'], reverse=True)[:n]
+        local = sorted((r for r in rows if r['local']), key=lambda r: r['cumulative_ms'], reverse=True)[:n]
+        strip = lambda r: {k: v for k, v in r.items() if k != 'local'}
+        return [strip(r) for r in hottest], [strip(r) for r in local]
+
+    def summary(self, explain=0):
+        sql_seconds = sum(s['seconds'] for s in self.statements)
+        hottest, local = self.functions()
+        return {
+            'operation': self.operation_name,
+            'duration_ms': round(self.duration * 1000, 3),
+            'sql': {
+                'count': len(self.statements),
+                'total_ms': round(sql_seconds * 1000, 3),
+                'statements': [
+                    {'sql': s['sql'], 'ms': round(s['seconds'] * 1000, 3)} for s in self.statements
+                ],
+            },
+            'explain': self.explain(explain) if explain else [],
+            'functions': hottest,
+            'service_functions': local,
+        }
+
+    def explain(self, n):
+        plans, seen = [], set()
+        for s in self.slowest(len(self.statements)):
+            if len(plans) >= n:
+                break
+            sql = s['sql']
+            if s['executemany'] or sql in seen or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                continue
+            seen.add(sql)
+            try:
+                plans.append({'sql': sql, 'ms': round(s['seconds'] * 1000, 3), 'plan': explain(s['engine'], sql, s['parameters'])})
+            except Exception as e:
+                logger.warning("EXPLAIN failed for %s", sql, exc_info=True)
+                plans.append({'sql': sql, 'error': str(e)})
+        return plans
+
+
+def explain(engine, statement, parameters):
+    """Plan lines for a recorded statement, executed with its recorded DBAPI parameters."""
+    if engine.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            rows = conn.exec_driver_sql(prefix + statement, parameters or ()).fetchall()
+        finally:
+            # ANALYZE really runs the statement; never keep anything it did
+            transaction.rollback()
+    return [str(row[-1]) for row in rows]
+
+
+_instrumented = set()
+
+
+def instrument_engine(engine):
+    """Record statements on `engine` for whichever request is being profiled (once)."""
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _active.get() is not None:
+            conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _active.get()
+        starts = conn.info.get('profile_start')
+        if profile is not None and starts:
+            profile.record(conn.engine, statement, parameters, executemany, time.perf_counter() - starts.pop())
+
+
+def run(execute_fn, operation_name):
+    """Run `execute_fn()` under a RequestProfile; returns (result, summary)."""
+    profile = RequestProfile(operation_name)
+    token = _active.set(profile)
+    profile.started = time.perf_counter()
+    profile.profiler.enable()
+    try:
+        result = execute_fn()
+    finally:
+        profile.profiler.disable()
+        profile.duration = time.perf_counter() - profile.started
+        _active.reset(token)
+    summary = profile.summary(PROFILE_EXPLAIN)
+    if PROFILE_DIR:
+        try:
+            save(profile, summary)
+        except OSError:
+            logger.warning("Could not write profile to %s", PROFILE_DIR, exc_info=True)
+    return result, summary
+
+
+def save(profile, summary, directory=None, keep=None):
+    """Write `<stamp>-<operation>.json` and `.prof`, then drop all but the newest `keep` profiles."""
+    directory = directory or PROFILE_DIR
+    keep = keep or PROFILE_KEEP
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    base = os.path.join(directory, f"{stamp}-{profile.operation_name}")
+    with open(base + '.json', 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    profile.profiler.dump_stats(base + '.prof')
+
+    summaries = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in summaries[:-keep] if keep > 0 else []:
+        for path in (os.path.join(directory, name), os.path.join(directory, name[:-len('.json')] + '.prof')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return base
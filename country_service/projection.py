@@ -0,0 +1,53 @@
+"""
+Selection-set driven column projection.
+
+Resolvers that read from the database look at which fields the client actually
+selected and load only those columns, so `countries { name alpha2Code }` does not
+fetch and deserialize the JSON columns it never returns.
+"""
+
+from graphene.utils.str_converters import to_camel_case
+from graphql.language import ast
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+from models import Country as CountryModel
+
+# GraphQL field name -> mapped attribute, for every plain column on the model
+_COLUMNS_BY_FIELD = {to_camel_case(attr.key): attr.key for attr in inspect(CountryModel).column_attrs}
+
+
+def _selections(selection_set, fragments):
+    """Flatten fields out of a selection set, expanding fragment spreads and inline fragments."""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from _selections(fragment.selection_set, fragments)
+        elif isinstance(selection, ast.InlineFragment):
+            yield from _selections(selection.selection_set, fragments)
+
+
+def selected_fields(info, path=()):
+    """Names of the fields selected below the current field, following `path` (e.g. edges, node)."""
+    nodes = list(info.field_asts)
+    for step in path:
+        nodes = [f for node in nodes for f in _selections(node.selection_set, info.fragments) if f.name.value == step]
+    return {f.name.value for node in nodes for f in _selections(node.selection_set, info.fragments)}
+
+
+def requested_columns(info, path=(), always=()):
+    """Model attributes needed to answer the selection, plus any listed in `always`."""
+    columns = {_COLUMNS_BY_FIELD[name] for name in selected_fields(info, path) if name in _COLUMNS_BY_FIELD}
+    columns.update(always)
+    columns.add('id')
+    return frozenset(columns)
+
+
+def country_load_only(columns):
+    """Query option loading just `columns` (the primary key always comes along)."""
+    return load_only(*[getattr(CountryModel, key) for key in sorted(columns)])
@@ -0,0 +1,180 @@
+"""
+Precomputed region/subregion aggregates behind the `regionStats` query.
+
+`region_stats` holds one row per (region, subregion): the country count,
+population and area totals and the REGION_STATS_TOP most populous countries.
+Writers call `refresh(db, groups)` inside their own transaction, before the
+commit, with the groups their change touched, so only those rows are
+recomputed. Reads never aggregate `countries`: the summary rows are loaded with
+the country snapshot (see cache.py), or selected from `region_stats` when there
+is no snapshot, and the subregion rows are summed into regions.
+
+Countries without a region or subregion are grouped under ''.
+"""
+
+import os
+import heapq
+import logging
+
+from sqlalchemy import and_, func, or_, select, text
+
+from bulk import insert_for
+from models import Country as CountryModel, RegionStat
+
+logger = logging.getLogger("region_stats")
+
+# most populous countries kept per subregion, and so the largest `topCountries(limit)`
+REGION_STATS_TOP = int(os.getenv('REGION_STATS_TOP', '10'))
+
+SUMMARY_COLUMNS = list(RegionStat.__table__.columns)
+
+
+def group_key(region, subregion):
+    return (region or '', subregion or '')
+
+
+def groups_of(db, *conditions):
+    """(region, subregion) keys of the countries matching `conditions`."""
+    countries = CountryModel.__table__
+    rows = db.execute(select(countries.c.region, countries.c.subregion).where(*conditions).distinct())
+    return {group_key(region, subregion) for region, subregion in rows}
+
+
+def _matches(column, value):
+    if value == '':
+        return or_(column.is_(None), column == '')
+    return column == value
+
+
+def _in_group(key):
+    countries = CountryModel.__table__
+    return and_(_matches(countries.c.region, key[0]), _matches(countries.c.subregion, key[1]))
+
+
+def _lock_groups(db, keys):
+    """Serialize refreshes of the same groups until commit (PostgreSQL; SQLite writers are serialized already)."""
+    if db.get_bind().dialect.name != 'postgresql':
+        return
+    # sorted, so two writers touching the same groups can't deadlock
+    for region, subregion in sorted(keys):
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {'key': f"region_stats:{region}/{subregion}"})
+
+
+def refresh(db, groups=None):
+    """Recompute the summary rows for `groups` of (region, subregion); all of them when None.
+
+    Each group is recomputed from `countries` as the caller's transaction sees
+    it, so a country that moved to another region needs both its old and new
+    group. Returns the number of groups written.
+    """
+    countries = CountryModel.__table__
+    summary = RegionStat.__table__
+    region = func.coalesce(countries.c.region, '')
+    subregion = func.coalesce(countries.c.subregion, '')
+    if groups is None:
+        keys = {tuple(row) for row in db.execute(select(summary.c.region, summary.c.subregion))}
+        keys |= {tuple(row) for row in db.execute(select(region, subregion).distinct())}
+    else:
+        keys = {group_key(region, subregion) for region, subregion in groups}
+    if not keys:
+        return 0
+    _lock_groups(db, keys)
+
+    totals = {}
+    for key in keys:
+        count, population, area = db.execute(
+            select(func.count(), func.sum(countries.c.population), func.sum(countries.c.area_km2)).where(_in_group(key))
+        ).one()
+        if count:
+            totals[key] = (count, population or 0, area or 0.0)
+
+    # groups that lost their last country disappear
+    gone = keys - set(totals)
+    if gone:
+        db.execute(summary.delete().where(or_(*[
+            and_(summary.c.region == r, summary.c.subregion == s) for r, s in gone
+        ])))
+    if not totals:
+        return 0
+
+    rows = []
+    for key, (count, population, area) in totals.items():
+        top = db.execute(
+            select(countries.c.name, countries.c.alpha2_code, countries.c.population, countries.c.area_km2)
+            .where(_in_group(key), countries.c.population.isnot(None))
+            .order_by(countries.c.population.desc(), countries.c.name)
+            .limit(REGION_STATS_TOP)
+        ).all()
+        rows.append({
+            'region': key[0], 'subregion': key[1], 'country_count': count, 'population': population,
+            'area_km2': area,
+            'top_countries': [
+                {'name': name, 'alpha2_code': alpha2_code, 'population': pop, 'area_km2': area_km2}
+                for name, alpha2_code, pop, area_km2 in top
+            ],
+        })
+    stmt = insert_for(db)(summary).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[summary.c.region, summary.c.subregion],
+        set_={
+            'country_count': stmt.excluded.country_count,
+            'population': stmt.excluded.population,
+            'area_km2': stmt.excluded.area_km2,
+            'top_countries': stmt.excluded.top_countries,
+            'refreshed_at': func.now(),
+        },
+    ))
+    logger.debug("Refreshed region stats for %s", sorted(totals))
+    return len(rows)
+
+
+class RegionSummary:
+    """Totals for one region, or one subregion of it (`subregion` set)."""
+
+    def __init__(self, region, subregion, country_count, population, area_km2, top_countries, subregions=()):
+        self.region = region or None
+        self.subregion = subregion or None
+        self.country_count = country_count
+        self.population = population
+        self.area_km2 = area_km2
+        self.top_countries = top_countries
+        self.subregions = list(subregions)
+
+    @property
+    def density(self):
+        """People per km² over the whole group, or None without any area."""
+        return self.population / self.area_km2 if self.area_km2 else None
+
+
+def summarize(rows):
+    """Region summaries (each with its subregions) from `region_stats` rows, ordered by name."""
+    by_region = {}
+    for row in rows:
+        row = dict(zip([c.key for c in SUMMARY_COLUMNS], row))
+        by_region.setdefault(row['region'], []).append(RegionSummary(
+            row['region'], row['subregion'], row['country_count'], row['population'], row['area_km2'],
+            row['top_countries'] or [],
+        ))
+    regions = []
+    for region in sorted(by_region):
+        subregions = sorted(by_region[region], key=lambda s: s.subregion or '')
+        # every subregion keeps its own top list, so the region's is a merge of those
+        top = heapq.nsmallest(
+            REGION_STATS_TOP,
+            (c for s in subregions for c in s.top_countries),
+            key=lambda c: (-c['population'], c['name']),
+        )
+        regions.append(RegionSummary(
+            region, None, sum(s.country_count for s in subregions), sum(s.population for s in subregions),
+            sum(s.area_km2 for s in subregions), top, subregions,
+        ))
+    return regions
+
+
+def summary_query():
+    return select(*SUMMARY_COLUMNS)
+
+
+def load(db):
+    """Region summaries straight from `region_stats`, for reads without a snapshot."""
+    return summarize(db.execute(summary_query()).all())
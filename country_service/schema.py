@@ -1,18 +1,92 @@
+import os
+import uuid
 import graphene
 from graphene_sqlalchemy import SQLAlchemyObjectType
-from models import Country as CountryModel
+from models import Country as CountryModel, normalize_name
 from database import get_db_session
-from sqlalchemy import func
+import cache
+import geo
+import pagination
+import search
+from loaders import get_loader
+from bulk import insert_new
+import outbox
+import region_stats
+import filters
+import changes
+import subscriptions
+from projection import requested_columns, country_load_only
+from sqlalchemy import func, or_, case, text
 from psycopg2.errors import UniqueViolation
 from sqlalchemy.exc import IntegrityError
 
+# root query fields that always read the database; the ASGI app runs these on its thread pool
+DB_ONLY_FIELDS = frozenset({'countriesChangedSince'})
+# first radius tried by countriesNear(nearest: k) on the SQL path
+NEAREST_START_RADIUS_KM = 1000.0
+# most countries accepted by one addCountries call
+ADD_COUNTRIES_MAX = int(os.getenv('ADD_COUNTRIES_MAX', '1000'))
+
 
 class CountryType(SQLAlchemyObjectType):
     class Meta:
         model = CountryModel
+        exclude_fields = ('name_normalized', 'change_seq', 'content_hash')
 
     id = graphene.String(source='id')
 
+class CountryConnection(graphene.relay.Connection):
+    class Meta:
+        node = CountryType
+
+class CountryTombstoneType(graphene.ObjectType):
+    id = graphene.String()
+    alpha2_code = graphene.String()
+    name = graphene.String()
+    deleted_at = graphene.DateTime()
+
+class CountryChanges(graphene.ObjectType):
+    countries = graphene.List(CountryType, description='Added or changed since the cursor, oldest change first.')
+    tombstones = graphene.List(CountryTombstoneType, description='Deleted since the cursor.')
+    cursor = graphene.String(description='Pass this as `cursor` next time.')
+    has_more = graphene.Boolean(description='More changes are waiting; ask again with the new cursor.')
+
+class CountryFilter(graphene.InputObjectType):
+    region = graphene.String()
+    subregion = graphene.String()
+    language_code = graphene.String(description='ISO 639-1 or 639-2 code, e.g. "en" or "eng".')
+    currency_code = graphene.String(description='ISO 4217 code, e.g. "EUR".')
+    timezone = graphene.String(description='As listed on the country, e.g. "UTC+01:00".')
+    population_min = graphene.Int()
+    population_max = graphene.Int()
+
+class RankedCountryType(graphene.ObjectType):
+    name = graphene.String()
+    alpha2_code = graphene.String()
+    population = graphene.Int()
+    area_km2 = graphene.Float()
+
+class RegionStatsType(graphene.ObjectType):
+    """Totals for a region, or one of its subregions, from the precomputed region_stats table."""
+    region = graphene.String()
+    subregion = graphene.String()
+    country_count = graphene.Int()
+    # Float: a region's population overflows GraphQL's 32-bit Int
+    population = graphene.Float()
+    area_km2 = graphene.Float()
+    density = graphene.Float(description='People per km² over the whole group.')
+    top_countries = graphene.List(
+        RankedCountryType,
+        limit=graphene.Int(default_value=5),
+        description='Most populous countries first.',
+    )
+    subregions = graphene.List(lambda: RegionStatsType)
+
+    def resolve_top_countries(self, info, limit):
+        if limit > region_stats.REGION_STATS_TOP:
+            raise Exception(f"topCountries(limit) can be at most {region_stats.REGION_STATS_TOP}.")
+        return [RankedCountryType(**c) for c in self.top_countries[:max(limit, 0)]]
+
 class CountryInput(graphene.InputObjectType):
     name = graphene.String(required=True)
     alpha2_code = graphene.String(required=True)
@@ -30,50 +104,295 @@ class CountryInput(graphene.InputObjectType):
     languages = graphene.JSONString()
 
 class Query(graphene.ObjectType):
-    country = graphene.Field(CountryType, name=graphene.String(), alpha2_code=graphene.String())
-    countries = graphene.List(CountryType, limit=graphene.Int(default_value=10), offset=graphene.Int(default_value=0))
+    country = graphene.Field(CountryType, name=graphene.String(), alpha2_code=graphene.String(), alpha3_code=graphene.String())
+    countries = graphene.List(
+        CountryType,
+        limit=graphene.Int(default_value=10),
+        offset=graphene.Int(default_value=0),
+        filter=CountryFilter(description='Every given criterion must match.'),
+    )
+    countries_connection = graphene.Field(
+        CountryConnection,
+        first=graphene.Int(),
+        after=graphene.String(),
+        last=graphene.Int(),
+        before=graphene.String(),
+        description='Countries ordered by name, paged with opaque (name, id) cursors.',
+    )
+    search_countries = graphene.List(
+        CountryType,
+        prefix=graphene.String(required=True),
+        fuzzy=graphene.Boolean(default_value=False),
+        limit=graphene.Int(default_value=10),
+        description='Type-ahead search: exact, then prefix, then word-prefix matches; fuzzy adds trigram matches.',
+    )
     countries_near = graphene.List(
         CountryType,
         latitude=graphene.Float(required=True),
         longitude=graphene.Float(required=True),
         radius_km=graphene.Float(default_value=500.0),
         limit=graphene.Int(default_value=10),
+        nearest=graphene.Int(description='Return the k closest countries; radiusKm and limit are ignored.'),
+    )
+    countries_changed_since = graphene.Field(
+        CountryChanges,
+        cursor=graphene.String(description='From the previous response; omit for a full sync.'),
+        limit=graphene.Int(default_value=100),
+        description='Delta sync: countries whose content changed and countries deleted after `cursor`.',
+    )
+    region_stats = graphene.List(
+        RegionStatsType,
+        region=graphene.String(description='Only this region.'),
+        description='Per-region totals with their subregions, served from precomputed aggregates.',
     )
 
-    def resolve_country(self, info, name=None, alpha2_code=None):
-        db = get_db_session()
-        q = db.query(CountryModel)
+    def resolve_country(self, info, name=None, alpha2_code=None, alpha3_code=None):
+        snapshot = cache.current(get_db_session)
+        if snapshot is not None:
+            return snapshot.find(name=name, alpha2_code=alpha2_code, alpha3_code=alpha3_code)
+        # aliased lookups in one document are batched into a single IN (...) query
+        columns = requested_columns(info)
         if name:
-            return q.filter(CountryModel.name.ilike(name)).first()
+            return get_loader(info.context, 'country_by_name', get_db_session, columns).load(name)
         if alpha2_code:
-            return q.filter(CountryModel.alpha2_code == alpha2_code.upper()).first()
+            return get_loader(info.context, 'country_by_alpha2', get_db_session, columns).load(alpha2_code)
+        if alpha3_code:
+            return get_loader(info.context, 'country_by_alpha3', get_db_session, columns).load(alpha3_code)
         return None
 
-    def resolve_countries(self, info, limit, offset):
+    def resolve_countries(self, info, limit, offset, filter=None):
+        _check_not_negative(limit=limit, offset=offset)
+        criteria = filters.Criteria.from_input(filter)
+        snapshot = cache.current(get_db_session)
+        if snapshot is not None:
+            return snapshot.page(limit, offset, criteria)
         db = get_db_session()
-        return db.query(CountryModel).order_by(CountryModel.name).offset(offset).limit(limit).all()
+        q = db.query(CountryModel).options(country_load_only(requested_columns(info)))
+        q = q.filter(*filters.conditions(db, criteria))
+        # same order as the snapshot, so offsets mean the same rows on both paths
+        return q.order_by(pagination.name_order(db), CountryModel.id).offset(offset).limit(limit).all()
 
-    def resolve_countries_near(self, info, latitude, longitude, radius_km, limit):
+    def resolve_countries_connection(self, info, first=None, after=None, last=None, before=None):
+        snapshot = cache.current(get_db_session)
+        if snapshot is not None:
+            rows, has_previous, has_next = snapshot.connection_page(first, after, last, before)
+        else:
+            # cursors are built from name and id, so those are always loaded
+            columns = requested_columns(info, path=('edges', 'node'), always=('name',))
+            rows, has_previous, has_next = pagination.page_query(
+                get_db_session(), first, after, last, before, options=[country_load_only(columns)]
+            )
+        edges = [CountryConnection.Edge(node=c, cursor=pagination.encode_cursor(c)) for c in rows]
+        return CountryConnection(
+            edges=edges,
+            page_info=graphene.relay.PageInfo(
+                has_previous_page=has_previous,
+                has_next_page=has_next,
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+            ),
+        )
+
+    def resolve_search_countries(self, info, prefix, fuzzy, limit):
+        _check_not_negative(limit=limit)
+        snapshot = cache.current(get_db_session)
+        if snapshot is not None:
+            return snapshot.search(prefix, fuzzy=fuzzy, limit=limit)
+        options = [country_load_only(requested_columns(info, always=('name',)))]
+        return _query_search(get_db_session(), prefix, fuzzy, limit, options)
+
+    def resolve_countries_near(self, info, latitude, longitude, radius_km, limit, nearest=None):
+        _check_not_negative(limit=limit, nearest=nearest)
+        snapshot = cache.current(get_db_session)
+        if snapshot is not None:
+            if nearest is not None:
+                return snapshot.nearest(latitude, longitude, nearest)
+            return snapshot.near(latitude, longitude, radius_km, limit)
         db = get_db_session()
-        # Haversine formula components in SQL
-        lat_col = func.radians(CountryModel.latitude)
-        lon_col = func.radians(CountryModel.longitude)
-        lat2 = func.radians(latitude)
-        lon2 = func.radians(longitude)
-
-        dlat = lat_col - lat2
-        dlon = lon_col - lon2
-        a = func.sin(dlat/2) * func.sin(dlat/2) + func.cos(lat2) * func.cos(lat_col) * func.sin(dlon/2) * func.sin(dlon/2)
-        c = 2 * func.atan2(func.sqrt(a), func.sqrt(1 - a))
-        earth_km = 6371.0
-        distance_km = earth_km * c
-
-        # Query countries with non-null coordinates
-        q = db.query(CountryModel).filter(CountryModel.latitude.isnot(None), CountryModel.longitude.isnot(None))
-        # Attach distance and filter by radius
-        q = q.add_columns(distance_km.label('distance_km')).filter(distance_km <= radius_km).order_by('distance_km').limit(limit)
-        results = q.all()
-        return [r[0] for r in results]
+        options = [country_load_only(requested_columns(info))]
+        if nearest is not None:
+            return _query_nearest(db, latitude, longitude, nearest, options)
+        return _query_near(db, latitude, longitude, radius_km, limit, options)
+
+    def resolve_countries_changed_since(self, info, limit, cursor=None):
+        _check_not_negative(limit=limit)
+        # change_seq orders the page, so it is always loaded
+        columns = requested_columns(info, path=('countries',), always=('change_seq',))
+        countries, tombstones, next_cursor, has_more = changes.changed_since(
+            get_db_session(), cursor, limit, options=[country_load_only(columns)]
+        )
+        return CountryChanges(
+            countries=countries,
+            tombstones=[
+                CountryTombstoneType(id=str(t.id), alpha2_code=t.alpha2_code, name=t.name, deleted_at=t.deleted_at)
+                for t in tombstones
+            ],
+            cursor=next_cursor,
+            has_more=has_more,
+        )
+
+    def resolve_region_stats(self, info, region=None):
+        snapshot = cache.current(get_db_session)
+        # either way these are summary rows; countries are never aggregated here
+        regions = snapshot.regions if snapshot is not None else region_stats.load(get_db_session())
+        if region is not None:
+            return [r for r in regions if (r.region or '').casefold() == region.casefold()]
+        return regions
+
+
+def _check_not_negative(**arguments):
+    """Reject negative page sizes and offsets, which the snapshot would slice and SQL would reject or ignore."""
+    for name, value in arguments.items():
+        if value is not None and value < 0:
+            raise Exception(f"'{name}' must not be negative.")
+
+
+def _haversine_km(latitude, longitude):
+    """SQL expression for the great-circle distance from each row to the given point."""
+    lat_col = func.radians(CountryModel.latitude)
+    lon_col = func.radians(CountryModel.longitude)
+    lat2 = func.radians(latitude)
+    lon2 = func.radians(longitude)
+
+    dlat = lat_col - lat2
+    dlon = lon_col - lon2
+    a = func.sin(dlat/2) * func.sin(dlat/2) + func.cos(lat2) * func.cos(lat_col) * func.sin(dlon/2) * func.sin(dlon/2)
+    c = 2 * func.atan2(func.sqrt(a), func.sqrt(1 - a))
+    return geo.EARTH_KM * c
+
+
+_extensions_by_url = {}
+
+def _has_extension(db, name):
+    """True when the Postgres extension `name` is installed (checked once per database)."""
+    bind = db.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    key = (str(bind.url), name)
+    if key not in _extensions_by_url:
+        found = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = :name"), {'name': name}).first()
+        _extensions_by_url[key] = found is not None
+    return _extensions_by_url[key]
+
+
+def _has_earthdistance(db):
+    return _has_extension(db, 'earthdistance')
+
+
+def _ll_to_earth(latitude, longitude):
+    return func.ll_to_earth(latitude, longitude)
+
+
+def _query_near(db, latitude, longitude, radius_km, limit, options=()):
+    distance_km = _haversine_km(latitude, longitude)
+    # Query countries with non-null coordinates
+    q = db.query(CountryModel).options(*options).filter(CountryModel.latitude.isnot(None), CountryModel.longitude.isnot(None))
+    if _has_earthdistance(db):
+        # GiST index on ll_to_earth(latitude, longitude), see the earthdistance migration
+        box = func.earth_box(_ll_to_earth(latitude, longitude), geo.earth_box_meters(radius_km))
+        q = q.filter(box.op('@>')(_ll_to_earth(CountryModel.latitude, CountryModel.longitude)))
+    else:
+        # bounding box on the indexed columns so only nearby rows reach the Haversine filter
+        min_lat, max_lat, lon_ranges = geo.bounding_box(latitude, longitude, radius_km)
+        q = q.filter(CountryModel.latitude.between(min_lat, max_lat))
+        if lon_ranges is not None:
+            q = q.filter(or_(*[CountryModel.longitude.between(lo, hi) for lo, hi in lon_ranges]))
+    # Attach distance and filter by radius
+    q = q.add_columns(distance_km.label('distance_km')).filter(distance_km <= radius_km).order_by('distance_km').limit(limit)
+    results = q.all()
+    return [r[0] for r in results]
+
+
+def _query_nearest(db, latitude, longitude, k, options=()):
+    if k <= 0:
+        return []
+    if _has_earthdistance(db):
+        # cube's <-> operator is a KNN ordering the GiST index can serve directly
+        q = db.query(CountryModel).options(*options).filter(CountryModel.latitude.isnot(None), CountryModel.longitude.isnot(None))
+        knn = _ll_to_earth(CountryModel.latitude, CountryModel.longitude).op('<->')(_ll_to_earth(latitude, longitude))
+        return q.order_by(knn).limit(k).all()
+    # widen the radius until it holds k rows: nothing outside the radius can beat them
+    radius_km = NEAREST_START_RADIUS_KM
+    while True:
+        found = _query_near(db, latitude, longitude, radius_km, k, options)
+        if len(found) >= k or radius_km >= geo.MAX_DISTANCE_KM:
+            return found
+        radius_km = min(radius_km * 4, geo.MAX_DISTANCE_KM)
+
+
+def _like_prefix(value):
+    escaped = value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    return escaped + '%'
+
+
+def _query_search(db, text_, fuzzy, limit, options=()):
+    needle = normalize_name(text_)
+    if not needle:
+        return []
+    col = CountryModel.name_normalized
+    # name_normalized LIKE 'x%' is served by the pattern-ops index from the name search migration
+    starts = col.like(_like_prefix(needle), escape='/')
+    word_starts = col.like('% ' + _like_prefix(needle), escape='/')
+    rank = case(
+        (col == needle, search.RANK_EXACT),
+        (starts, search.RANK_PREFIX),
+        (word_starts, search.RANK_WORD_PREFIX),
+        else_=search.RANK_FUZZY,
+    )
+    q = db.query(CountryModel).options(*options)
+    if fuzzy and _has_extension(db, 'pg_trgm'):
+        # `%` is pg_trgm's similarity operator, backed by the GIN trigram index
+        score = func.similarity(col, needle)
+        q = q.filter(or_(starts, word_starts, col.bool_op('%')(needle)))
+        return q.order_by(rank, score.desc(), col).limit(limit).all()
+    if fuzzy:
+        q = q.filter(or_(starts, word_starts, col.like('%' + _like_prefix(needle), escape='/')))
+    else:
+        q = q.filter(or_(starts, word_starts))
+    return q.order_by(rank, col).limit(limit).all()
+
+
+def _manual_values(country_data):
+    """Column values for a country entered through the API."""
+    return dict(
+        name=country_data.name,
+        alpha2_code=country_data.alpha2_code.upper(),
+        alpha3_code=country_data.alpha3_code,
+        capital=country_data.capital,
+        region=country_data.region,
+        subregion=country_data.subregion,
+        population=country_data.population,
+        area_km2=country_data.area_km2,
+        latitude=country_data.latitude,
+        longitude=country_data.longitude,
+        flag_url=country_data.flag_url,
+        timezones=country_data.timezones,
+        currencies=country_data.currencies,
+        languages=country_data.languages,
+        source='manual',
+    )
+
+
+def _input_problems(index, country_data):
+    """Reasons item `index` of an addCountries batch can't be inserted at all."""
+    where = f"countries[{index}]"
+    problems = []
+    if not (country_data.name or '').strip():
+        problems.append(f"{where}.name must not be empty")
+    alpha2_code = country_data.alpha2_code or ''
+    if len(alpha2_code) != 2 or not alpha2_code.isalpha():
+        problems.append(f"{where}.alpha2Code must be two letters")
+    alpha3_code = country_data.alpha3_code
+    if alpha3_code is not None and (len(alpha3_code) != 3 or not alpha3_code.isalpha()):
+        problems.append(f"{where}.alpha3Code must be three letters")
+    if country_data.latitude is not None and not -90 <= country_data.latitude <= 90:
+        problems.append(f"{where}.latitude must be between -90 and 90")
+    if country_data.longitude is not None and not -180 <= country_data.longitude <= 180:
+        problems.append(f"{where}.longitude must be between -180 and 180")
+    if country_data.population is not None and country_data.population < 0:
+        problems.append(f"{where}.population must not be negative")
+    return problems
+
 
 class AddCountry(graphene.Mutation):
     class Arguments:
@@ -85,27 +404,17 @@ class AddCountry(graphene.Mutation):
 
     def mutate(self, info, country_data=None):
         db = get_db_session()
-        alpha2_code = country_data.alpha2_code.upper()
         # prevent ingestion overwriting manual: set source='manual'
-        country = CountryModel(
-            name=country_data.name,
-            alpha2_code=alpha2_code,
-            alpha3_code=country_data.alpha3_code,
-            capital=country_data.capital,
-            region=country_data.region,
-            subregion=country_data.subregion,
-            population=country_data.population,
-            area_km2=country_data.area_km2,
-            latitude=country_data.latitude,
-            longitude=country_data.longitude,
-            flag_url=country_data.flag_url,
-            timezones=country_data.timezones,
-            currencies=country_data.currencies,
-            languages=country_data.languages,
-            source='manual',
-        )
+        country = CountryModel(**_manual_values(country_data))
         try:
             db.add(country)
+            db.flush()
+            region_stats.refresh(db, [(country.region, country.subregion)])
+            changes.stamp(db, CountryModel.id == country.id)
+            # the event commits (or rolls back) together with the row
+            event = outbox.add_event(db, 'country_added', id=str(country.id), name=country.name)
+            db.flush()
+            event_ids = [event.id]
             db.commit()
         except IntegrityError as e:
             db.rollback()
@@ -117,17 +426,111 @@ class AddCountry(graphene.Mutation):
         except Exception as e:
             db.rollback()
             raise
-            
-        # trigger notification via Celery task (import here to avoid circular)
+
+        # every worker drops its country snapshot so the new row is visible to reads
+        cache.publish_invalidation()
+        outbox.relay_after_commit(db, event_ids)
+        return AddCountry(ok=True, country=country)
+
+class CountryConflict(graphene.ObjectType):
+    index = graphene.Int(description='Position of the item in the input list.')
+    alpha2_code = graphene.String()
+    message = graphene.String()
+
+class AddCountries(graphene.Mutation):
+    """Insert many countries in one transaction; items that already exist are reported, not fatal."""
+
+    class Arguments:
+        countries = graphene.List(graphene.NonNull(CountryInput), required=True)
+
+    ok = graphene.Boolean()
+    countries = graphene.List(lambda: CountryType)
+    conflicts = graphene.List(CountryConflict)
+
+    def mutate(self, info, countries):
+        if len(countries) > ADD_COUNTRIES_MAX:
+            raise Exception(f"At most {ADD_COUNTRIES_MAX} countries can be added at once.")
+        problems = [p for i, data in enumerate(countries) for p in _input_problems(i, data)]
+        if problems:
+            # nothing is written unless the whole batch is well-formed
+            raise Exception("Invalid countries: " + "; ".join(problems))
+
+        db = get_db_session()
+        rows = [dict(_manual_values(data), id=uuid.uuid4()) for data in countries]
+        for row in rows:
+            row['name_normalized'] = normalize_name(row['name'])
+        alpha2_codes = {row['alpha2_code'] for row in rows}
+        alpha3_codes = {row['alpha3_code'] for row in rows if row['alpha3_code']}
+        taken = db.query(CountryModel.alpha2_code, CountryModel.alpha3_code).filter(
+            or_(CountryModel.alpha2_code.in_(alpha2_codes), CountryModel.alpha3_code.in_(alpha3_codes))
+        ).all()
+        taken_alpha2 = {a2 for a2, _ in taken}
+        taken_alpha3 = {a3 for _, a3 in taken if a3}
+
+        conflicts = []
+        accepted = []
+        for index, row in enumerate(rows):
+            alpha2_code, alpha3_code = row['alpha2_code'], row['alpha3_code']
+            if alpha2_code in taken_alpha2:
+                message = f"Country with alpha2_code '{alpha2_code}' already exists."
+            elif alpha3_code and alpha3_code in taken_alpha3:
+                message = f"Country with alpha3_code '{alpha3_code}' already exists."
+            else:
+                # the first occurrence inside the batch wins, like any later duplicate would
+                taken_alpha2.add(alpha2_code)
+                if alpha3_code:
+                    taken_alpha3.add(alpha3_code)
+                accepted.append((index, row))
+                continue
+            conflicts.append(CountryConflict(index=index, alpha2_code=alpha2_code, message=message))
+
+        added_rows = []
         try:
-            from tasks import notify_country_added
-            notify_country_added.delay(str(country.id), country.name)
+            written = insert_new(db, [row for _, row in accepted]) if accepted else set()
+            added_rows = [row for _, row in accepted if row['id'] in written]
+            event_ids = []
+            if added_rows:
+                region_stats.refresh(db, {(row['region'], row['subregion']) for row in added_rows})
+                changes.stamp(db, CountryModel.id.in_(written))
+                # one event for the whole batch, committed with it
+                event = outbox.add_event(db, 'countries_added', count=len(added_rows), countries=[
+                    {'id': str(row['id']), 'name': row['name']} for row in added_rows
+                ])
+                db.flush()
+                event_ids = [event.id]
+            db.commit()
         except Exception:
-            # ensure mutation still succeeds even if task publish fails
-            pass
-        return AddCountry(ok=True, country=country)
+            db.rollback()
+            raise Exception("Database error occurred while adding countries.")
+
+        for index, row in accepted:
+            if row['id'] not in written:
+                conflicts.append(CountryConflict(
+                    index=index, alpha2_code=row['alpha2_code'],
+                    message=f"Country with alpha2_code '{row['alpha2_code']}' was added concurrently.",
+                ))
+        conflicts.sort(key=lambda c: c.index)
+        added = []
+        if written:
+            cache.publish_invalidation()
+            outbox.relay_after_commit(db, event_ids)
+            by_id = {c.id: c for c in db.query(CountryModel).filter(CountryModel.id.in_(written))}
+            added = [by_id[row['id']] for row in added_rows if row['id'] in by_id]
+        return AddCountries(ok=not conflicts, countries=added, conflicts=conflicts)
 
 class Mutation(graphene.ObjectType):
     add_country = AddCountry.Field()
+    add_countries = AddCountries.Field()
+
+class Subscription(graphene.ObjectType):
+    """Served over WebSocket by the ASGI app (see subscriptions.py)."""
+    country_added = graphene.Field(CountryType, description='Every country added from now on.')
+    country_updated = graphene.Field(CountryType, description='Every change to an existing country from now on.')
+
+    def resolve_country_added(self, info):
+        return subscriptions.hub.stream(subscriptions.ADDED)
+
+    def resolve_country_updated(self, info):
+        return subscriptions.hub.stream(subscriptions.UPDATED)
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
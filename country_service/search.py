@@ -0,0 +1,104 @@
+"""
+Type-ahead search over country names.
+
+`NameIndex` is built once per snapshot. Prefix matches come from a sorted list
+of normalized names (and of every word inside a name, so "kingdom" finds
+"United Kingdom") searched with bisect; fuzzy matches use an inverted trigram
+index scored the way pg_trgm's similarity() does.
+"""
+
+from bisect import bisect_left
+
+from models import normalize_name
+
+# pg_trgm's default similarity threshold
+SIMILARITY_THRESHOLD = 0.3
+
+# lower rank sorts first
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_WORD_PREFIX = 2
+RANK_FUZZY = 3
+
+
+def trigrams(text):
+    """Trigram set of `text`, padded per word like pg_trgm."""
+    grams = set()
+    for word in (text or '').split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class NameIndex:
+    """Prefix and trigram indexes over a sequence of Country objects."""
+
+    def __init__(self, countries):
+        self.countries = list(countries)
+        entries = []
+        grams = {}
+        self._grams = []
+        self._names = []
+        for i, c in enumerate(self.countries):
+            name = c.name_normalized or normalize_name(c.name) or ''
+            self._names.append(name)
+            words = name.split()
+            entries.append((name, RANK_PREFIX, i))
+            for w in range(1, len(words)):
+                entries.append((' '.join(words[w:]), RANK_WORD_PREFIX, i))
+            own = trigrams(name)
+            self._grams.append(own)
+            for g in own:
+                grams.setdefault(g, []).append(i)
+        entries.sort()
+        self._keys = [e[0] for e in entries]
+        self._entries = entries
+        self._postings = grams
+
+    def prefix(self, prefix):
+        """{country index: rank} for names (or words in names) starting with `prefix`."""
+        hits = {}
+        start = bisect_left(self._keys, prefix)
+        for key, rank, i in self._entries[start:]:
+            if not key.startswith(prefix):
+                break
+            if key == prefix and rank == RANK_PREFIX:
+                rank = RANK_EXACT
+            if rank < hits.get(i, RANK_FUZZY + 1):
+                hits[i] = rank
+        return hits
+
+    def fuzzy(self, text, threshold=SIMILARITY_THRESHOLD):
+        """{country index: similarity} for names at least `threshold` similar to `text`."""
+        query = trigrams(text)
+        if not query:
+            return {}
+        shared = {}
+        for g in query:
+            for i in self._postings.get(g, ()):
+                shared[i] = shared.get(i, 0) + 1
+        scores = {}
+        for i, common in shared.items():
+            score = common / (len(query) + len(self._grams[i]) - common)
+            if score >= threshold:
+                scores[i] = score
+        return scores
+
+    def search(self, text, fuzzy=False, limit=10):
+        """Ranked countries matching `text`: exact, prefix, word prefix, then fuzzy."""
+        needle = normalize_name(text) or ''
+        if not needle:
+            return []
+        hits = self.prefix(needle)
+        scores = self.fuzzy(needle) if fuzzy else {}
+        for i in scores:
+            hits.setdefault(i, RANK_FUZZY)
+        ranked = sorted(hits, key=lambda i: (hits[i], -scores.get(i, 0.0), self._names[i]))
+        return [self.countries[i] for i in ranked[:limit]]
@@ -0,0 +1,303 @@
+"""
+GraphQL subscriptions (`countryAdded`, `countryUpdated`) over WebSocket.
+
+`CountryEventHub` is the only reader of country events (see events.py) in this
+process: it subscribes to the `country_events` channel, or, with
+EVENT_TRANSPORT=stream, XREADs new entries of the event stream without a consumer
+group (every process sees every event). Every event names the countries it is about;
+the hub loads those rows once, through the async engine, and hands the same
+detached objects to every open subscription. A thousand clients therefore cost
+one Redis connection and one SELECT per event, and nothing while no country
+changes. The channel listener starts with the first subscription.
+
+`SubscriptionServer` speaks the graphql-ws protocol (subscriptions-transport-ws)
+on the ASGI app's `/graphql` WebSocket route. Events are not replayed to
+subscribers, so a client that reconnects should catch up with `countriesChangedSince`.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import logging
+from contextlib import aclosing
+
+import redis.asyncio as aioredis
+from graphql.execution import ExecutionResult
+from graphql_server import default_format_error
+from rx import Observable
+from rx.subjects import Subject
+from sqlalchemy import select
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import events
+from models import Country as CountryModel
+
+logger = logging.getLogger("country_subscriptions")
+
+ADDED = 'added'
+UPDATED = 'updated'
+# seconds between graphql-ws keep-alive ('ka') messages; 0 turns them off
+KEEPALIVE_SECONDS = float(os.getenv('SUBSCRIPTION_KEEPALIVE', '15'))
+# results a client may fall behind by before its connection is closed
+QUEUE_SIZE = int(os.getenv('SUBSCRIPTION_QUEUE_SIZE', '100'))
+PROTOCOL = 'graphql-ws'
+
+
+def targets(payload):
+    """{ADDED: [ids], UPDATED: [ids]} for one country event."""
+    found = {ADDED: [], UPDATED: []}
+    event = payload.get('event')
+    if event == 'country_added':
+        found[ADDED].append(payload.get('id'))
+    elif event == 'countries_added':
+        found[ADDED].extend(c.get('id') for c in payload.get('countries') or ())
+    elif event == 'countries_updated':
+        for c in payload.get('countries') or ():
+            found[ADDED if c.get('created') else UPDATED].append(c.get('id'))
+    return found
+
+
+class CountryEventHub:
+    """One Redis subscription per process, fanned out to Rx subjects."""
+
+    def __init__(self, url=events.REDIS_URL, channel=events.EVENT_CHANNEL, retry_delay=2.0,
+                 transport=None, stream_key=events.EVENT_STREAM):
+        self.url = url
+        self.channel = channel
+        # 'stream' reads `stream_key`; 'pubsub' and 'both' publish on the channel
+        self.transport = transport or events.EVENT_TRANSPORT
+        self.stream_key = stream_key
+        self.retry_delay = retry_delay
+        self.engine = None
+        self.connected = False
+        self.subjects = {ADDED: Subject(), UPDATED: Subject()}
+        self._task = None
+        self._last_id = None
+
+    def configure(self, engine):
+        """Use `engine` (an AsyncEngine) to load the countries events refer to."""
+        self.engine = engine
+
+    def stream(self, kind):
+        """Observable of the Country objects for `kind`; must be called on the event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        return self.subjects[kind].as_observable()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def load(self, ids):
+        """Detached Country objects by id, read in one query."""
+        columns = list(CountryModel.__table__.columns)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(select(*columns).where(CountryModel.id.in_(ids)))).all()
+        countries = [CountryModel(**{col.key: row[i] for i, col in enumerate(columns)}) for row in rows]
+        return {c.id: c for c in countries}
+
+    async def dispatch(self, payload):
+        """Push the countries of one event to the subscribers that want them; returns how many were pushed."""
+        wanted = {}
+        for kind, ids in targets(payload).items():
+            if ids and self.subjects[kind].observers:
+                try:
+                    wanted[kind] = [uuid.UUID(str(country_id)) for country_id in ids]
+                except ValueError:
+                    logger.warning("Ignoring %s event with a malformed id: %r", payload.get('event'), ids)
+        if not wanted:
+            return 0
+        countries = await self.load({country_id for ids in wanted.values() for country_id in ids})
+        pushed = 0
+        for kind, ids in wanted.items():
+            for country_id in ids:
+                country = countries.get(country_id)
+                # gone again before we read it
+                if country is not None:
+                    self.subjects[kind].on_next(country)
+                    pushed += 1
+        return pushed
+
+    async def _messages(self, client):
+        """Raw event payloads from the channel, or from the stream for EVENT_TRANSPORT=stream."""
+        if self.transport == 'stream':
+            if self._last_id is None:
+                # start at the current end of the stream, like XREAD $, then follow on from there
+                # (also across reconnects, so nothing published in between is missed)
+                newest = await client.xrevrange(self.stream_key, count=1)
+                self._last_id = newest[0][0] if newest else '0-0'
+            self.connected = True
+            while True:
+                response = await client.xread({self.stream_key: self._last_id}, block=0)
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        self._last_id = entry_id
+                        yield fields.get(b'payload')
+        else:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self.connected = True
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        yield message['data']
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def _listen(self):
+        self._last_id = None
+        while True:
+            client = aioredis.from_url(self.url)
+            try:
+                async with aclosing(self._messages(client)) as messages:
+                    async for data in messages:
+                        try:
+                            payload = json.loads(data)
+                        except (TypeError, ValueError):
+                            logger.warning("Ignoring malformed country event: %r", data)
+                            continue
+                        try:
+                            await self.dispatch(payload)
+                        except Exception:
+                            logger.exception("Failed to dispatch country event %r", payload.get('event'))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Country event listener disconnected; retrying in %ss", self.retry_delay, exc_info=True)
+            finally:
+                self.connected = False
+                try:
+                    await client.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.retry_delay)
+
+
+hub = CountryEventHub()
+
+
+class SubscriptionServer:
+    """graphql-ws endpoint: `start` a subscription, get one `data` message per event, `stop` it."""
+
+    def __init__(self, schema, backend, keepalive=KEEPALIVE_SECONDS, queue_size=QUEUE_SIZE):
+        self.schema = schema
+        self.backend = backend
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+
+    async def handle(self, websocket: WebSocket):
+        if PROTOCOL not in websocket.scope.get('subprotocols', ()):
+            await websocket.close(code=4406)
+            return
+        await websocket.accept(subprotocol=PROTOCOL)
+        await _Connection(self, websocket).run()
+
+
+class _Connection:
+    def __init__(self, server, websocket):
+        self.server = server
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=server.queue_size)
+        self.operations = {}
+        self.too_slow = False
+
+    def push(self, kind, op_id=None, payload=None):
+        message = {'type': kind}
+        if op_id is not None:
+            message['id'] = op_id
+        if payload is not None:
+            message['payload'] = payload
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # a client that cannot keep up would otherwise hold on to every event
+            if not self.too_slow:
+                self.too_slow = True
+                asyncio.get_running_loop().create_task(self.websocket.close(code=1013))
+
+    async def run(self):
+        sender = asyncio.get_running_loop().create_task(self._send())
+        try:
+            while True:
+                try:
+                    message = await self.websocket.receive_json()
+                except (WebSocketDisconnect, ValueError):
+                    break
+                if not self.receive(message):
+                    break
+        finally:
+            for subscription in self.operations.values():
+                subscription.dispose()
+            self.operations.clear()
+            sender.cancel()
+            try:
+                await sender
+            except (asyncio.CancelledError, Exception):
+                # the client may be gone already
+                pass
+
+    def receive(self, message):
+        """Handle one client message; False ends the connection."""
+        kind = message.get('type') if isinstance(message, dict) else None
+        op_id = message.get('id') if isinstance(message, dict) else None
+        if kind == 'connection_init':
+            self.push('connection_ack')
+            if self.server.keepalive:
+                self.push('ka')
+        elif kind == 'start':
+            self.start(op_id, message.get('payload') or {})
+        elif kind == 'stop':
+            subscription = self.operations.pop(op_id, None)
+            if subscription is not None:
+                subscription.dispose()
+                self.push('complete', op_id)
+        elif kind == 'connection_terminate':
+            return False
+        else:
+            self.push('error', op_id, {'message': f"Unknown message type {kind!r}."})
+        return True
+
+    def start(self, op_id, payload):
+        if op_id is None or op_id in self.operations:
+            self.push('error', op_id, {'message': f"Operation id {op_id!r} is missing or already in use."})
+            return
+        try:
+            document = self.server.backend.document_from_string(self.server.schema, payload.get('query') or '')
+            operation_type = document.get_operation_type(payload.get('operationName'))
+            if operation_type != 'subscription':
+                raise Exception("Only subscriptions are served over WebSocket; send queries and mutations to POST /graphql.")
+            result = document.execute(
+                operation_name=payload.get('operationName'),
+                variable_values=payload.get('variables'),
+                context_value={'websocket': self.websocket},
+                allow_subscriptions=True,
+            )
+        except Exception as e:
+            result = ExecutionResult(errors=[e], invalid=True)
+        if not isinstance(result, Observable):
+            # validation or resolver errors: report them and end the operation
+            self.push('data', op_id, result.to_dict(format_error=default_format_error))
+            self.push('complete', op_id)
+            return
+        self.operations[op_id] = result.subscribe(
+            on_next=lambda data: self.push('data', op_id, data.to_dict(format_error=default_format_error)),
+            on_error=lambda error: self.push('error', op_id, {'message': str(error)}),
+            on_completed=lambda: self.push('complete', op_id),
+        )
+
+    async def _send(self):
+        while True:
+            try:
+                message = await asyncio.wait_for(self.queue.get(), self.server.keepalive or None)
+            except asyncio.TimeoutError:
+                message = {'type': 'ka'}
+            await self.websocket.send_json(message)
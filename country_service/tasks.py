@@ -1,13 +1,30 @@
 import os
-import json
+import hashlib
+import logging
+import time
+import tempfile
 import requests
 from celery_app import celery
 from database import get_db_session
-from models import Country as CountryModel
-from datetime import datetime
+import cache
+from models import Country as CountryModel, IngestState
+from bulk import row_from_api, upsert_external
+import importer
+import region_stats
+import changes
+from streaming import iter_json_array
+from events import publish_event
+import outbox
+import metrics
+from datetime import datetime, timezone
 from celery.signals import worker_ready
 
+logger = logging.getLogger("country_tasks")
+
 API_URL = os.getenv('API_COUNTRIES_URL', 'https://www.apicountries.com/countries')
+CHUNK_BYTES = 64 * 1024
+# payloads larger than this are spooled to a temp file instead of memory
+SPOOL_MAX_BYTES = int(os.getenv('INGEST_SPOOL_MAX_BYTES', 1024 * 1024))
 
 @worker_ready.connect
 def startup_ingest(sender, **kwargs):
@@ -21,74 +38,125 @@ def ingest_countries(self):
     """
     Periodic task: fetch country list from external API and upsert into DB.
     Only updates rows where source == 'external' or creates new rows.
+    Sends conditional headers from the last run and skips the run on a 304 or an
+    identical payload hash; otherwise the body is parsed as a stream of records.
+    Writes go through `bulk.upsert_external` (one prefetch, batched upserts).
     Retries on network errors with exponential backoff.
     """
     db = get_db_session()
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        resp = requests.get(API_URL, timeout=30)
-        resp.raise_for_status()
-        countries = resp.json()
+        state = db.get(IngestState, API_URL) or IngestState(source_url=API_URL)
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+
+        now = datetime.now(timezone.utc)
+        state.checked_at = now
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as body:
+            # the response goes back to the pool as soon as its body is spooled, or on any early return
+            with requests.get(API_URL, headers=headers, timeout=30, stream=True) as resp:
+                if resp.status_code == 304:
+                    logger.info("Upstream not modified (304); skipping ingestion")
+                    db.add(state)
+                    db.commit()
+                    outcome = 'not_modified'
+                    return 0
+                resp.raise_for_status()
+                state.etag = resp.headers.get('ETag')
+                state.last_modified = resp.headers.get('Last-Modified')
+
+                # spool and hash first: nothing is parsed or written for an identical payload
+                digest = hashlib.sha256()
+                for chunk in resp.iter_content(chunk_size=CHUNK_BYTES):
+                    digest.update(chunk)
+                    body.write(chunk)
+            content_hash = digest.hexdigest()
+            if content_hash == state.content_hash:
+                logger.info("Upstream payload unchanged (sha256 %s); skipping ingestion", content_hash)
+                db.add(state)
+                db.commit()
+                outcome = 'unchanged'
+                return 0
 
-        count = 0
-        for item in countries:
-            alpha2_code = (item.get('alpha2Code') or '').upper()
-            if not alpha2_code:
-                continue
-            existing = db.query(CountryModel).filter(CountryModel.alpha2_code == alpha2_code).first()
-            if existing:
-                if existing.source == 'external':
-                    existing.name = item.get('name') or existing.name
-                    existing.alpha3_code = item.get('alpha3Code') or existing.alpha3_code
-                    existing.capital = item.get('capital') or existing.capital
-                    existing.region = item.get('region') or existing.region
-                    existing.subregion = item.get('subregion') or existing.subregion
-                    existing.population = item.get('population') or existing.population
-                    existing.area_km2 = item.get('area') or existing.area_km2
-                    existing.latitude = (item.get('latlng')[0] if item.get('latlng') and len(item.get('latlng')) > 0 else None) or existing.latitude
-                    existing.longitude = (item.get('latlng')[1] if item.get('latlng') and len(item.get('latlng')) > 1 else None) or existing.longitude
-                    existing.timezones = item.get('timezones') or existing.timezones
-                    existing.currencies = item.get('currencies') or existing.currencies
-                    existing.languages = item.get('languages') or existing.languages
-                    existing.flag_url = item.get('flag') or existing.flag_url
-                    existing.synced_at = datetime.utcnow()
-                    db.add(existing)
-            else:
-                country = CountryModel(
-                    name=item.get('name'),
-                    alpha2_code=alpha2_code,
-                    alpha3_code=item.get('alpha3Code'),
-                    capital=item.get('capital'),
-                    region=item.get('region'),
-                    subregion=item.get('subregion'),
-                    population=item.get('population'),
-                    area_km2=item.get('area'),
-                    latitude=(item.get('latlng')[0] if item.get('latlng') and len(item.get('latlng')) > 0 else None),
-                    longitude=(item.get('latlng')[1] if item.get('latlng') and len(item.get('latlng')) > 1 else None),
-                    timezones=item.get('timezones'),
-                    currencies=item.get('currencies'),
-                    languages=item.get('languages'),
-                    flag_url=item.get('flag'),
-                    source='external',
-                )
-                db.add(country)
-            count += 1
+            body.seek(0)
+            rows = (row_from_api(item) for item in iter_json_array(body, CHUNK_BYTES))
+            touched, written = set(), set()
+            stats = upsert_external(db, rows, touched=touched, written=written)
+            region_stats.refresh(db, touched)
+            created, updated = set(), set()
+            if written:
+                changes.stamp(db, CountryModel.alpha2_code.in_(written), created=created, updated=updated)
+            event_ids = changes.add_events(db, created, updated)
+
+        state.content_hash = content_hash
+        state.changed_at = now
+        db.add(state)
         db.commit()
-        return count
+        if stats['inserted'] or stats['updated']:
+            cache.publish_invalidation()
+        outbox.relay_after_commit(db, event_ids)
+        logger.info("Ingestion finished: %s", stats)
+        outcome = 'changed'
+        for kind, count in stats.items():
+            metrics.INGEST_ROWS.labels(kind).inc(count)
+        # rows we looked at, including manual rows left untouched
+        return stats['inserted'] + stats['updated'] + stats['protected']
     except requests.RequestException:
         # Raise to trigger autoretry
         raise
     except Exception:
         db.rollback()
         raise
+    finally:
+        metrics.INGEST_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+        db.close()
+
+@celery.task(bind=True, name='tasks.import_countries_file')
+def import_countries_file(self, path, fmt=None):
+    """
+    Import a CSV/NDJSON file (see importer.py) in one transaction.
+    Manual rows are left alone, as in ingest_countries. Returns the import stats.
+    """
+    db = get_db_session()
+    try:
+        stats = importer.import_file(db, path, fmt)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
+    if stats['inserted'] or stats['updated']:
+        cache.publish_invalidation()
+    return stats
 
 @celery.task(bind=True, name='tasks.notify_country_added')
 def notify_country_added(self, country_id: str, country_name: str):
-    """Publish a small event to Redis pubsub channel 'country_events' for notifier to pick up."""
-    import redis
-    import os
-    r = redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
-    payload = json.dumps({'event': 'country_added', 'id': str(country_id), 'name': country_name})
-    r.publish('country_events', payload)
+    """Publish a small 'country_added' event (see events.py) for the notifier to pick up."""
+    publish_event({'event': 'country_added', 'id': str(country_id), 'name': country_name})
+    return True
+
+
+@celery.task(bind=True, name='tasks.notify_countries_added')
+def notify_countries_added(self, countries):
+    """Publish one 'countries_added' event for a batch of [{'id', 'name'}]."""
+    publish_event({'event': 'countries_added', 'count': len(countries), 'countries': countries})
     return True
+
+
+@celery.task(bind=True, name='tasks.relay_outbox')
+def relay_outbox(self):
+    """Publish every unsent outbox event, then purge old sent ones."""
+    db = get_db_session()
+    try:
+        sent = outbox.relay_all(db)
+        purged = outbox.purge_sent(db)
+        if sent or purged:
+            logger.info("Outbox relay sent %d event(s), purged %d", sent, purged)
+        return sent
+    finally:
+        db.close()
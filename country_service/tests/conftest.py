@@ -25,3 +25,20 @@ def db_session(engine):
     yield session
     session.close()
     Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture(autouse=True)
+def fresh_country_cache():
+    # the snapshot is process-wide; never let one test see another test's rows
+    import cache
+    cache.invalidate()
+    yield
+    cache.invalidate()
+
+@pytest.fixture(autouse=True)
+def fake_event_redis(monkeypatch):
+    # outbox relays publish through events.get_client(); keep them off the network
+    import fakeredis
+    import events
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    monkeypatch.setattr(events, '_client', client)
+    return client
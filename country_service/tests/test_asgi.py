@@ -0,0 +1,109 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import asgi
+import cache
+from database import create_async_db_engine
+from graphql_view import CachedDocumentBackend, PersistedQueryStore
+from models import Base, Country as CountryModel
+from schema import schema
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    # a file DB so the sync session and the aiosqlite engine see the same rows
+    path = tmp_path / 'countries.db'
+    engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([CountryModel(name='Asgiland', alpha2_code='AS'), CountryModel(name='Uvicornia', alpha2_code='UV')])
+    session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: session)
+    yield path
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def graphql_app(monkeypatch):
+    app = asgi.GraphQLApp(schema, CachedDocumentBackend(), persisted_queries=PersistedQueryStore(url=None), db_threads=2)
+    monkeypatch.setattr(asgi, 'graphql', app)
+    monkeypatch.setattr(cache, '_listener', None)
+    return app
+
+
+def _client(graphql_app):
+    from fastapi import FastAPI
+    app = FastAPI()
+    app.add_api_route('/graphql', graphql_app.handle, methods=['GET', 'POST'])
+    app.add_api_route('/health', asgi.health)
+    return TestClient(app)
+
+
+def test_health():
+    assert TestClient(asgi.app).get('/health').json() == {'status': 'ok'}
+
+
+def test_queries_run_in_the_thread_pool_without_a_snapshot(db_file, graphql_app):
+    resp = _client(graphql_app).post('/graphql', json={'query': '{ country(alpha2Code: "AS") { name } }'})
+    assert resp.status_code == 200
+    assert resp.json()['data'] == {'country': {'name': 'Asgiland'}}
+
+
+def test_queries_answer_from_the_async_loaded_snapshot(db_file, graphql_app, monkeypatch):
+    graphql_app.keeper = asgi.SnapshotKeeper(create_async_db_engine(f'sqlite+aiosqlite:///{db_file}'))
+
+    def no_sync_db():
+        raise AssertionError('the event loop path must not touch the sync session')
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', no_sync_db)
+
+    resp = _client(graphql_app).get('/graphql', params={'query': '{ countries { name } }'})
+    assert resp.json()['data'] == {'countries': [{'name': 'Asgiland'}, {'name': 'Uvicornia'}]}
+    assert cache.peek() is not None
+
+
+def test_mutations_are_rejected_over_get(db_file, graphql_app):
+    from graphql import parse, validate
+    mutation = 'mutation { addCountry(countryData: {name: "Getland", alpha2Code: "XG"}) { ok } }'
+    # a valid document, so only the method can be what rejects it
+    assert validate(schema, parse(mutation)) == []
+    resp = _client(graphql_app).get('/graphql', params={'query': mutation})
+    assert resp.status_code == 405
+    assert resp.headers['allow'] == 'POST'
+    import schema as s
+    assert s.get_db_session().query(CountryModel).filter_by(alpha2_code='XG').count() == 0
+
+
+def test_invalid_documents_report_errors(graphql_app):
+    resp = _client(graphql_app).post('/graphql', json={'query': '{ nope }'})
+    assert resp.status_code == 400
+    assert 'nope' in resp.json()['errors'][0]['message']
+
+
+def test_async_database_url_picks_async_drivers():
+    from database import async_database_url
+    assert async_database_url('postgresql+psycopg2://u:p@h/db').drivername == 'postgresql+asyncpg'
+    assert async_database_url('sqlite:///x.db').drivername == 'sqlite+aiosqlite'
+
+
+def test_db_only_fields_run_in_the_thread_pool(db_file, graphql_app, monkeypatch):
+    import threading
+    import schema as s
+    graphql_app.keeper = asgi.SnapshotKeeper(create_async_db_engine(f'sqlite+aiosqlite:///{db_file}'))
+    session = s.get_db_session()
+    threads = []
+
+    def recording_session():
+        threads.append(threading.current_thread().name)
+        return session
+    monkeypatch.setattr(s, 'get_db_session', recording_session)
+
+    query = 'query { ...changes } fragment changes on Query { countriesChangedSince { cursor } }'
+    resp = _client(graphql_app).post('/graphql', json={'query': query})
+    assert resp.json()['data']['countriesChangedSince']['cursor']
+    assert threads and all(name.startswith('graphql-db') for name in threads)
+    assert asgi.root_fields(graphql_app.backend.document_from_string(schema, query).document_ast) == {'countriesChangedSince'}
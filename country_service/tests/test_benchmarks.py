@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine, event
+
+from benchmarks import datagen, suite
+
+
+def test_generator_is_deterministic_with_unique_codes():
+    records = list(datagen.api_records(700, seed=3))
+    assert records == list(datagen.api_records(700, seed=3))
+    assert records[:10] == list(datagen.api_records(10, seed=3))
+
+    alpha2 = [r['alpha2Code'] for r in records if r['alpha2Code']]
+    assert len(alpha2) == len(set(alpha2)) == 624
+    assert not any(code[0] in datagen.FREE_CODE_LETTERS for code in alpha2)
+    # past the alpha-2 code space, rows are code-less territories
+    assert records[-1]['alpha2Code'] is None and records[-1]['alpha3Code']
+    assert len({r['name'] for r in records}) == 700
+    assert {'code', 'name', 'symbol'} == set(records[0]['currencies'][0])
+
+
+def test_suite_runs_every_scenario_and_compares_baselines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bench.sqlite3'}"
+    results = suite.run_suite([url], [40], iterations=3, warmup=1, ingest_runs=1, log=lambda line: None)
+
+    scenarios = {r['scenario'] for r in results}
+    assert {'countries_page_last', 'country_by_alpha3', 'countries_near_2000km', 'add_country', 'ingest_countries'} <= scenarios
+    assert all(r['database'] == 'sqlite' and r['rows'] == 40 and r['p50_ms'] > 0 for r in results)
+    assert next(r for r in results if r['scenario'] == 'ingest_countries')['rows_per_s'] > 0
+
+    slower = [dict(r, p50_ms=r['p50_ms'] * 2) for r in results]
+    lines, regressed = suite.compare(slower, {'results': results}, threshold=0.5)
+    assert regressed and len(lines) == len(results)
+    assert suite.compare(results, {'results': results}, threshold=0.5)[1] is False
+
+
+def test_db_path_reads_from_the_database(tmp_path):
+    from database import SessionLocal, engine as app_engine
+    engine = create_engine(f"sqlite:///{tmp_path / 'bench.sqlite3'}")
+    datagen.load(engine, 20, seed=1)
+    statements = []
+    try:
+        bench = suite.Bench(engine, 20, seed=1, iterations=2, warmup=0)
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        results = bench.run_reads('db')
+    finally:
+        SessionLocal.remove()
+        SessionLocal.configure(bind=app_engine)
+    # every timed read ran SQL, not just the first one that would load a snapshot
+    assert len(statements) >= len(results) * 2
+    assert not any('FROM countries' in sql and 'LIMIT' not in sql and 'WHERE' not in sql for sql in statements)
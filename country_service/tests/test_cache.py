@@ -0,0 +1,79 @@
+import cache
+from schema import schema
+from models import Country as CountryModel
+
+
+def test_reads_are_served_from_snapshot(db_session, monkeypatch):
+    db_session.add(CountryModel(name='Cacheland', alpha2_code='CL', latitude=1.0, longitude=1.0))
+    db_session.commit()
+
+    import schema as s
+    calls = {'count': 0}
+
+    def counting_session():
+        calls['count'] += 1
+        return db_session
+    monkeypatch.setattr(s, 'get_db_session', counting_session)
+
+    for query in (
+        '''query { country(alpha2Code: "CL") { name } }''',
+        '''query { country(name: "cacheland") { name } }''',
+        '''query { countries(limit: 5) { name } }''',
+        '''query { countriesNear(latitude: 1.0, longitude: 1.0) { name } }''',
+    ):
+        result = schema.execute(query)
+        assert not result.errors
+        assert 'Cacheland' in str(result.data)
+
+    # a single load served all four reads
+    assert calls['count'] == 1
+
+
+def test_mutation_invalidates_snapshot(db_session, monkeypatch, fake_event_redis):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    result = schema.execute('''query { country(alpha2Code: "ZZ") { name } }''')
+    assert result.data['country'] is None
+
+    # published through the shared events client
+    pubsub = fake_event_redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(cache.INVALIDATION_CHANNEL)
+    import tasks
+    monkeypatch.setattr(tasks.notify_country_added, 'delay', lambda *a, **k: None)
+
+    result = schema.execute('''mutation { addCountry(countryData: {name: "Zedland", alpha2Code: "ZZ"}) { ok } }''')
+    assert not result.errors
+    messages = [pubsub.get_message(timeout=0.1) for _ in range(3)]
+    assert [m['data'] for m in messages if m] == [b'invalidate']
+
+    result = schema.execute('''query { country(alpha2Code: "ZZ") { name } }''')
+    assert result.data['country']['name'] == 'Zedland'
+
+
+def test_disconnected_listener_falls_back_to_db(db_session, monkeypatch):
+    class Disconnected:
+        connected = False
+    monkeypatch.setattr(cache, '_listener', Disconnected())
+    assert cache.current(lambda: db_session) is None
+
+
+def test_negative_limits_are_rejected_on_snapshot_and_db_paths(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    for i in range(3):
+        db_session.add(CountryModel(name=f'Edge{i}', alpha2_code=f'E{i}', latitude=1.0, longitude=1.0))
+    db_session.commit()
+
+    queries = {
+        '{ countries(limit: -1) { name } }': "'limit' must not be negative.",
+        '{ countries(offset: -1) { name } }': "'offset' must not be negative.",
+        '{ searchCountries(prefix: "Edge", limit: -1) { name } }': "'limit' must not be negative.",
+        '{ countriesNear(latitude: 1.0, longitude: 1.0, limit: -1) { name } }': "'limit' must not be negative.",
+        '{ countriesNear(latitude: 1.0, longitude: 1.0, nearest: -1) { name } }': "'nearest' must not be negative.",
+    }
+    for enabled in (True, False):
+        monkeypatch.setattr(cache, 'CACHE_ENABLED', enabled)
+        for query, message in queries.items():
+            result = schema.execute(query)
+            assert [e.message for e in result.errors] == [message], (enabled, query)
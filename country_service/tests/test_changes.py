@@ -0,0 +1,105 @@
+import json
+
+from sqlalchemy import text
+
+import changes
+from models import Country as CountryModel, OutboxEvent
+from schema import schema
+
+CHANGES = '''
+query($cursor: String, $limit: Int) {
+    countriesChangedSince(cursor: $cursor, limit: $limit) {
+        countries { alpha2Code name }
+        tombstones { alpha2Code }
+        cursor
+        hasMore
+    }
+}
+'''
+
+
+def _changes(cursor=None, limit=100):
+    result = schema.execute(CHANGES, variable_values={'cursor': cursor, 'limit': limit})
+    assert not result.errors, result.errors
+    return result.data['countriesChangedSince']
+
+
+def _ingest(monkeypatch, payload):
+    import tasks
+
+    class DummyResp:
+        status_code = 200
+        headers = {}
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size=1):
+            yield json.dumps(payload).encode()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    monkeypatch.setattr('tasks.requests.get', lambda *a, **k: DummyResp())
+    tasks.ingest_countries()
+
+
+def test_delta_sync_returns_only_real_changes(db_session, monkeypatch):
+    import schema as s
+    import tasks
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(tasks, 'get_db_session', lambda: db_session)
+
+    _ingest(monkeypatch, [{'name': 'Alpha', 'alpha2Code': 'AA'}, {'name': 'Beta', 'alpha2Code': 'BB'}])
+    full = _changes()
+    assert [c['alpha2Code'] for c in full['countries']] == ['AA', 'BB']
+    assert _changes(full['cursor'])['countries'] == []
+
+    alpha = db_session.query(CountryModel).filter_by(alpha2_code='AA').one()
+    seq, synced_at = alpha.change_seq, alpha.synced_at
+    # Alpha is sent again unchanged, Beta really changes
+    _ingest(monkeypatch, [{'name': 'Alpha', 'alpha2Code': 'AA'}, {'name': 'Beta Republic', 'alpha2Code': 'BB'}])
+    delta = _changes(full['cursor'])
+    assert delta['countries'] == [{'alpha2Code': 'BB', 'name': 'Beta Republic'}]
+    alpha = db_session.query(CountryModel).filter_by(alpha2_code='AA').one()
+    assert (alpha.change_seq, alpha.synced_at) == (seq, synced_at)
+    # the countryUpdated subscription is fed from these
+    updates = [e.payload['countries'] for e in db_session.query(OutboxEvent).filter_by(event='countries_updated').order_by(OutboxEvent.id)]
+    assert [sorted((c['name'], c['created']) for c in update) for update in updates] == [
+        [('Alpha', True), ('Beta', True)], [('Beta Republic', False)],
+    ]
+
+    result = schema.execute('mutation { addCountry(countryData: {name: "Gamma", alpha2Code: "GG"}) { ok } }')
+    assert not result.errors
+    db_session.execute(text("DELETE FROM countries WHERE alpha2_code = 'AA'"))
+    db_session.commit()
+    delta = _changes(delta['cursor'])
+    assert [c['alpha2Code'] for c in delta['countries']] == ['GG']
+    assert delta['tombstones'] == [{'alpha2Code': 'AA'}]
+
+
+def test_delta_sync_pages_with_limit(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    db_session.add_all([CountryModel(name=name, alpha2_code=code) for name, code in [('A', 'AA'), ('B', 'BB'), ('C', 'CC')]])
+    db_session.flush()
+    assert changes.stamp(db_session) == 3
+    assert changes.stamp(db_session) == 0
+    db_session.commit()
+
+    first = _changes(limit=2)
+    assert ([c['alpha2Code'] for c in first['countries']], first['hasMore']) == (['AA', 'BB'], True)
+    rest = _changes(first['cursor'], limit=2)
+    assert ([c['alpha2Code'] for c in rest['countries']], rest['hasMore']) == (['CC'], False)
+
+    result = schema.execute(CHANGES, variable_values={'cursor': 'not-a-cursor'})
+    assert 'Invalid cursor' in str(result.errors[0])
+
+
+def test_change_bookkeeping_is_not_part_of_the_api():
+    for field in ('changeSeq', 'contentHash'):
+        result = schema.execute(f'{{ countries {{ {field} }} }}')
+        assert 'Cannot query field' in str(result.errors[0])
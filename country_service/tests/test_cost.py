@@ -0,0 +1,115 @@
+import pytest
+from flask import Flask
+from graphql import parse, validate
+from graphql.validation.rules import specified_rules
+
+import cost
+from graphql_view import CountryGraphQLView, CachedDocumentBackend, PersistedQueryStore
+from schema import schema
+from models import Country as CountryModel
+
+
+def price(query, variables=None, **kwargs):
+    return cost.analyze(schema, parse(query), variable_values=variables, **kwargs)
+
+
+def test_list_fields_multiply_their_selection_by_the_page_size():
+    assert price('{ countries(limit: 50) { name } }').cost == 50
+    # argument defaults count when the client leaves the limit out
+    assert price('{ countries { name } }').cost == 10
+    assert price('query($n: Int) { countries(limit: $n) { name } }', {'n': 30}).cost == 30
+    # a connection hands its page size down to `edges`
+    assert price('{ countriesConnection(first: 20) { edges { node { name } } pageInfo { hasNextPage } } }').cost == 1 + 20 * 2 + 1
+    # weighted root fields; `nearest` wins over `limit`
+    assert price('{ countriesNear(latitude: 0, longitude: 0, limit: 50, nearest: 5) { name } }').cost == 3 + 5
+    assert price('{ country(alpha2Code: "FR") { name } }').cost == 1
+
+
+def test_batch_mutations_are_priced_by_their_input():
+    query = 'mutation($c: [CountryInput!]!) { addCountries(countries: $c) { ok countries { name } conflicts { index } } }'
+    countries = [{'name': f'C{i}', 'alpha2Code': 'CC'} for i in range(40)]
+    # 10 + 40 rows written, then the two result lists are as long as the input
+    assert price(query, {'c': countries}).cost == 10 + 40 + 1 * (1 + 40 + 40)
+    assert price('{ countriesChangedSince(limit: 20) { cursor countries { name } } }').cost == 3 + 1 * (1 + 20)
+
+
+def test_fragments_and_aliases_are_priced_per_use():
+    query = '''
+        fragment Names on CountryType { name }
+        query { a: countries(limit: 10) { ...Names } b: countries(limit: 20) { ... on CountryType { name } } }
+    '''
+    assert price(query).cost == 30
+
+
+def test_limits_are_enforced_before_execution():
+    report = price('{ countries(limit: 500) { name } }')
+    assert [e.message for e in report.errors] == ["'limit' on Query.countries must not exceed 100 (got 500)."]
+
+    report = price('query($n: Int) { countriesConnection(last: $n) { edges { node { name } } } }', {'n': 1000})
+    assert "'last' on Query.countriesConnection must not exceed 100 (got 1000)." in report.errors[0].message
+
+    aliased = '{ %s }' % ' '.join(f'c{i}: countries(limit: 100) {{ name }}' for i in range(11))
+    report = price(aliased)
+    assert report.cost == 1100
+    assert report.errors[0].message == 'Query cost 1100 exceeds the maximum of 1000.'
+
+    # negative page sizes and offsets would otherwise be priced at 0 and slice off almost nothing
+    for query in ('{ countries(limit: -1) { name } }', '{ countries(offset: -5) { name } }',
+                  '{ countriesNear(latitude: 0, longitude: 0, limit: -1) { name } }',
+                  '{ searchCountries(prefix: "a", limit: -1) { name } }'):
+        report = price(query)
+        assert report.errors and 'must not be negative' in report.errors[0].message, query
+    report = price('query($n: Int) { countriesNear(latitude: 0, longitude: 0, nearest: $n) { name } }', {'n': -3})
+    assert report.errors[0].message == "'nearest' on Query.countriesNear must not be negative (got -3)."
+
+    # undecidable (bad variables): left for execution to report
+    assert price('query($n: Int!) { countries(limit: $n) { name } }') is None
+
+
+def test_depth_and_alias_limits_are_validation_rules(monkeypatch):
+    rules = specified_rules + cost.VALIDATION_RULES
+    monkeypatch.setattr(cost.DepthLimitRule, 'limit', 3)
+    monkeypatch.setattr(cost.AliasLimitRule, 'limit', 2)
+
+    assert validate(schema, parse('{ countriesConnection { edges { node { name } } } }'), rules)[0].message == \
+        'Query depth 4 exceeds the maximum of 3.'
+    assert validate(schema, parse('{ a: countries { name } b: countries { n: name } }'), rules)[0].message == \
+        'Query uses 3 aliases; the maximum is 2.'
+    # introspection is not counted
+    assert validate(schema, parse('{ __schema { types { fields { type { ofType { name } } } } } }'), rules) == []
+
+
+@pytest.fixture
+def client(db_session, monkeypatch):
+    db_session.add(CountryModel(name='Costland', alpha2_code='CL'))
+    db_session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    app = Flask(__name__)
+    app.add_url_rule('/graphql', view_func=CountryGraphQLView.as_view(
+        'graphql', schema=schema, backend=CachedDocumentBackend(), persisted_queries=PersistedQueryStore(url=None),
+    ))
+    return app.test_client()
+
+
+def test_view_reports_cost_and_rejects_expensive_queries(client, monkeypatch):
+    import schema as s
+    resp = client.post('/graphql', json={'query': '{ countries(limit: 25) { name } }'})
+    assert resp.status_code == 200
+    assert resp.get_json() == {
+        'data': {'countries': [{'name': 'Costland'}]},
+        'extensions': {'cost': {'requested': 25, 'maximum': 1000}},
+    }
+
+    def never_called():
+        raise AssertionError('over-budget queries must not execute')
+    monkeypatch.setattr(s, 'get_db_session', never_called)
+    resp = client.post('/graphql', json={
+        'query': 'query($n: Int) { countries(limit: $n) { name } }', 'variables': {'n': 101},
+    })
+    assert resp.status_code == 400
+    body = resp.get_json()
+    assert 'data' not in body
+    assert body['errors'][0]['message'] == "'limit' on Query.countries must not exceed 100 (got 101)."
+    assert body['extensions'] == {'cost': {'requested': 101, 'maximum': 1000}}
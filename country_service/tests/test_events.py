@@ -0,0 +1,36 @@
+import json
+
+import fakeredis
+import pytest
+
+import events
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+
+def test_stream_transport_appends_capped_entries(client, monkeypatch):
+    monkeypatch.setattr(events, 'EVENT_STREAM_MAXLEN', 5)
+    for i in range(20):
+        events.publish_event({'event': 'country_added', 'name': f'C{i}'}, client=client, transport='stream')
+    entries = client.xrange(events.EVENT_STREAM)
+    # approximate trimming keeps at least MAXLEN entries, and never all of them
+    assert 5 <= len(entries) < 20
+    assert json.loads(entries[-1][1][b'payload'])['name'] == 'C19'
+
+
+def test_pubsub_transport_does_not_touch_the_stream(client):
+    pubsub = client.pubsub()
+    pubsub.subscribe(events.EVENT_CHANNEL)
+    pubsub.get_message(timeout=0.1)
+    events.publish_event({'event': 'country_added', 'name': 'Publand'}, client=client, transport='pubsub')
+    message = pubsub.get_message(timeout=0.1)
+    assert json.loads(message['data'])['name'] == 'Publand'
+    assert client.exists(events.EVENT_STREAM) == 0
+
+
+def test_unknown_transport_is_rejected(client):
+    with pytest.raises(ValueError):
+        events.publish_event({}, client=client, transport='carrier-pigeon')
@@ -0,0 +1,69 @@
+import io
+import csv
+import json
+import gzip
+
+import pytest
+from flask import Flask, Response, request
+
+import export
+from models import Country as CountryModel
+
+
+@pytest.fixture
+def client(db_session, engine):
+    db_session.add_all([
+        CountryModel(name='Zedland', alpha2_code='ZD', population=7, languages=[{'name': 'Zed'}], source='manual'),
+        CountryModel(name='Ästland', alpha2_code='AE', latitude=1.5, timezones=['UTC+01:00']),
+    ])
+    db_session.commit()
+
+    app = Flask(__name__)
+
+    @app.route('/export')
+    def export_countries():
+        try:
+            chunks, headers = export.prepare(engine, request.args.get('format'), request.headers.get('Accept-Encoding'),
+                                             batch_size=1)
+        except export.ExportError as e:
+            return {'error': str(e)}, e.status_code
+        return Response(chunks, headers=headers)
+    return app.test_client()
+
+
+def test_ndjson_is_streamed_in_batches_and_gzipped_on_request(client, engine):
+    resp = client.get('/export')
+    assert resp.headers['Content-Type'] == 'application/x-ndjson'
+    assert 'Content-Length' not in resp.headers
+    rows = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert [r['name'] for r in rows] == ['Zedland', 'Ästland']
+    assert rows[0]['languages'] == [{'name': 'Zed'}] and rows[0]['source'] == 'manual'
+    assert len(rows[1]['id']) == 36 and 'name_normalized' not in rows[1]
+
+    # one chunk per batch (batch_size=1), not one big body
+    assert len(list(export.ndjson_chunks(export.iter_batches(engine, 1)))) == 2
+
+    resp = client.get('/export', headers={'Accept-Encoding': 'br, gzip;q=0.8'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert [json.loads(line)['alpha2_code'] for line in gzip.decompress(resp.data).decode().splitlines()] == ['ZD', 'AE']
+    assert 'Content-Encoding' not in client.get('/export', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+
+
+def test_csv_and_parquet(client):
+    resp = client.get('/export?format=csv')
+    rows = list(csv.DictReader(io.StringIO(resp.data.decode())))
+    assert [r['alpha2_code'] for r in rows] == ['ZD', 'AE']
+    assert json.loads(rows[1]['timezones']) == ['UTC+01:00'] and rows[0]['latitude'] == ''
+
+    pq = pytest.importorskip('pyarrow.parquet')
+    resp = client.get('/export?format=parquet')
+    table = pq.read_table(io.BytesIO(resp.data))
+    assert table.num_rows == 2
+    assert table.column('population').to_pylist() == [7, None]
+    assert pq.ParquetFile(io.BytesIO(resp.data)).metadata.num_row_groups == 2
+
+
+def test_unknown_format_is_rejected(client):
+    resp = client.get('/export?format=xml')
+    assert resp.status_code == 400
+    assert 'Unknown export format' in resp.get_json()['error']
@@ -0,0 +1,61 @@
+import pytest
+
+import cache
+import filters
+from models import Country as CountryModel
+from schema import schema
+
+QUERY = '''
+query($filter: CountryFilter, $limit: Int) {
+    countries(filter: $filter, limit: $limit) { alpha2Code }
+}
+'''
+
+
+@pytest.fixture
+def countries(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    db_session.add_all([
+        CountryModel(name='Alpha', alpha2_code='AA', region='Europe', subregion='Western Europe', population=1000,
+                     timezones=['UTC+01:00'], currencies=[{'code': 'EUR', 'name': 'Euro'}],
+                     languages=[{'iso639_1': 'fr', 'iso639_2': 'fra', 'name': 'French'}]),
+        CountryModel(name='Beta', alpha2_code='BB', region='Europe', subregion='Northern Europe', population=50,
+                     timezones=['UTC+00:00', 'UTC+01:00'], currencies=[{'code': 'GBP'}, {'code': 'EUR'}],
+                     languages=[{'iso639_1': 'en', 'iso639_2': 'eng'}]),
+        # mapping-shaped JSON, as some upstream feeds send it
+        CountryModel(name='Gamma', alpha2_code='GG', region='Africa', subregion='Eastern Africa', population=400,
+                     timezones=['UTC+03:00'], currencies={'KES': {'name': 'Kenyan shilling'}},
+                     languages={'eng': 'English', 'swa': 'Swahili'}),
+        CountryModel(name='Delta', alpha2_code='DD', region='Africa'),
+    ])
+    db_session.commit()
+
+
+@pytest.mark.parametrize('cached', [True, False])
+@pytest.mark.parametrize('filter_, expected', [
+    ({}, ['AA', 'BB', 'DD', 'GG']),
+    ({'region': 'Europe'}, ['AA', 'BB']),
+    ({'subregion': 'Eastern Africa'}, ['GG']),
+    ({'languageCode': 'EN'}, ['BB']),
+    ({'languageCode': 'eng'}, ['BB', 'GG']),
+    ({'currencyCode': 'eur'}, ['AA', 'BB']),
+    ({'currencyCode': 'KES'}, ['GG']),
+    ({'timezone': 'UTC+01:00'}, ['AA', 'BB']),
+    ({'populationMin': 100}, ['AA', 'GG']),
+    ({'populationMin': 50, 'populationMax': 400}, ['BB', 'GG']),
+    ({'region': 'Europe', 'currencyCode': 'GBP', 'populationMax': 100}, ['BB']),
+    ({'region': 'Oceania'}, []),
+])
+def test_countries_filter(countries, monkeypatch, cached, filter_, expected):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', cached)
+    result = schema.execute(QUERY, variable_values={'filter': filter_, 'limit': 10})
+    assert not result.errors
+    assert [c['alpha2Code'] for c in result.data['countries']] == expected
+
+
+def test_filter_index_pages_after_filtering(countries, db_session):
+    snap = cache.load_snapshot(db_session)
+    criteria = filters.Criteria(region='Europe')
+    assert [c.alpha2_code for c in snap.page(1, 1, criteria)] == ['BB']
+    assert not filters.Criteria.from_input({'region': None})
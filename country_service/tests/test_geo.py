@@ -0,0 +1,90 @@
+import math
+import random
+
+import pytest
+
+import cache
+import geo
+from schema import schema
+from models import Country as CountryModel
+
+
+def _random_points(n, seed=7):
+    rnd = random.Random(seed)
+    return [(rnd.uniform(-90, 90), rnd.uniform(-180, 180), 'P%d' % i) for i in range(n)]
+
+
+def _brute_force(points, latitude, longitude, radius_km=None, k=None):
+    hits = sorted((geo.haversine_km(lat, lon, latitude, longitude), name) for lat, lon, name in points)
+    if radius_km is not None:
+        hits = [h for h in hits if h[0] <= radius_km]
+    if k is not None:
+        hits = hits[:k]
+    return [name for _, name in hits]
+
+
+# includes targets next to a pole and on the antimeridian
+TARGETS = [(0.0, 0.0), (48.85, 2.35), (-33.9, 151.2), (89.5, 10.0), (-89.9, -170.0), (10.0, 179.9), (-5.0, -179.95)]
+
+
+@pytest.mark.parametrize('latitude,longitude', TARGETS)
+def test_spatial_index_matches_brute_force(latitude, longitude):
+    points = _random_points(2000)
+    index = geo.SpatialIndex(points)
+    for radius_km in (0, 150, 800, 3000, 12000, 25000):
+        got = [name for _, name in index.within(latitude, longitude, radius_km)]
+        assert got == _brute_force(points, latitude, longitude, radius_km=radius_km)
+    for k in (1, 5, 40):
+        got = [name for _, name in index.nearest(latitude, longitude, k)]
+        assert got == _brute_force(points, latitude, longitude, k=k)
+
+
+def test_sql_path_matches_brute_force(db_session, monkeypatch):
+    points = _random_points(300, seed=11)
+    for i, (lat, lon, name) in enumerate(points):
+        db_session.add(CountryModel(name=name, alpha2_code='%02d' % (i % 100) if i < 100 else None, latitude=lat, longitude=lon))
+    db_session.commit()
+
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    query = '''query($lat: Float!, $lon: Float!, $r: Float, $k: Int) {
+        countriesNear(latitude: $lat, longitude: $lon, radiusKm: $r, limit: 500, nearest: $k) { name }
+    }'''
+
+    def names(variables):
+        result = schema.execute(query, variable_values=variables)
+        assert not result.errors
+        return [x['name'] for x in result.data['countriesNear']]
+
+    for cache_enabled in (False, True):
+        monkeypatch.setattr(cache, 'CACHE_ENABLED', cache_enabled)
+        for lat, lon in TARGETS:
+            for radius_km in (500, 2500, 9000):
+                assert names({'lat': lat, 'lon': lon, 'r': radius_km}) == _brute_force(points, lat, lon, radius_km=radius_km)
+            for k in (1, 7):
+                assert names({'lat': lat, 'lon': lon, 'k': k}) == _brute_force(points, lat, lon, k=k)
+
+
+def test_points_on_the_radius_edge_are_found(db_session, monkeypatch):
+    # 0.05% inside the radius: outside an unscaled earth_box, which uses a 6378 km sphere
+    radius_km = 1000.0
+    edge = math.degrees(radius_km * 0.9995 / geo.EARTH_KM)
+    beyond = math.degrees(radius_km * 1.0005 / geo.EARTH_KM)
+    db_session.add(CountryModel(name='Edge', latitude=edge, longitude=0.0))
+    db_session.add(CountryModel(name='Beyond', latitude=-beyond, longitude=0.0))
+    db_session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    for cache_enabled in (False, True):
+        monkeypatch.setattr(cache, 'CACHE_ENABLED', cache_enabled)
+        result = schema.execute('{ countriesNear(latitude: 0, longitude: 0, radiusKm: 1000) { name } }')
+        assert result.data == {'countriesNear': [{'name': 'Edge'}]}
+
+    # the box covers the same angle on earth()'s sphere as the radius does on ours
+    angle = radius_km / geo.EARTH_KM
+    assert geo.earth_box_meters(radius_km) / 1000.0 == pytest.approx(angle * geo.PG_EARTH_KM)
+    # measured on that sphere, the edge point lies beyond an unscaled radius_km box
+    edge_on_pg_sphere_m = math.radians(edge) * geo.PG_EARTH_KM * 1000.0
+    assert radius_km * 1000.0 < edge_on_pg_sphere_m < geo.earth_box_meters(radius_km)
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from flask import Flask
+
+import graphql_view
+from graphql_view import CountryGraphQLView, CachedDocumentBackend, PersistedQueryStore, query_hash
+from schema import schema
+from models import Country as CountryModel
+
+QUERY = 'query { country(alpha2Code: "VW") { name } }'
+
+
+@pytest.fixture
+def client(db_session, monkeypatch):
+    db_session.add(CountryModel(name='Viewland', alpha2_code='VW'))
+    db_session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    app = Flask(__name__)
+    app.add_url_rule('/graphql', view_func=CountryGraphQLView.as_view(
+        'graphql',
+        schema=schema,
+        backend=CachedDocumentBackend(max_size=2),
+        persisted_queries=PersistedQueryStore(url=None),
+        get_max_age=60,
+    ))
+    return app.test_client()
+
+
+def test_documents_are_parsed_and_validated_once(client, monkeypatch):
+    calls = {'parse': 0, 'validate': 0}
+    real_parse, real_validate = graphql_view.parse, graphql_view.validate
+
+    def counting(name, fn):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(graphql_view, 'parse', counting('parse', real_parse))
+    monkeypatch.setattr(graphql_view, 'validate', counting('validate', real_validate))
+
+    for _ in range(3):
+        resp = client.post('/graphql', json={'query': QUERY})
+        assert resp.get_json() == {'data': {'country': {'name': 'Viewland'}}, 'extensions': {'cost': {'requested': 1, 'maximum': 1000}}}
+    assert calls == {'parse': 1, 'validate': 1}
+
+    # validation errors are cached with the document and still reported
+    for _ in range(2):
+        resp = client.post('/graphql', json={'query': 'query { nope }'})
+        assert resp.status_code == 400
+    assert calls == {'parse': 2, 'validate': 2}
+
+
+def test_automatic_persisted_query_round_trip(client):
+    extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(QUERY)}}
+
+    # unknown hash: the client is asked to send the full query
+    resp = client.get('/graphql', query_string={'extensions': json.dumps(extensions)})
+    assert resp.get_json()['errors'][0]['message'] == 'PersistedQueryNotFound'
+    assert resp.headers['Cache-Control'] == 'no-store'
+
+    resp = client.post('/graphql', json={'query': QUERY, 'extensions': extensions})
+    assert resp.get_json()['data']['country']['name'] == 'Viewland'
+
+    # from now on the hash alone is enough, including over cacheable GET
+    resp = client.get('/graphql', query_string={'extensions': json.dumps(extensions)})
+    assert resp.get_json()['data']['country']['name'] == 'Viewland'
+    assert resp.headers['Cache-Control'] == 'public, max-age=60'
+
+
+def test_persisted_query_hash_mismatch_is_rejected(client):
+    extensions = {'persistedQuery': {'version': 1, 'sha256Hash': '0' * 64}}
+    resp = client.post('/graphql', json={'query': QUERY, 'extensions': extensions})
+    assert resp.status_code == 400
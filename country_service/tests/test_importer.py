@@ -0,0 +1,91 @@
+import csv
+import gzip
+import json
+
+import importer
+from models import Country, RegionStat
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['name', 'alpha2_code', 'alpha3_code', 'capital', 'population', 'latitude', 'longitude', 'languages'])
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+
+def test_import_csv_merges_with_ownership_rules(db_session, tmp_path):
+    db_session.add(Country(name='Old External', alpha2_code='EX', alpha3_code='EXT', capital='Old Capital', source='external'))
+    db_session.add(Country(name='Hand Made', alpha2_code='MN', source='manual'))
+    db_session.commit()
+
+    path = tmp_path / 'countries.csv'
+    _write_csv(path, [
+        {'name': 'New External', 'alpha2_code': 'ex', 'alpha3_code': 'EXT', 'capital': '', 'population': '7'},
+        {'name': 'Overwritten?', 'alpha2_code': 'MN'},
+        {'name': 'Brand New', 'alpha2_code': 'BN', 'alpha3_code': 'BNW', 'latitude': '1.5', 'longitude': '2.5',
+         'languages': json.dumps([{'name': 'English'}])},
+        {'name': 'Duplicate', 'alpha2_code': 'BN'},
+    ])
+    stats = importer.import_file(db_session, str(path))
+    db_session.commit()
+
+    assert stats == {'rows': 4, 'inserted': 1, 'updated': 1, 'protected': 1, 'duplicate': 1, 'invalid': 0, 'errors': []}
+    ex = db_session.query(Country).filter_by(alpha2_code='EX').one()
+    db_session.refresh(ex)
+    # blank cells keep what we had
+    assert (ex.name, ex.capital, ex.population) == ('New External', 'Old Capital', 7)
+    assert db_session.query(Country).filter_by(alpha2_code='MN').one().name == 'Hand Made'
+    bn = db_session.query(Country).filter_by(alpha2_code='BN').one()
+    assert (bn.name, bn.name_normalized, bn.source, bn.latitude) == ('Brand New', 'brand new', 'external', 1.5)
+    assert bn.languages == [{'name': 'English'}]
+    summary = db_session.query(RegionStat).one()
+    assert (summary.region, summary.country_count, summary.population) == ('', 3, 7)
+
+
+def test_import_reports_invalid_rows_and_alpha3_conflicts(db_session, tmp_path):
+    db_session.add(Country(name='Taken', alpha2_code='TK', alpha3_code='TKN', source='manual'))
+    db_session.commit()
+
+    path = tmp_path / 'territories.ndjson.gz'
+    with gzip.open(path, 'wt') as f:
+        for record in [
+            {'name': 'Fine', 'alpha2Code': 'FN', 'alpha3Code': 'FIN', 'latlng': [1, 2]},
+            {'name': '', 'alpha2Code': 'NO'},
+            {'name': 'Long Code', 'alpha2Code': 'ABC'},
+            {'name': 'Far North', 'alpha2Code': 'FA', 'latlng': [95, 0]},
+            {'name': 'Thief', 'alpha2Code': 'TH', 'alpha3Code': 'TKN'},
+            {'name': 'Copycat', 'alpha2Code': 'CC', 'alpha3Code': 'FIN'},
+        ]:
+            f.write(json.dumps(record) + '\n')
+        f.write('{not json\n')
+
+    stats = importer.import_file(db_session, str(path))
+    db_session.commit()
+
+    assert (stats['rows'], stats['inserted'], stats['invalid']) == (7, 1, 6)
+    assert stats['errors'] == [
+        'line 2: name must not be empty',
+        'line 3: alpha2_code must be two letters',
+        'line 4: latitude must be between -90 and 90',
+        'line 7: invalid JSON',
+        'line 5: alpha3_code TKN already belongs to another country',
+        'line 6: alpha3_code FIN already belongs to another country',
+    ]
+    assert sorted(c.alpha2_code for c in db_session.query(Country)) == ['FN', 'TK']
+
+
+def test_import_task_commits_and_invalidates(db_session, tmp_path, monkeypatch):
+    import tasks
+    import cache
+    monkeypatch.setattr(tasks, 'get_db_session', lambda: db_session)
+    published = []
+    monkeypatch.setattr(cache, 'publish_invalidation', lambda: published.append(True))
+
+    path = tmp_path / 'countries.csv'
+    _write_csv(path, [{'name': 'Mockland', 'alpha2_code': 'MK', 'alpha3_code': 'MCK'}])
+    stats = tasks.import_countries_file(str(path))
+
+    assert stats['inserted'] == 1
+    assert published == [True]
+    assert db_session.query(Country).filter_by(alpha2_code='MK').one().name == 'Mockland'
@@ -1,5 +1,6 @@
 from tasks import ingest_countries
 import json
+import pytest
 
 def test_ingest_happy_path(db_session, monkeypatch):
     # mock requests.get to return sample payload matching API structure
@@ -13,10 +14,18 @@ def test_ingest_happy_path(db_session, monkeypatch):
         }
     ]
     class DummyResp:
+        status_code = 200
+        headers = {}
         def raise_for_status(self):
             pass
         def json(self):
             return sample
+        def iter_content(self, chunk_size=1):
+            yield json.dumps(sample).encode()
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            pass
     monkeypatch.setattr('tasks.requests.get', lambda *a, **k: DummyResp())
     
     # Patch get_db_session in tasks to use our test session
@@ -33,3 +42,85 @@ def test_ingest_happy_path(db_session, monkeypatch):
     assert c.name == 'Mockland'
     assert c.latitude == 10.0
     assert c.longitude == 20.0
+
+def test_upsert_external_counts_and_protects_manual(db_session):
+    from bulk import row_from_api, upsert_external
+    from models import Country
+    db_session.add(Country(name='Old External', alpha2_code='EX', capital='Old Capital', population=5, source='external'))
+    db_session.add(Country(name='Hand Made', alpha2_code='MN', source='manual'))
+    db_session.commit()
+
+    payload = [
+        {"name": "New External", "alpha2Code": "ex", "population": 0},
+        {"name": "Overwritten?", "alpha2Code": "MN"},
+        {"name": "Brand New", "alpha2Code": "BN", "latlng": [1.5, 2.5]},
+        {"name": "Duplicate", "alpha2Code": "BN"},
+        {"name": "No Code"},
+    ]
+    stats = upsert_external(db_session, (row_from_api(item) for item in payload), batch_size=2)
+    db_session.commit()
+
+    assert stats == {'inserted': 1, 'updated': 1, 'skipped': 2, 'protected': 1}
+    ex = db_session.query(Country).filter_by(alpha2_code='EX').one()
+    db_session.refresh(ex)
+    assert ex.name == 'New External'
+    # empty values from the API keep what we had
+    assert ex.capital == 'Old Capital'
+    assert ex.population == 5
+    assert db_session.query(Country).filter_by(alpha2_code='MN').one().name == 'Hand Made'
+    bn = db_session.query(Country).filter_by(alpha2_code='BN').one()
+    assert (bn.name, bn.source, bn.latitude, bn.longitude) == ('Brand New', 'external', 1.5, 2.5)
+
+
+def _fake_upstream(monkeypatch, body, etag):
+    seen = []
+    class Resp:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.headers = {'ETag': etag}
+            self.closed = False
+        def raise_for_status(self):
+            pass
+        def iter_content(self, chunk_size=1):
+            for i in range(0, len(body), 7):
+                yield body[i:i + 7]
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            self.closed = True
+    def fake_get(url, headers=None, **kwargs):
+        resp = Resp(304 if (headers or {}).get('If-None-Match') == etag else 200)
+        seen.append((headers or {}, resp))
+        return resp
+    monkeypatch.setattr('tasks.requests.get', fake_get)
+    return seen
+
+
+def test_ingest_skips_unchanged_upstream(db_session, monkeypatch):
+    import tasks
+    monkeypatch.setattr(tasks, 'get_db_session', lambda: db_session)
+    body = json.dumps([{"name": "Streamland", "alpha2Code": "SL"}, {"name": "Chunkia", "alpha2Code": "CK"}]).encode()
+
+    seen = _fake_upstream(monkeypatch, body, etag='"v1"')
+    assert ingest_countries() == 2
+    assert seen[-1][0] == {}
+    # same ETag -> the server answers 304 and nothing is parsed
+    assert ingest_countries() == 0
+    assert seen[-1][0]['If-None-Match'] == '"v1"'
+    assert all(resp.closed for _, resp in seen)
+
+    # new ETag but byte-identical payload -> skipped on the content hash
+    seen = _fake_upstream(monkeypatch, body, etag='"v2"')
+    monkeypatch.setattr(tasks, 'upsert_external', lambda *a, **k: pytest.fail('payload should not be parsed'))
+    assert ingest_countries() == 0
+    assert seen[-1][1].closed
+
+
+def test_iter_json_array_across_chunk_boundaries():
+    import io
+    from streaming import iter_json_array
+    items = [{"name": "Åland", "n": i, "nested": [1, {"x": "]"}]} for i in range(50)] + [12345, "tail"]
+    raw = json.dumps(items, ensure_ascii=False).encode()
+    for chunk_size in (1, 3, 64, 10 ** 6):
+        assert list(iter_json_array(io.BytesIO(raw), chunk_size)) == items
+    assert list(iter_json_array(io.BytesIO(b' [ ] '))) == []
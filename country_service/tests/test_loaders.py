@@ -0,0 +1,37 @@
+from sqlalchemy import event
+
+import cache
+from schema import schema
+from models import Country as CountryModel
+
+
+def test_aliased_country_lookups_are_batched(db_session, engine, monkeypatch):
+    for i in range(20):
+        db_session.add(CountryModel(name='Land %02d' % i, alpha2_code='B%s' % chr(65 + i), alpha3_code='BB%s' % chr(65 + i)))
+    db_session.commit()
+
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        fields = ' '.join('c%d: country(alpha2Code: "b%s") { name }' % (i, chr(65 + i)) for i in range(20))
+        fields += ' again: country(alpha2Code: "BA") { name } missing: country(alpha2Code: "ZZ") { name }'
+        fields += ' byName: country(name: "LAND 03") { alpha2Code } by3: country(alpha3Code: "bbc") { name }'
+        result = schema.execute('query { %s }' % fields, context_value={})
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    assert not result.errors
+    assert result.data['c0']['name'] == 'Land 00'
+    assert result.data['c19']['name'] == 'Land 19'
+    assert result.data['again']['name'] == 'Land 00'
+    assert result.data['missing'] is None
+    assert result.data['byName']['alpha2Code'] == 'BD'
+    assert result.data['by3']['name'] == 'Land 02'
+    # one IN (...) per key type instead of one SELECT per alias
+    assert len(statements) == 3
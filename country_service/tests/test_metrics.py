@@ -0,0 +1,59 @@
+from prometheus_client import REGISTRY
+
+import metrics
+from graphql_view import CachedDocumentBackend
+from models import Country as CountryModel
+from schema import schema
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_statements_are_counted_per_request(db_session, engine):
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(engine)  # idempotent
+    before = _value('db_statements_per_request_sum')
+    token = metrics.start_request()
+    db_session.query(CountryModel).all()
+    db_session.query(CountryModel).count()
+    metrics.finish_request(token)
+    assert _value('db_statements_per_request_sum') - before == 2
+    assert _value('db_pool_checked_out') >= 0
+
+
+def test_operations_and_root_resolvers_are_timed(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    db_session.add(CountryModel(name='Metricland', alpha2_code='MT'))
+    db_session.commit()
+    labels = {'operation_type': 'query', 'operation_name': 'Lookup'}
+    resolver = {'parent_type': 'Query', 'field': 'country'}
+    ops_before = _value('graphql_operation_duration_seconds_count', **labels)
+    resolvers_before = _value('graphql_resolver_duration_seconds_count', **resolver)
+
+    document = CachedDocumentBackend().document_from_string(schema, 'query Lookup { country(alpha2Code: "MT") { name } }')
+    result = document.execute(middleware=metrics.resolver_middleware())
+    assert not result.errors and result.data == {'country': {'name': 'Metricland'}}
+    assert _value('graphql_operation_duration_seconds_count', **labels) == ops_before + 1
+    # only the root field is timed, not `name`
+    assert _value('graphql_resolver_duration_seconds_count', **resolver) == resolvers_before + 1
+    assert _value('graphql_resolver_duration_seconds_count', parent_type='Country', field='name') == 0
+
+
+def test_operation_name_labels_are_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, '_operation_names', set())
+    monkeypatch.setattr(metrics, 'METRIC_MAX_OPERATIONS', 2)
+    assert [metrics.operation_label(n) for n in ('A', 'B', 'C', 'A', 'anonymous')] == ['A', 'B', 'other', 'A', 'anonymous']
+    monkeypatch.setattr(metrics, 'METRIC_OPERATIONS', frozenset({'Lookup'}))
+    assert [metrics.operation_label(n) for n in ('Lookup', 'A')] == ['Lookup', 'other']
+
+
+def test_pool_gauges_are_scraped_in_multiprocess_mode(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import QueuePool
+    # the in-memory test engine's pool has no gauges to report
+    metrics.instrument_engine(create_engine(f'sqlite:///{tmp_path}/pool.db', poolclass=QueuePool))
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    body, _ = metrics.render()
+    assert b'db_pool_checked_out' in body
@@ -25,3 +25,54 @@ def test_add_country_mutation(db_session, monkeypatch):
     assert result.data['addCountry']['ok'] is True
     assert result.data['addCountry']['country']['alpha2Code'] == 'NL'
     assert 'New Dollar' in result.data['addCountry']['country']['currencies']
+
+
+ADD_COUNTRIES = '''
+mutation($countries: [CountryInput!]!) {
+    addCountries(countries: $countries) {
+        ok
+        countries { name alpha2Code }
+        conflicts { index alpha2Code message }
+    }
+}
+'''
+
+
+def test_add_countries_inserts_batch_and_reports_conflicts(db_session, monkeypatch):
+    import schema as s
+    from models import Country as CountryModel, OutboxEvent
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    db_session.add(CountryModel(name='Existing', alpha2_code='EX'))
+    db_session.commit()
+
+    result = schema.schema.execute(ADD_COUNTRIES, variable_values={'countries': [
+        {'name': 'Oneland', 'alpha2Code': 'on'},
+        {'name': 'Existing again', 'alpha2Code': 'EX'},
+        {'name': 'Twoland', 'alpha2Code': 'TW', 'alpha3Code': 'TWO'},
+        {'name': 'Oneland duplicate', 'alpha2Code': 'ON'},
+    ]})
+    assert not result.errors
+    data = result.data['addCountries']
+    assert data['ok'] is False
+    assert data['countries'] == [{'name': 'Oneland', 'alpha2Code': 'ON'}, {'name': 'Twoland', 'alpha2Code': 'TW'}]
+    assert [(c['index'], c['alpha2Code']) for c in data['conflicts']] == [(1, 'EX'), (3, 'ON')]
+    assert db_session.query(CountryModel).count() == 3
+    # one event for the batch, written with it and relayed right after the commit
+    events = db_session.query(OutboxEvent).all()
+    assert len(events) == 1 and events[0].event == 'countries_added' and events[0].sent_at is not None
+    assert [c['name'] for c in events[0].payload['countries']] == ['Oneland', 'Twoland']
+
+
+def test_add_countries_rejects_an_invalid_batch_without_writing(db_session, monkeypatch):
+    import schema as s
+    from models import Country as CountryModel
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    result = schema.schema.execute(ADD_COUNTRIES, variable_values={'countries': [
+        {'name': 'Fine', 'alpha2Code': 'FI'},
+        {'name': ' ', 'alpha2Code': 'TOO'},
+    ]})
+    assert result.errors
+    message = str(result.errors[0])
+    assert 'countries[1].name' in message and 'countries[1].alpha2Code' in message
+    assert db_session.query(CountryModel).count() == 0
@@ -0,0 +1,67 @@
+import json
+
+import outbox
+import schema
+from models import Country as CountryModel, OutboxEvent
+
+ADD = 'mutation { addCountry(countryData: {name: "Outland", alpha2Code: "OU"}) { ok } }'
+
+
+def _channel(client):
+    pubsub = client.pubsub()
+    pubsub.subscribe('country_events')
+    pubsub.get_message(timeout=0.1)
+    return pubsub
+
+
+def test_add_country_writes_and_relays_its_event(db_session, monkeypatch, fake_event_redis):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    pubsub = _channel(fake_event_redis)
+
+    assert not schema.schema.execute(ADD).errors
+    event = db_session.query(OutboxEvent).one()
+    assert event.event == 'country_added' and event.sent_at is not None
+    message = json.loads(pubsub.get_message(timeout=0.1)['data'])
+    assert message == {'event': 'country_added', 'id': event.payload['id'], 'name': 'Outland'}
+
+
+def test_events_survive_a_redis_outage(db_session, monkeypatch, fake_event_redis):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    server = fake_event_redis.connection_pool.connection_kwargs['server']
+    server.connected = False
+
+    result = schema.schema.execute(ADD)
+    assert not result.errors and result.data['addCountry']['ok'] is True
+    event = db_session.query(OutboxEvent).one()
+    assert event.sent_at is None and event.attempts == 1 and event.last_error
+
+    # the relay task publishes it once Redis is back
+    server.connected = True
+    pubsub = _channel(fake_event_redis)
+    assert outbox.relay_all(db_session) == 1
+    assert json.loads(pubsub.get_message(timeout=0.1)['data'])['name'] == 'Outland'
+    assert outbox.pending_count(db_session) == 0
+
+
+def test_relay_sends_in_batches_and_in_order(db_session, fake_event_redis):
+    for i in range(5):
+        outbox.add_event(db_session, 'country_added', id=str(i), name=f'C{i}')
+    db_session.commit()
+    pubsub = _channel(fake_event_redis)
+
+    assert outbox.relay(db_session, batch_size=2) == 2
+    assert outbox.relay_all(db_session, batch_size=2) == 3
+    names = [json.loads(pubsub.get_message(timeout=0.1)['data'])['name'] for _ in range(5)]
+    assert names == ['C0', 'C1', 'C2', 'C3', 'C4']
+
+
+def test_a_failed_insert_leaves_no_event(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    db_session.add(CountryModel(name='Taken', alpha2_code='OU'))
+    db_session.commit()
+
+    assert schema.schema.execute(ADD).errors
+    assert db_session.query(OutboxEvent).count() == 0
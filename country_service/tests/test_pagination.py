@@ -0,0 +1,104 @@
+import pytest
+
+import cache
+from schema import schema
+from models import Country as CountryModel
+
+QUERY = '''query($first: Int, $after: String, $last: Int, $before: String) {
+    countriesConnection(first: $first, after: $after, last: $last, before: $before) {
+        edges { cursor node { name } }
+        pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+    }
+}'''
+
+
+def _page(**variables):
+    result = schema.execute(QUERY, variable_values=variables)
+    assert not result.errors, result.errors
+    conn = result.data['countriesConnection']
+    return [e['node']['name'] for e in conn['edges']], conn['pageInfo']
+
+
+@pytest.mark.parametrize('cache_enabled', [False, True])
+def test_keyset_pages_forward_and_backward(db_session, monkeypatch, cache_enabled):
+    # two rows share a name so the id tie-breaker is exercised
+    names = ['Alpha', 'Bravo', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot']
+    for i, name in enumerate(names):
+        db_session.add(CountryModel(name=name, alpha2_code='P%d' % i))
+    db_session.commit()
+
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', cache_enabled)
+
+    seen = []
+    after = None
+    while True:
+        page, info = _page(first=3, after=after)
+        seen.extend(page)
+        assert info['hasPreviousPage'] == (after is not None)
+        if not info['hasNextPage']:
+            break
+        after = info['endCursor']
+    assert seen == names
+
+    # `after` is now the cursor of 'Echo'; walk backwards from it
+    page, info = _page(last=2, before=after)
+    assert page == ['Charlie', 'Delta']
+    assert info['hasPreviousPage'] and info['hasNextPage']
+
+    page, info = _page(last=10)
+    assert page == names and not info['hasPreviousPage']
+
+
+def test_rows_inserted_before_cursor_do_not_shift_pages(db_session, monkeypatch):
+    for i, name in enumerate(['Bravo', 'Delta', 'Foxtrot']):
+        db_session.add(CountryModel(name=name, alpha2_code='Q%d' % i))
+    db_session.commit()
+
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+
+    page, info = _page(first=1)
+    assert page == ['Bravo']
+    db_session.add(CountryModel(name='Alpha', alpha2_code='Q9'))
+    db_session.commit()
+    page, _ = _page(first=1, after=info['endCursor'])
+    assert page == ['Delta']
+
+
+def test_invalid_cursor_is_rejected(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    result = schema.execute(QUERY, variable_values={'after': 'not-a-cursor'})
+    assert 'Invalid cursor' in str(result.errors[0])
+
+
+def test_snapshot_and_database_agree_on_order(db_session, monkeypatch):
+    # non-ASCII and duplicate names are where collations and missing tie-breakers differ
+    for i, name in enumerate(['Åland', 'Albania', 'Zambia', 'albania', 'Côte', 'Albania']):
+        db_session.add(CountryModel(name=name, alpha2_code='O%d' % i))
+    db_session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+    query = '{ countries(limit: 10) { id } }'
+    orders = []
+    for cache_enabled in (False, True):
+        monkeypatch.setattr(cache, 'CACHE_ENABLED', cache_enabled)
+        cache.invalidate()
+        orders.append([c['id'] for c in schema.execute(query).data['countries']])
+    assert orders[0] == orders[1]
+
+
+def test_postgres_orders_names_by_code_point():
+    from sqlalchemy.dialects import postgresql
+    from pagination import name_order
+
+    class PostgresSession:
+        def get_bind(self):
+            return type('Bind', (), {'dialect': postgresql.dialect()})()
+
+    compiled = str(name_order(PostgresSession()).compile(dialect=postgresql.dialect()))
+    assert compiled == 'countries.name COLLATE "C"'
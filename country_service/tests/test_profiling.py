@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from flask import Flask
+
+import profiling
+from graphql_view import CountryGraphQLView, CachedDocumentBackend, PersistedQueryStore
+from schema import schema
+from models import Country as CountryModel
+
+NEAR = '{ countriesNear(latitude: 10, longitude: 20, radiusKm: 500) { name } }'
+
+
+@pytest.fixture
+def client(db_session, engine, monkeypatch):
+    db_session.add(CountryModel(name='Profilia', alpha2_code='PF', latitude=10.0, longitude=20.0))
+    db_session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'sekrit')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', '')
+    profiling.instrument_engine(engine)
+
+    app = Flask(__name__)
+    app.add_url_rule('/graphql', view_func=CountryGraphQLView.as_view(
+        'graphql', schema=schema, backend=CachedDocumentBackend(), persisted_queries=PersistedQueryStore(url=None),
+    ))
+    return app.test_client()
+
+
+def test_profile_header_attaches_sql_explain_and_hot_functions(client):
+    resp = client.post('/graphql', json={'query': NEAR}, headers={'X-Profile': 'sekrit'})
+    body = resp.get_json()
+    assert body['data'] == {'countriesNear': [{'name': 'Profilia'}]}
+
+    profile = body['extensions']['profile']
+    assert profile['sql']['count'] >= 1
+    assert any('FROM countries' in s['sql'] for s in profile['sql']['statements'])
+    assert profile['explain'] and profile['explain'][0]['plan']
+    assert any('resolve_countries_near' in f['function'] for f in profile['service_functions'])
+    assert profile['functions'][0]['own_ms'] >= profile['functions'][-1]['own_ms']
+
+    # no header, or the wrong token: nothing is profiled or leaked
+    for headers in ({}, {'X-Profile': 'guess'}):
+        resp = client.post('/graphql', json={'query': NEAR}, headers=headers)
+        assert 'profile' not in resp.get_json()['extensions']
+
+
+def test_sampled_profiles_go_to_a_rotating_directory(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(profiling, 'PROFILE_KEEP', 2)
+
+    for _ in range(3):
+        resp = client.post('/graphql', json={'query': 'query Near ' + NEAR})
+        assert 'profile' not in resp.get_json()['extensions']
+
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 4
+    assert {name.rsplit('.', 1)[1] for name in files} == {'json', 'prof'}
+    assert all('-Near.' in name for name in files)
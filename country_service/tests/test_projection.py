@@ -0,0 +1,51 @@
+from sqlalchemy import event
+
+import cache
+from schema import schema
+from models import Country as CountryModel
+
+
+def _capture_sql(engine, query, **kwargs):
+    statements = []
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        result = schema.execute(query, **kwargs)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert not result.errors, result.errors
+    return result, statements
+
+
+def test_narrow_query_selects_only_requested_columns(db_session, engine, monkeypatch):
+    db_session.add(CountryModel(name='Narrowland', alpha2_code='NW', timezones=['UTC'], languages={'eng': 'English'}))
+    db_session.commit()
+    db_session.expunge_all()
+
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+
+    # same shape as CountriesList.jsx, through a fragment
+    result, statements = _capture_sql(engine, '''
+        query { countries(limit: 5) { ...Names } }
+        fragment Names on CountryType { name alpha2Code }
+    ''')
+    assert result.data == {'countries': [{'name': 'Narrowland', 'alpha2Code': 'NW'}]}
+    assert len(statements) == 1
+    sql = statements[0]
+    assert 'countries.name' in sql and 'countries.alpha2_code' in sql
+    for column in ('timezones', 'currencies', 'languages', 'capital', 'flag_url'):
+        assert 'countries.%s' % column not in sql
+
+    db_session.expunge_all()
+    result, statements = _capture_sql(engine, '''query {
+        countriesConnection(first: 1) { edges { node { languages } } }
+        country(alpha2Code: "NW") { timezones }
+    }''', context_value={})
+    assert result.data['countriesConnection']['edges'][0]['node']['languages'] == '{"eng": "English"}'
+    assert result.data['country']['timezones'] == '["UTC"]'
+    connection_sql, country_sql = statements[0], statements[-1]
+    assert 'countries.languages' in connection_sql and 'countries.timezones' not in connection_sql
+    assert 'countries.timezones' in country_sql and 'countries.languages' not in country_sql
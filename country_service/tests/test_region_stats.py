@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+import cache
+import region_stats
+from models import Country as CountryModel, RegionStat
+from schema import schema
+
+REGION_STATS = '''
+query($region: String) {
+    regionStats(region: $region) {
+        region countryCount population areaKm2 density
+        topCountries(limit: 2) { name alpha2Code population }
+        subregions { subregion countryCount population topCountries { name } }
+    }
+}
+'''
+
+
+def _add(db, name, alpha2_code, region, subregion, population, area_km2, source='external'):
+    db.add(CountryModel(name=name, alpha2_code=alpha2_code, region=region, subregion=subregion,
+                        population=population, area_km2=area_km2, source=source))
+
+
+@pytest.mark.parametrize('cached', [True, False])
+def test_region_stats_query_reads_the_summary(db_session, monkeypatch, cached):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', cached)
+    _add(db_session, 'Alpha', 'AA', 'Europe', 'Western Europe', 100, 10.0)
+    _add(db_session, 'Beta', 'BB', 'Europe', 'Northern Europe', 300, 20.0)
+    _add(db_session, 'Gamma', 'GG', 'Europe', 'Northern Europe', 200, 10.0)
+    _add(db_session, 'Nowhere', 'NW', None, None, None, None)
+    db_session.flush()
+    region_stats.refresh(db_session)
+    db_session.commit()
+
+    # the read path never looks at countries again
+    db_session.query(CountryModel).update({CountryModel.population: 0})
+    db_session.commit()
+
+    result = schema.execute(REGION_STATS)
+    assert not result.errors
+    unknown, europe = result.data['regionStats']
+    assert unknown == {
+        'region': None, 'countryCount': 1, 'population': 0.0, 'areaKm2': 0.0, 'density': None,
+        'topCountries': [], 'subregions': [{'subregion': None, 'countryCount': 1, 'population': 0.0, 'topCountries': []}],
+    }
+    assert (europe['region'], europe['countryCount'], europe['population'], europe['areaKm2']) == ('Europe', 3, 600, 40.0)
+    assert europe['density'] == 15.0
+    assert europe['topCountries'] == [
+        {'name': 'Beta', 'alpha2Code': 'BB', 'population': 300},
+        {'name': 'Gamma', 'alpha2Code': 'GG', 'population': 200},
+    ]
+    assert [(r['subregion'], r['countryCount'], r['population']) for r in europe['subregions']] == [
+        ('Northern Europe', 2, 500), ('Western Europe', 1, 100),
+    ]
+
+    only = schema.execute(REGION_STATS, variable_values={'region': 'europe'})
+    assert [r['region'] for r in only.data['regionStats']] == ['Europe']
+
+
+def test_top_countries_limit_is_bounded(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    _add(db_session, 'Alpha', 'AA', 'Europe', 'Western Europe', 100, 10.0)
+    db_session.flush()
+    region_stats.refresh(db_session)
+    db_session.commit()
+
+    result = schema.execute('{ regionStats { topCountries(limit: %d) { name } } }' % (region_stats.REGION_STATS_TOP + 1))
+    assert 'at most' in str(result.errors[0])
+
+
+def _summary(db):
+    return {
+        (row.region, row.subregion): (row.country_count, row.population)
+        for row in db.query(RegionStat)
+    }
+
+
+def test_add_country_refreshes_its_group(db_session, monkeypatch):
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+    _add(db_session, 'Alpha', 'AA', 'Europe', 'Western Europe', 100, 10.0)
+    db_session.flush()
+    region_stats.refresh(db_session)
+    db_session.commit()
+
+    result = schema.execute('''mutation { addCountry(countryData: {
+        name: "Newland", alpha2Code: "NL", region: "Europe", subregion: "Western Europe", population: 5
+    }) { ok } }''')
+    assert not result.errors
+    assert _summary(db_session) == {('Europe', 'Western Europe'): (2, 105)}
+
+    result = schema.execute('''mutation { addCountries(countries: [
+        {name: "Islandia", alpha2Code: "IS", region: "Oceania", population: 7}
+    ]) { ok } }''')
+    assert not result.errors
+    assert _summary(db_session) == {('Europe', 'Western Europe'): (2, 105), ('Oceania', ''): (1, 7)}
+
+
+def test_ingestion_refreshes_old_and_new_groups(db_session, monkeypatch):
+    import tasks
+    monkeypatch.setattr(tasks, 'get_db_session', lambda: db_session)
+    _add(db_session, 'Mover', 'MV', 'Europe', 'Western Europe', 10, 1.0)
+    _add(db_session, 'Stayer', 'ST', 'Asia', 'Eastern Asia', 20, 1.0)
+    _add(db_session, 'Hand Made', 'HM', 'Asia', 'Eastern Asia', 30, 1.0, source='manual')
+    db_session.flush()
+    region_stats.refresh(db_session)
+    db_session.commit()
+
+    payload = [
+        {'name': 'Mover', 'alpha2Code': 'MV', 'region': 'Africa', 'subregion': 'Eastern Africa', 'population': 11},
+        {'name': 'Hand Made', 'alpha2Code': 'HM', 'region': 'Europe', 'population': 99},
+    ]
+
+    class DummyResp:
+        status_code = 200
+        headers = {}
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size=1):
+            yield json.dumps(payload).encode()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    monkeypatch.setattr('tasks.requests.get', lambda *a, **k: DummyResp())
+    tasks.ingest_countries()
+
+    # Mover left Western Europe (now empty), manual rows stayed where they were
+    assert _summary(db_session) == {
+        ('Africa', 'Eastern Africa'): (1, 11),
+        ('Asia', 'Eastern Asia'): (2, 50),
+    }
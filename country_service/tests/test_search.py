@@ -0,0 +1,53 @@
+import pytest
+
+import cache
+from schema import schema
+from models import Country as CountryModel, normalize_name
+
+NAMES = ['Åland Islands', 'Albania', 'Algeria', 'United Kingdom', 'United States', 'Côte d\'Ivoire', 'Kingman Reef']
+
+QUERY = '''query($prefix: String!, $fuzzy: Boolean) {
+    searchCountries(prefix: $prefix, fuzzy: $fuzzy, limit: 5) { name }
+}'''
+
+
+@pytest.fixture
+def countries(db_session, monkeypatch):
+    for i, name in enumerate(NAMES):
+        db_session.add(CountryModel(name=name, alpha2_code='S%d' % i))
+    db_session.commit()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: db_session)
+
+
+def _search(prefix, fuzzy=False):
+    result = schema.execute(QUERY, variable_values={'prefix': prefix, 'fuzzy': fuzzy})
+    assert not result.errors, result.errors
+    return [c['name'] for c in result.data['searchCountries']]
+
+
+def test_normalize_name():
+    assert normalize_name('  Côte   D\'IVOIRE ') == "cote d'ivoire"
+    assert normalize_name('ÅLAND') == 'aland'
+
+
+@pytest.mark.parametrize('cache_enabled', [False, True])
+def test_country_lookup_ignores_case_and_accents(countries, monkeypatch, cache_enabled):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', cache_enabled)
+    result = schema.execute('query { country(name: "cote d\'ivoire") { alpha2Code } }')
+    assert result.data['country']['alpha2Code'] == 'S5'
+
+
+@pytest.mark.parametrize('cache_enabled', [False, True])
+def test_prefix_search_ranks_name_prefix_before_word_prefix(countries, monkeypatch, cache_enabled):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', cache_enabled)
+    assert _search('al') == ['Åland Islands', 'Albania', 'Algeria']
+    assert _search('King') == ['Kingman Reef', 'United Kingdom']
+    assert _search('united kingdom') == ['United Kingdom']
+    assert _search('%') == []
+
+
+def test_fuzzy_search_tolerates_typos(countries):
+    assert _search('Albnia') == []
+    assert _search('Albnia', fuzzy=True)[0] == 'Albania'
+    assert _search('untied states', fuzzy=True)[0] == 'United States'
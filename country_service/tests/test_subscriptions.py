@@ -0,0 +1,97 @@
+import time
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import events
+import subscriptions
+from database import create_async_db_engine
+from graphql_view import CachedDocumentBackend
+from models import Base
+from schema import schema
+
+
+@pytest.fixture(params=['pubsub'])
+def event_server(request, tmp_path, monkeypatch):
+    # a file DB so the mutation's session and the hub's aiosqlite engine see the same rows
+    path = tmp_path / 'countries.db'
+    engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    import schema as s
+    monkeypatch.setattr(s, 'get_db_session', lambda: session)
+
+    # publisher and hub share one fake Redis, so events really travel over pub/sub or the stream
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(events, 'EVENT_TRANSPORT', request.param)
+    monkeypatch.setattr(events, '_client', fakeredis.FakeRedis(server=server))
+    if request.param == 'stream':
+        # fakeredis only wakes a blocked XREAD on a stream that already existed
+        events._client.xadd(events.EVENT_STREAM, {'payload': '{}'})
+    monkeypatch.setattr(subscriptions.aioredis, 'from_url', lambda url: fakeredis.aioredis.FakeRedis(server=server))
+    hub = subscriptions.CountryEventHub(retry_delay=0.05, transport=request.param)
+    hub.configure(create_async_db_engine(f'sqlite+aiosqlite:///{path}'))
+    monkeypatch.setattr(subscriptions, 'hub', hub)
+
+    app = FastAPI()
+    app.add_api_websocket_route('/graphql', subscriptions.SubscriptionServer(schema, CachedDocumentBackend(), keepalive=0).handle)
+    yield TestClient(app), hub
+    session.close()
+    engine.dispose()
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def _start(ws, op_id, query):
+    ws.send_json({'type': 'start', 'id': op_id, 'payload': {'query': query}})
+
+
+def test_events_map_to_added_and_updated_countries():
+    assert subscriptions.targets({'event': 'country_added', 'id': 'a'}) == {'added': ['a'], 'updated': []}
+    assert subscriptions.targets({'event': 'countries_updated', 'countries': [
+        {'id': 'a', 'created': True}, {'id': 'b', 'created': False},
+    ]}) == {'added': ['a'], 'updated': ['b']}
+    assert subscriptions.targets({'event': 'something_else'}) == {'added': [], 'updated': []}
+
+
+@pytest.mark.parametrize('event_server', ['pubsub', 'stream'], indirect=True)
+def test_country_added_is_pushed_to_every_subscriber(event_server):
+    client, hub = event_server
+    with client.websocket_connect('/graphql', subprotocols=['graphql-ws']) as first, \
+            client.websocket_connect('/graphql', subprotocols=['graphql-ws']) as second:
+        for ws in (first, second):
+            ws.send_json({'type': 'connection_init'})
+            assert ws.receive_json() == {'type': 'connection_ack'}
+            _start(ws, '1', 'subscription { countryAdded { name alpha2Code } }')
+        _wait_for(lambda: hub.connected and len(hub.subjects['added'].observers) == 2)
+
+        result = schema.execute('mutation { addCountry(countryData: {name: "Pushland", alpha2Code: "PU"}) { ok } }')
+        assert not result.errors
+
+        expected = {'type': 'data', 'id': '1', 'payload': {'data': {'countryAdded': {'name': 'Pushland', 'alpha2Code': 'PU'}}}}
+        assert first.receive_json() == expected
+        assert second.receive_json() == expected
+
+        first.send_json({'type': 'stop', 'id': '1'})
+        assert first.receive_json() == {'type': 'complete', 'id': '1'}
+        _wait_for(lambda: len(hub.subjects['added'].observers) == 1)
+
+
+def test_only_subscriptions_are_served_over_websocket(event_server):
+    client, _ = event_server
+    with client.websocket_connect('/graphql', subprotocols=['graphql-ws']) as ws:
+        _start(ws, 'q', '{ countries { name } }')
+        message = ws.receive_json()
+        assert message['type'] == 'data'
+        assert 'Only subscriptions' in message['payload']['errors'][0]['message']
+        assert ws.receive_json() == {'type': 'complete', 'id': 'q'}
@@ -1,6 +1,8 @@
 """
 Notifier service - FastAPI app that listens on Redis pub/sub channel `country_events`
-and sends email notifications to admin emails when a 'country_added' event occurs.
+(or, with EVENT_TRANSPORT=stream, reads the `country_events:stream` stream through
+a consumer group) and sends email notifications to admin emails when a
+'country_added' event occurs (or a single summary email for a 'countries_added' batch).
 
 Environment variables used (read from root .env when running in docker-compose):
 - REDIS_URL
@@ -10,6 +12,7 @@ Environment variables used (read from root .env when running in docker-compose):
 - EMAIL_SMTP_USER
 - EMAIL_SMTP_PASS
 - ADMIN_EMAILS (comma separated)
+- EVENT_TRANSPORT (pubsub | stream)
 """
 
 import os
@@ -18,13 +21,17 @@ import json
 import logging
 from typing import List, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from dotenv import load_dotenv
 
 # load .env if present (helps local dev)
 load_dotenv()
 
-from email_client import send_email_async
+import email_client
+from digest import DigestBuffer
+from workers import EventWorkerPool, EVENT_TIMEOUT
+from streams import StreamConsumer
 
 import redis.asyncio as aioredis
 
@@ -34,17 +41,63 @@ logger = logging.getLogger("notifier")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 ADMIN_EMAILS = os.getenv("ADMIN_EMAILS", "admin@usttask.example").split(",")
 CHANNEL = "country_events"
-
-
-async def handle_pubsub(channel_name: str, stop_event: asyncio.Event):
+# "pubsub" or "stream" (Redis Streams consumer group, see streams.py); a publisher
+# set to "both" pairs with "stream" here so no event is mailed twice
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "pubsub")
+
+
+def build_email(payload: dict) -> Optional[tuple]:
+    """(subject, body) for an event we notify about, or None to ignore it."""
+    event = payload.get("event")
+    if event == "country_added":
+        country_name = payload.get("name", "Unknown")
+        country_id = payload.get("id", "")
+        subject = f"[UST] Country added: {country_name}"
+        body = f"A country was added.\n\nName: {country_name}\nID: {country_id}\n\nThis is an automated notification."
+        return subject, body
+    if event == "countries_added":
+        # one email for a whole addCountries batch
+        countries = payload.get("countries") or []
+        count = payload.get("count", len(countries))
+        subject = f"[UST] {count} countries added"
+        lines = "\n".join(f"- {c.get('name', 'Unknown')} ({c.get('id', '')})" for c in countries)
+        body = f"{count} countries were added.\n\n{lines}\n\nThis is an automated notification."
+        return subject, body
+    return None
+
+
+def new_digest() -> DigestBuffer:
+    # looked up per send so the SMTP client can be swapped (e.g. in tests)
+    return DigestBuffer(lambda **kwargs: email_client.send_email_async(**kwargs), timeout=EVENT_TIMEOUT)
+
+
+def make_event_handler(digest: DigestBuffer):
+    async def handle_event(payload: dict):
+        email = build_email(payload)
+        if email is None:
+            return
+        subject, body = email
+        logger.info("Queueing email for %s: %s", payload.get("event"), subject)
+        # resolves once the email went out; the stream consumer acks the event only then
+        return await digest.add(subject, body, ADMIN_EMAILS)
+    return handle_event
+
+
+async def handle_pubsub(channel_name: str, stop_event: asyncio.Event, workers: Optional[EventWorkerPool] = None):
     """
-    Subscribe to Redis pubsub channel and process messages until stop_event is set.
+    Subscribe to Redis pubsub channel and hand decoded events to `workers` until stop_event is set.
+    Without a worker pool, a private one is started and drained before returning.
     """
     logger.info("Connecting to Redis at %s", REDIS_URL)
     redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
     pubsub = redis.pubsub()
     await pubsub.subscribe(channel_name)
     logger.info("Subscribed to channel: %s", channel_name)
+    digest = None
+    if workers is None:
+        digest = new_digest()
+        workers = EventWorkerPool(make_event_handler(digest))
+        workers.start()
 
     try:
         async for message in pubsub.listen():
@@ -61,23 +114,11 @@ async def handle_pubsub(channel_name: str, stop_event: asyncio.Event):
             except Exception:
                 logger.exception("Invalid JSON payload: %s", data)
                 continue
-
-            event = payload.get("event")
-            if event == "country_added":
-                country_name = payload.get("name", "Unknown")
-                country_id = payload.get("id", "")
-                subject = f"[UST] Country added: {country_name}"
-                body = f"A country was added.\n\nName: {country_name}\nID: {country_id}\n\nThis is an automated notification."
-                logger.info("Sending email for country_added: %s", country_name)
-                try:
-                    await send_email_async(
-                        subject=subject,
-                        body=body,
-                        to_emails=ADMIN_EMAILS,
-                    )
-                except Exception:
-                    logger.exception("Failed to send notification email for %s", country_name)
+            await workers.submit(payload)
     finally:
+        if digest is not None:
+            await workers.drain()
+            await digest.flush()
         try:
             await pubsub.unsubscribe(channel_name)
         except Exception:
@@ -94,20 +135,45 @@ from contextlib import asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
     app.state._stop_event = asyncio.Event()
-    app.state._pubsub_task = asyncio.create_task(handle_pubsub(CHANNEL, app.state._stop_event))
-    logger.info("Notifier background task started")
+    app.state._digest = new_digest()
+    handle_event = make_event_handler(app.state._digest)
+    consumer = None
+    if EVENT_TRANSPORT in ("stream", "both"):
+        consumer = StreamConsumer(handle_event)
+        app.state.workers = EventWorkerPool(consumer.handle_entry)
+        listener = consumer.run(app.state._stop_event, app.state.workers)
+    else:
+        app.state.workers = EventWorkerPool(handle_event)
+        listener = handle_pubsub(CHANNEL, app.state._stop_event, app.state.workers)
+    app.state.workers.start()
+    app.state._pubsub_task = asyncio.create_task(listener)
+    logger.info("Notifier background task started (%s transport)", EVENT_TRANSPORT)
     yield
-    # shutdown
+    # shutdown: stop reading, finish what was queued, send any pending digest
     logger.info("Shutting down notifier background task")
     app.state._stop_event.set()
     try:
         await asyncio.wait_for(app.state._pubsub_task, timeout=5.0)
     except Exception:
         app.state._pubsub_task.cancel()
+    await app.state.workers.drain()
+    await app.state._digest.flush()
+    if consumer is not None:
+        # acks for the emails the flush just sent
+        await consumer.close()
+    await email_client.close_pool()
 
 app = FastAPI(title="UST Notifier", lifespan=lifespan)
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "service": "notifier"}
+    workers = getattr(app.state, "workers", None)
+    digest = getattr(app.state, "_digest", None)
+    return {"status": "ok", "service": "notifier", "queue": workers.stats() if workers else None,
+            "email": digest.stats() if digest else None}
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
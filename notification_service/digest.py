@@ -0,0 +1,135 @@
+"""
+Coalesce notification emails that arrive close together.
+
+The first email for a recipient list opens a window of `EMAIL_DIGEST_WINDOW`
+seconds; everything queued for the same recipients during that window goes out
+as one digest email. A lone email is sent unchanged. `EMAIL_DIGEST_WINDOW=0`
+sends every email immediately.
+
+`add()` returns a future that resolves to True once the email (or the digest
+carrying it) went out, or to False if sending failed, so a caller can
+acknowledge the event behind it only then (see streams.py).
+
+Each send is bounded by `timeout` (NOTIFIER_EVENT_TIMEOUT in the app). The worker
+pool's timeout and latency only cover handing an event to this buffer, so the
+send side has its own counts and delivery latency (queued -> sent, window
+included) in `stats()` and the notifier_emails_* metrics.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from workers import LATENCY_BUCKETS, LATENCY_WINDOW, _percentile
+
+logger = logging.getLogger("digest")
+
+DIGEST_WINDOW = float(os.getenv("EMAIL_DIGEST_WINDOW", 2.0))
+# flush early once this many emails are waiting for one recipient list
+DIGEST_MAX_ITEMS = int(os.getenv("EMAIL_DIGEST_MAX_ITEMS", 50))
+
+SendFn = Callable[..., Awaitable]
+
+EMAILS = Counter("notifier_emails_total", "Emails by send outcome (one per event, digested or not)", ["outcome"])
+DELIVERY_SECONDS = Histogram("notifier_email_delivery_seconds", "Time from queueing an email to it being sent",
+                             buckets=LATENCY_BUCKETS)
+PENDING = Gauge("notifier_emails_pending", "Emails waiting in a digest window")
+
+
+def merge(items: List[Tuple[str, str]]) -> Tuple[str, str]:
+    """One (subject, body) for several; a single item is returned as-is."""
+    if len(items) == 1:
+        return items[0]
+    subject = f"[UST] {len(items)} notifications"
+    sections = [f"{item_subject}\n\n{item_body}" for item_subject, item_body in items]
+    return subject, ("\n\n" + "-" * 40 + "\n\n").join(sections)
+
+
+class DigestBuffer:
+    """Per-recipient-list buffer flushed by a timer, by size, or on shutdown."""
+
+    def __init__(self, send: SendFn, window: float = DIGEST_WINDOW, max_items: int = DIGEST_MAX_ITEMS,
+                 timeout: Optional[float] = None):
+        self.send = send
+        self.timeout = timeout or None
+        self.window = window
+        self.max_items = max_items
+        # (subject, body, future, queued at) per recipient list
+        self._pending: Dict[Tuple[str, ...], List[Tuple[str, str, asyncio.Future, float]]] = {}
+        self._timers: Dict[Tuple[str, ...], asyncio.Task] = {}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {"sent": 0, "failed": 0, "timed_out": 0}
+
+    async def add(self, subject: str, body: str, to_emails: List[str]) -> asyncio.Future:
+        """Queue one email; the returned future resolves to whether it was sent."""
+        key = tuple(to_emails)
+        sent = asyncio.get_running_loop().create_future()
+        item = (subject, body, sent, time.monotonic())
+        if self.window <= 0:
+            await self._send(key, [item])
+            return sent
+        items = self._pending.setdefault(key, [])
+        items.append(item)
+        PENDING.inc()
+        if len(items) >= self.max_items:
+            await self._flush_key(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.create_task(self._flush_later(key))
+        return sent
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        await self._flush_key(key)
+
+    async def _flush_key(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        items = self._pending.pop(key, None)
+        if items:
+            PENDING.dec(len(items))
+            await self._send(key, items)
+
+    async def _send(self, key, items):
+        subject, body = merge([(item_subject, item_body) for item_subject, item_body, _, _ in items])
+        outcome = "failed"
+        try:
+            await asyncio.wait_for(self.send(subject=subject, body=body, to_emails=list(key)), timeout=self.timeout)
+            outcome = "sent"
+        except asyncio.TimeoutError:
+            outcome = "timed_out"
+            logger.error("Sending notification email timed out after %ss: %s", self.timeout, subject)
+        except Exception:
+            logger.exception("Failed to send notification email: %s", subject)
+        finally:
+            now = time.monotonic()
+            for _, _, sent, queued_at in items:
+                self.counts[outcome] += 1
+                EMAILS.labels(outcome).inc()
+                if outcome == "sent":
+                    self._latencies.append(now - queued_at)
+                    DELIVERY_SECONDS.observe(now - queued_at)
+                if not sent.done():
+                    sent.set_result(outcome == "sent")
+        return outcome == "sent"
+
+    async def flush(self):
+        """Send everything still waiting (used on shutdown)."""
+        for key in list(self._pending):
+            await self._flush_key(key)
+
+    def stats(self) -> dict:
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)
+        latencies = sorted(self._latencies)
+        return {
+            "pending": sum(len(items) for items in self._pending.values()),
+            **self.counts,
+            "delivery_latency_ms": {"p50": ms(_percentile(latencies, 50)), "p95": ms(_percentile(latencies, 95)),
+                                    "max": ms(latencies[-1] if latencies else None)},
+        }
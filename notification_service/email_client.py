@@ -1,11 +1,13 @@
 import os
+import time
 from email.message import EmailMessage
 import asyncio
 import logging
-from typing import List
+from typing import List, Optional
 
 import aiosmtplib
 from dotenv import load_dotenv
+from prometheus_client import Counter, Histogram
 
 load_dotenv()
 logger = logging.getLogger("email_client")
@@ -15,11 +17,116 @@ SMTP_HOST = os.getenv("EMAIL_SMTP_HOST", "")
 SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", 587))
 SMTP_USER = os.getenv("EMAIL_SMTP_USER", "")
 SMTP_PASS = os.getenv("EMAIL_SMTP_PASS", "")
+# concurrent SMTP sessions kept open; idle sessions older than this are re-opened
+SMTP_POOL_SIZE = int(os.getenv("EMAIL_SMTP_POOL_SIZE", 2))
+SMTP_IDLE_TIMEOUT = float(os.getenv("EMAIL_SMTP_IDLE_TIMEOUT", 60))
+
+SEND_SECONDS = Histogram(
+    "notifier_email_send_seconds", "SMTP send time, including any reconnect", ["outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+SMTP_CONNECTS = Counter("notifier_smtp_connects_total", "SMTP sessions opened (TLS handshake and login)")
+
+# errors after which a pooled session is thrown away and the send retried once
+RECONNECT_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError, ConnectionError)
+
+
+class SMTPPool:
+    """
+    Long-lived, authenticated SMTP sessions shared by every send.
+
+    STARTTLS and login happen once per session instead of once per email. A
+    session that the server dropped (or that sat idle past `idle_timeout`) is
+    replaced transparently, and a send that fails on a dead session is retried
+    once on a fresh one.
+    """
+
+    def __init__(self, hostname: str = SMTP_HOST, port: int = SMTP_PORT, username: str = SMTP_USER,
+                 password: str = SMTP_PASS, size: int = SMTP_POOL_SIZE, idle_timeout: float = SMTP_IDLE_TIMEOUT):
+        self.hostname = hostname
+        self.port = port
+        self.username = username or None
+        self.password = password or None
+        self.idle_timeout = idle_timeout
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []  # [(client, last_used)]
+
+    async def _connect(self):
+        logger.info("Connecting to SMTP %s:%s as %s", self.hostname, self.port, self.username or "<anon>")
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            start_tls=True,
+        )
+        # connect() also runs STARTTLS and AUTH
+        await client.connect()
+        SMTP_CONNECTS.inc()
+        return client
+
+    async def _acquire(self):
+        while self._idle:
+            client, last_used = self._idle.pop()
+            if client.is_connected and time.monotonic() - last_used < self.idle_timeout:
+                return client
+            await self._discard(client)
+        return await self._connect()
+
+    @staticmethod
+    async def _discard(client):
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+    async def send(self, msg: EmailMessage):
+        async with self._slots:
+            client = await self._acquire()
+            try:
+                await client.send_message(msg)
+            except RECONNECT_ERRORS:
+                logger.warning("SMTP session lost; reconnecting", exc_info=True)
+                await self._discard(client)
+                client = await self._connect()
+                try:
+                    await client.send_message(msg)
+                except Exception:
+                    await self._discard(client)
+                    raise
+            except Exception:
+                # the session state is unknown after e.g. a rejected recipient
+                await self._discard(client)
+                raise
+            self._idle.append((client, time.monotonic()))
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for client, _ in idle:
+            await self._discard(client)
+
+
+_pool: Optional[SMTPPool] = None
+
+
+def get_pool() -> SMTPPool:
+    global _pool
+    if _pool is None:
+        _pool = SMTPPool()
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
 
 
 async def send_email_async(subject: str, body: str, to_emails: List[str]):
     """
-    Send a plain-text email asynchronously via SMTP.
+    Send a plain-text email asynchronously over a pooled SMTP session.
     Raises exception on failure.
     """
     if not SMTP_HOST:
@@ -33,15 +140,12 @@ async def send_email_async(subject: str, body: str, to_emails: List[str]):
     msg["Subject"] = subject
     msg.set_content(body)
 
-    logger.info("Connecting to SMTP %s:%s as %s", SMTP_HOST, SMTP_PORT, SMTP_USER or "<anon>")
-
-    await aiosmtplib.send(
-        msg,
-        hostname=SMTP_HOST,
-        port=SMTP_PORT,
-        username=SMTP_USER or None,
-        password=SMTP_PASS or None,
-        start_tls=True,
-    )
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        await get_pool().send(msg)
+        outcome = "sent"
+    finally:
+        SEND_SECONDS.labels(outcome).observe(time.perf_counter() - started)
     logger.info("Email sent: Subject=%s To=%s", subject, to_emails)
     return True
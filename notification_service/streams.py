@@ -0,0 +1,172 @@
+"""
+Redis Streams transport for country events (EVENT_TRANSPORT=stream).
+
+Every notifier replica joins the same consumer group, so each event in the
+stream is delivered to exactly one replica. An entry is acknowledged (XACK) only
+after its handler finished, and when the handler returns a future (the email's
+`DigestBuffer.add` future) only once that resolves to True, i.e. the email
+actually went out; entries left pending by a crashed or stuck replica
+are taken over with XAUTOCLAIM once they have been idle for STREAM_CLAIM_IDLE_MS.
+Entries that keep failing are moved to a dead-letter stream after
+STREAM_MAX_DELIVERIES attempts instead of being retried forever.
+"""
+
+import os
+import json
+import functools
+import time
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger("streams")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+STREAM = os.getenv("EVENT_STREAM", "country_events:stream")
+DEAD_LETTER_STREAM = os.getenv("EVENT_DEAD_LETTER_STREAM", f"{STREAM}:dead")
+GROUP = os.getenv("EVENT_STREAM_GROUP", "notifier")
+CONSUMER = os.getenv("NOTIFIER_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+BATCH = int(os.getenv("STREAM_BATCH", 32))
+BLOCK_MS = int(os.getenv("STREAM_BLOCK_MS", 2000))
+CLAIM_IDLE_MS = int(os.getenv("STREAM_CLAIM_IDLE_MS", 60000))
+MAX_DELIVERIES = int(os.getenv("STREAM_MAX_DELIVERIES", 5))
+
+
+async def ensure_group(redis, stream: str = STREAM, group: str = GROUP):
+    """Create the consumer group (and the stream) if they don't exist yet."""
+    try:
+        # "0" so a brand-new group also picks up events published before it existed
+        await redis.xgroup_create(stream, group, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+class StreamConsumer:
+    """
+    One consumer in `group`. `handle_entry` is the worker-pool handler for
+    (entry_id, fields) items; `run` reads entries and submits them to the pool.
+    """
+
+    def __init__(self, handle_event: Callable[[dict], Awaitable], redis=None, stream: str = STREAM,
+                 group: str = GROUP, consumer: str = CONSUMER):
+        self.handle_event = handle_event
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self._own_client = False
+        # read but not yet acked by this process; never submitted twice
+        self.in_flight = set()
+        # XACKs waiting to run for emails that went out
+        self._acks = set()
+
+    async def handle_entry(self, item):
+        entry_id, fields = item
+        deferred = False
+        try:
+            try:
+                payload = json.loads(fields.get("payload", ""))
+            except ValueError:
+                logger.error("Invalid JSON payload in %s: %s", entry_id, fields)
+            else:
+                # raising here leaves the entry pending, to be reclaimed and retried
+                sent = await self.handle_event(payload)
+                if sent is not None:
+                    sent.add_done_callback(functools.partial(self._settle, entry_id))
+                    deferred = True
+                    return
+            await self.redis.xack(self.stream, self.group, entry_id)
+        finally:
+            if not deferred:
+                self.in_flight.discard(entry_id)
+
+    def _settle(self, entry_id, sent):
+        """Ack `entry_id` once its email went out; a failed send leaves it pending for a retry."""
+        self.in_flight.discard(entry_id)
+        if sent.cancelled() or not sent.result():
+            logger.warning("Email for %s was not sent; leaving it pending", entry_id)
+            return
+        task = asyncio.get_running_loop().create_task(self.redis.xack(self.stream, self.group, entry_id))
+        self._acks.add(task)
+        task.add_done_callback(self._acks.discard)
+
+    async def close(self):
+        """Wait for outstanding acks, then close the Redis client if `run` opened it."""
+        if self._acks:
+            await asyncio.gather(*self._acks, return_exceptions=True)
+        if self._own_client and self.redis is not None:
+            try:
+                await self.redis.close()
+            except Exception:
+                pass
+            self.redis = None
+
+    async def _deliveries(self, ids):
+        """{entry id: times delivered} from XPENDING for the given pending entries."""
+        pending = await self.redis.xpending_range(self.stream, self.group, min=ids[0], max=ids[-1], count=len(ids) + BATCH)
+        return {p["message_id"]: p.get("times_delivered", 0) for p in pending}
+
+    async def _dead_letter(self, entries):
+        """Drop entries delivered too often into the dead-letter stream (acked); return the rest."""
+        if not entries:
+            return entries
+        deliveries = await self._deliveries([entry_id for entry_id, _ in entries])
+        live = []
+        for entry_id, fields in entries:
+            if deliveries.get(entry_id, 0) > MAX_DELIVERIES:
+                logger.error("Giving up on %s after %s deliveries", entry_id, deliveries[entry_id])
+                await self.redis.xadd(DEAD_LETTER_STREAM, dict(fields, source_id=entry_id))
+                await self.redis.xack(self.stream, self.group, entry_id)
+            else:
+                live.append((entry_id, fields))
+        return live
+
+    async def _submit(self, workers, entries):
+        for entry_id, fields in entries:
+            if fields is None or entry_id in self.in_flight:
+                # trimmed away by MAXLEN, or still waiting in our own queue
+                continue
+            self.in_flight.add(entry_id)
+            dropped = await workers.submit((entry_id, fields))
+            if dropped is not None:
+                # never reaches handle_entry; stays pending so XAUTOCLAIM can retry it
+                self.in_flight.discard(dropped[0])
+
+    async def run(self, stop_event: asyncio.Event, workers, once: bool = False):
+        """Reclaim and read entries until stop_event is set; `once` does a single round (for tests)."""
+        if self.redis is None:
+            self._own_client = True
+            self.redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+        await ensure_group(self.redis, self.stream, self.group)
+        logger.info("Consuming %s as %s/%s", self.stream, self.group, self.consumer)
+        claim_from = "0-0"
+        next_claim = 0.0
+        try:
+            while not stop_event.is_set():
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"}, count=BATCH, block=BLOCK_MS
+                )
+                for _, entries in response or []:
+                    await self._submit(workers, entries)
+
+                # take over entries another consumer read but never acknowledged;
+                # nothing can be claimable more often than every CLAIM_IDLE_MS
+                if time.monotonic() >= next_claim:
+                    claim_from, claimed, *_ = await self.redis.xautoclaim(
+                        self.stream, self.group, self.consumer,
+                        min_idle_time=CLAIM_IDLE_MS, start_id=claim_from, count=BATCH,
+                    )
+                    await self._submit(workers, await self._dead_letter([e for e in claimed if e[1] is not None]))
+                    if claim_from == "0-0":
+                        # scanned the whole pending list; wait before the next pass
+                        next_claim = time.monotonic() + CLAIM_IDLE_MS / 2000.0
+                if once:
+                    break
+        finally:
+            # the client stays open for acks of emails still in the digest; see close()
+            logger.info("Stream consumer stopped")
@@ -0,0 +1,108 @@
+import asyncio
+
+import aiosmtplib
+import pytest
+
+import email_client
+from digest import DigestBuffer, merge
+
+
+class FakeSMTP:
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.is_connected = False
+        self.sent = []
+        self.fail_next = False
+        FakeSMTP.instances.append(self)
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def send_message(self, msg):
+        if self.fail_next:
+            self.fail_next = False
+            self.is_connected = False
+            raise aiosmtplib.SMTPServerDisconnected("gone")
+        self.sent.append(msg["Subject"])
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+    FakeSMTP.instances = []
+    monkeypatch.setattr(aiosmtplib, "SMTP", FakeSMTP)
+    return FakeSMTP
+
+
+def _msg(subject):
+    msg = email_client.EmailMessage()
+    msg["Subject"] = subject
+    msg.set_content("body")
+    return msg
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_one_session(fake_smtp):
+    pool = email_client.SMTPPool(hostname="smtp.test", port=587, size=1)
+    for i in range(3):
+        await pool.send(_msg(f"m{i}"))
+    assert len(fake_smtp.instances) == 1
+    assert fake_smtp.instances[0].sent == ["m0", "m1", "m2"]
+    await pool.close()
+    assert not fake_smtp.instances[0].is_connected
+
+
+@pytest.mark.asyncio
+async def test_pool_reconnects_when_the_server_drops_the_session(fake_smtp):
+    pool = email_client.SMTPPool(hostname="smtp.test", port=587, size=1)
+    await pool.send(_msg("first"))
+    fake_smtp.instances[0].fail_next = True
+    await pool.send(_msg("second"))
+    assert len(fake_smtp.instances) == 2
+    assert fake_smtp.instances[1].sent == ["second"]
+
+
+@pytest.mark.asyncio
+async def test_digest_merges_emails_inside_the_window():
+    sent = []
+
+    async def send(subject, body, to_emails):
+        sent.append((subject, body, to_emails))
+
+    digest = DigestBuffer(send, window=0.05)
+    await digest.add("[UST] Country added: A", "a", ["admin@x"])
+    await digest.add("[UST] Country added: B", "b", ["admin@x"])
+    assert sent == []
+    await asyncio.sleep(0.1)
+    assert len(sent) == 1
+    subject, body, to = sent[0]
+    assert subject == "[UST] 2 notifications" and "Country added: B" in body and to == ["admin@x"]
+
+    await digest.add("[UST] Country added: C", "c", ["admin@x"])
+    await digest.flush()
+    assert sent[-1][0] == "[UST] Country added: C"
+
+
+@pytest.mark.asyncio
+async def test_digest_times_out_slow_sends_and_reports_them():
+    async def send(subject, body, to_emails):
+        if subject == "slow":
+            await asyncio.sleep(1)
+
+    digest = DigestBuffer(send, window=0, timeout=0.02)
+    assert (await digest.add("slow", "b", ["admin@x"])).result() is False
+    assert (await digest.add("fast", "b", ["admin@x"])).result() is True
+    stats = digest.stats()
+    assert stats["timed_out"] == 1 and stats["sent"] == 1 and stats["pending"] == 0
+    assert stats["delivery_latency_ms"]["max"] < 20
+
+
+def test_merge_leaves_a_single_email_alone():
+    assert merge([("s", "b")]) == ("s", "b")
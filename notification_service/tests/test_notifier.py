@@ -58,3 +58,15 @@ async def test_pubsub_message_triggers_email(monkeypatch):
 
     assert called["count"] == 1
     assert "Mockland" in called["last"]["subject"]
+
+
+def test_countries_added_batch_builds_one_summary_email():
+    from app import build_email
+    subject, body = build_email({
+        "event": "countries_added",
+        "count": 2,
+        "countries": [{"id": "a", "name": "Alpha"}, {"id": "b", "name": "Beta"}],
+    })
+    assert subject == "[UST] 2 countries added"
+    assert "Alpha" in body and "Beta" in body
+    assert build_email({"event": "something_else"}) is None
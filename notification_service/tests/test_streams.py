@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+import streams
+from streams import StreamConsumer
+from workers import EventWorkerPool
+
+STREAM = "test:events"
+
+
+def _entry(payload):
+    return {"payload": json.dumps(payload)}
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+async def _round(consumer, workers):
+    await consumer.run(asyncio.Event(), workers, once=True)
+    await workers.drain(timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_each_event_goes_to_one_consumer_in_the_group(redis, monkeypatch):
+    monkeypatch.setattr(streams, "BLOCK_MS", 10)
+    for i in range(6):
+        await redis.xadd(STREAM, _entry({"event": "country_added", "name": f"C{i}"}))
+
+    seen = {"a": [], "b": []}
+    pools = []
+    for name in ("a", "b"):
+        async def handle(payload, name=name):
+            seen[name].append(payload["name"])
+        consumer = StreamConsumer(handle, redis=redis, stream=STREAM, group="g", consumer=name)
+        monkeypatch.setattr(streams, "BATCH", 3)
+        workers = EventWorkerPool(consumer.handle_entry, workers=2, maxsize=10)
+        workers.start()
+        pools.append((consumer, workers))
+    for consumer, workers in pools:
+        await _round(consumer, workers)
+
+    assert sorted(seen["a"] + seen["b"]) == [f"C{i}" for i in range(6)]
+    assert len(seen["a"]) == 3 and len(seen["b"]) == 3
+    assert (await redis.xpending(STREAM, "g"))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_events_stay_pending_and_are_reclaimed(redis, monkeypatch):
+    monkeypatch.setattr(streams, "BLOCK_MS", 10)
+    monkeypatch.setattr(streams, "CLAIM_IDLE_MS", 0)
+    await redis.xadd(STREAM, _entry({"event": "country_added", "name": "Flaky"}))
+    attempts = []
+
+    async def flaky(payload):
+        attempts.append(payload["name"])
+        if len(attempts) == 1:
+            raise RuntimeError("smtp down")
+
+    first = StreamConsumer(flaky, redis=redis, stream=STREAM, group="g", consumer="first")
+    workers = EventWorkerPool(first.handle_entry, workers=1, maxsize=10)
+    workers.start()
+    await _round(first, workers)
+    assert (await redis.xpending(STREAM, "g"))["pending"] == 1
+
+    second = StreamConsumer(flaky, redis=redis, stream=STREAM, group="g", consumer="second")
+    workers = EventWorkerPool(second.handle_entry, workers=1, maxsize=10)
+    workers.start()
+    await _round(second, workers)
+    assert attempts == ["Flaky", "Flaky"]
+    assert (await redis.xpending(STREAM, "g"))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_poison_events_are_dead_lettered(redis, monkeypatch):
+    monkeypatch.setattr(streams, "BLOCK_MS", 10)
+    monkeypatch.setattr(streams, "CLAIM_IDLE_MS", 0)
+    monkeypatch.setattr(streams, "MAX_DELIVERIES", 1)
+    monkeypatch.setattr(streams, "DEAD_LETTER_STREAM", "test:dead")
+    await redis.xadd(STREAM, _entry({"event": "country_added", "name": "Poison"}))
+
+    async def always_fails(payload):
+        raise RuntimeError("bad event")
+
+    consumer = StreamConsumer(always_fails, redis=redis, stream=STREAM, group="g", consumer="c")
+    # fakeredis does not count deliveries in XPENDING; real Redis does
+    counts = {}
+
+    async def deliveries(ids):
+        for entry_id in ids:
+            counts[entry_id] = counts.get(entry_id, 1) + 1
+        return dict(counts)
+    monkeypatch.setattr(consumer, "_deliveries", deliveries)
+    for _ in range(3):
+        workers = EventWorkerPool(consumer.handle_entry, workers=1, maxsize=10)
+        workers.start()
+        await _round(consumer, workers)
+    assert (await redis.xpending(STREAM, "g"))["pending"] == 0
+    assert await redis.xlen("test:dead") == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_are_acked_only_after_their_email_went_out(redis, monkeypatch):
+    from digest import DigestBuffer
+    monkeypatch.setattr(streams, "BLOCK_MS", 10)
+    # fakeredis returns nothing from a blocking XREADGROUP that cannot fill a whole batch
+    monkeypatch.setattr(streams, "BATCH", 2)
+    await redis.xadd(STREAM, _entry({"event": "country_added", "name": "Sent"}))
+    await redis.xadd(STREAM, _entry({"event": "country_added", "name": "Bounced"}))
+    outcomes = {"Sent": True, "Bounced": False}
+
+    async def send(subject, body, to_emails):
+        if not outcomes[subject]:
+            raise RuntimeError("smtp down")
+
+    digest = DigestBuffer(send, window=0.05)
+
+    async def handle(payload):
+        return await digest.add(payload["name"], "body", [payload["name"]])
+
+    consumer = StreamConsumer(handle, redis=redis, stream=STREAM, group="g", consumer="c")
+    workers = EventWorkerPool(consumer.handle_entry, workers=1, maxsize=10)
+    workers.start()
+    await _round(consumer, workers)
+    # both emails are still waiting in the digest window
+    assert (await redis.xpending(STREAM, "g"))["pending"] == 2
+    await asyncio.sleep(0.1)
+    await consumer.close()
+    pending = await redis.xpending_range(STREAM, "g", min="-", max="+", count=10)
+    assert len(pending) == 1 and not consumer.in_flight
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("overflow, kept", [("drop_newest", 0), ("drop_oldest", 2)])
+async def test_entries_dropped_by_a_full_queue_are_not_left_in_flight(redis, monkeypatch, overflow, kept):
+    monkeypatch.setattr(streams, "BLOCK_MS", 10)
+    monkeypatch.setattr(streams, "BATCH", 3)
+    ids = [await redis.xadd(STREAM, _entry({"event": "country_added", "name": f"C{i}"})) for i in range(3)]
+    consumer = StreamConsumer(lambda payload: asyncio.sleep(0), redis=redis, stream=STREAM, group="g", consumer="c")
+    # not started, so the one-slot queue overflows
+    workers = EventWorkerPool(consumer.handle_entry, workers=1, maxsize=1, overflow=overflow)
+    await consumer.run(asyncio.Event(), workers, once=True)
+    assert consumer.in_flight == {ids[kept]}
+    assert workers.counts["dropped"] == 2
+
+    # the dropped entries are still pending and get submitted again once reclaimed
+    workers.start()
+    await workers.drain(timeout=1)
+    monkeypatch.setattr(streams, "CLAIM_IDLE_MS", 0)
+    workers = EventWorkerPool(consumer.handle_entry, workers=1, maxsize=10, overflow=overflow)
+    workers.start()
+    await _round(consumer, workers)
+    assert (await redis.xpending(STREAM, "g"))["pending"] == 0 and not consumer.in_flight
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from workers import EventWorkerPool
+
+
+@pytest.mark.asyncio
+async def test_handlers_run_concurrently_and_drain_on_shutdown():
+    done = []
+
+    async def slow(event):
+        await asyncio.sleep(0.05)
+        done.append(event)
+
+    pool = EventWorkerPool(slow, workers=4, maxsize=10)
+    pool.start()
+    started = asyncio.get_running_loop().time()
+    for i in range(4):
+        await pool.submit(i)
+    await pool.drain(timeout=1)
+    # four 50ms events on four workers take about 50ms, not 200ms
+    assert asyncio.get_running_loop().time() - started < 0.15
+    assert sorted(done) == [0, 1, 2, 3]
+    stats = pool.stats()
+    assert stats["processed"] == 4 and stats["depth"] == 0 and stats["workers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_events_time_out_without_stopping_the_pool():
+    async def handler(event):
+        if event == "slow":
+            await asyncio.sleep(1)
+
+    pool = EventWorkerPool(handler, workers=1, maxsize=10, timeout=0.02)
+    pool.start()
+    await pool.submit("slow")
+    await pool.submit("fast")
+    await pool.drain(timeout=1)
+    assert pool.counts["timed_out"] == 1 and pool.counts["processed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_the_newest_events():
+    pool = EventWorkerPool(lambda event: asyncio.sleep(0), workers=1, maxsize=2, overflow="drop_oldest")
+    for i in range(4):
+        await pool.submit(i)
+    assert [event for _, event in pool.queue._queue] == [2, 3]
+    assert pool.stats()["dropped"] == 2
+
+
+def test_health_reports_queue_stats():
+    from fastapi.testclient import TestClient
+    import app as notifier
+
+    with TestClient(notifier.app) as client:
+        body = client.get("/health").json()
+    assert body["status"] == "ok"
+    assert body["queue"]["capacity"] > 0
+    assert body["email"]["pending"] == 0
+
+
+def test_metrics_endpoint_exposes_queue_and_email_metrics():
+    from fastapi.testclient import TestClient
+    import app as notifier
+
+    body = TestClient(notifier.app).get("/metrics").text
+    assert "notifier_queue_depth" in body
+    assert "notifier_email_send_seconds" in body
+    assert "notifier_email_delivery_seconds" in body
@@ -0,0 +1,148 @@
+"""
+Bounded event queue served by a fixed number of handler tasks.
+
+The Redis listener only decodes messages and hands them to `EventWorkerPool.submit`,
+so a slow SMTP server delays emails instead of stalling the subscriber (Redis
+drops pub/sub messages for clients that stop reading). When the queue is full,
+`NOTIFIER_QUEUE_OVERFLOW` decides what gives:
+- "block": the listener waits for room (nothing is dropped here, but Redis may drop);
+- "drop_oldest": the oldest queued event is discarded to make room;
+- "drop_newest": the incoming event is discarded.
+
+`NOTIFIER_EVENT_TIMEOUT` and the handler latency here cover one handler call,
+which for the notifier is building the email and handing it to the DigestBuffer;
+the email goes out later, within the digest window. The buffer bounds each SMTP
+send with the same timeout and reports send outcomes and delivery latency itself
+(see digest.py).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("workers")
+
+WORKERS = int(os.getenv("NOTIFIER_WORKERS", 4))
+QUEUE_SIZE = int(os.getenv("NOTIFIER_QUEUE_SIZE", 1000))
+QUEUE_OVERFLOW = os.getenv("NOTIFIER_QUEUE_OVERFLOW", "block")
+EVENT_TIMEOUT = float(os.getenv("NOTIFIER_EVENT_TIMEOUT", 30))
+DRAIN_TIMEOUT = float(os.getenv("NOTIFIER_DRAIN_TIMEOUT", 10))
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+# latencies kept for the percentiles reported on /health
+LATENCY_WINDOW = 1000
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUEUE_DEPTH = Gauge("notifier_queue_depth", "Events waiting for a handler")
+QUEUE_WAIT_SECONDS = Histogram("notifier_queue_wait_seconds", "Time an event spent queued (lag)", buckets=LATENCY_BUCKETS)
+HANDLER_SECONDS = Histogram("notifier_handler_duration_seconds", "Event handler time", buckets=LATENCY_BUCKETS)
+EVENTS = Counter("notifier_events_total", "Events by outcome", ["outcome"])
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))]
+
+
+class EventWorkerPool:
+    """`workers` tasks pulling (enqueued_at, event) items off a bounded asyncio.Queue."""
+
+    def __init__(self, handler: Callable[[Any], Awaitable], workers: int = WORKERS, maxsize: int = QUEUE_SIZE,
+                 overflow: str = QUEUE_OVERFLOW, timeout: Optional[float] = EVENT_TIMEOUT):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, not {overflow!r}")
+        self.handler = handler
+        self.workers = workers
+        self.overflow = overflow
+        self.timeout = timeout or None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._waits = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {"processed": 0, "failed": 0, "timed_out": 0, "dropped": 0}
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(i)) for i in range(self.workers)]
+
+    async def submit(self, event):
+        """Queue `event`; returns the event the overflow policy dropped (this one or the oldest), if any."""
+        item = (time.monotonic(), event)
+        if self.overflow == "block":
+            await self.queue.put(item)
+            QUEUE_DEPTH.set(self.queue.qsize())
+            return None
+        dropped = None
+        if self.queue.full():
+            self._count("dropped")
+            if self.overflow == "drop_newest":
+                logger.warning("Event queue full; dropping incoming event")
+                return event
+            try:
+                _, dropped = self.queue.get_nowait()
+                self.queue.task_done()
+                logger.warning("Event queue full; dropped oldest event")
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(item)
+        QUEUE_DEPTH.set(self.queue.qsize())
+        return dropped
+
+    async def _run(self, n):
+        while True:
+            enqueued_at, event = await self.queue.get()
+            QUEUE_DEPTH.set(self.queue.qsize())
+            started = time.monotonic()
+            self._waits.append(started - enqueued_at)
+            QUEUE_WAIT_SECONDS.observe(started - enqueued_at)
+            try:
+                await asyncio.wait_for(self.handler(event), timeout=self.timeout)
+                self._count("processed")
+            except asyncio.TimeoutError:
+                self._count("timed_out")
+                logger.error("Event handler timed out after %ss", self.timeout)
+            except Exception:
+                self._count("failed")
+                logger.exception("Event handler failed")
+            finally:
+                elapsed = time.monotonic() - started
+                self._latencies.append(elapsed)
+                HANDLER_SECONDS.observe(elapsed)
+                self.queue.task_done()
+
+    def _count(self, outcome):
+        self.counts[outcome] += 1
+        EVENTS.labels(outcome).inc()
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Let the workers finish what is queued (up to `timeout` seconds), then stop them."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Shutdown with %d events still queued", self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)
+        latencies = sorted(self._latencies)
+        waits = sorted(self._waits)
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "workers": len(self._tasks),
+            "overflow": self.overflow,
+            **self.counts,
+            "handler_latency_ms": {"p50": ms(_percentile(latencies, 50)), "p95": ms(_percentile(latencies, 95)),
+                                   "max": ms(latencies[-1] if latencies else None)},
+            "queue_wait_ms": {"p50": ms(_percentile(waits, 50)), "p95": ms(_percentile(waits, 95)),
+                              "max": ms(waits[-1] if waits else None)},
+        }